@@ -1,12 +1,26 @@
 # app/__init__.py
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config
 from .extensions import db, migrate, jwt, mail
+from .commands import register_commands
+from .utils import analytics, changelog, clusters, search
+from .utils.derivatives import init_derivatives
+from .utils.heatmap import TileCache
+from .utils.leaderboard import init_leaderboard
+from .utils.mail_queue import init_mail_queue
+from .utils.notifications import init_notifications
+from .utils.pubsub import init_hub
+from .utils.ratelimit import init_rate_limits
+from .utils.security import init_user_loader
+from .utils.storage import init_storage
+from .utils.uploads import init_uploads
 
 # Import Blueprints
 from .routes.auth import auth_bp
 from .routes.incidents import incidents_bp
 from .routes.media import media_bp
+from .routes.files import files_bp
 from .routes.comments import comments_bp
 from .routes.admin import admin_bp
 from .routes.users import users_bp
@@ -16,21 +30,46 @@ from .routes.migrate import migrate_bp
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if app.config.get("PROXY_FIX_X_FOR"):
+        # Trust X-Forwarded-For from exactly this many proxies (rate limits key on remote_addr)
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
 
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    init_user_loader(app, jwt)
+    init_rate_limits(app)
     mail.init_app(app)
+    init_mail_queue(app)
+    init_notifications(app)
+    init_uploads(app)
+    init_storage(app)
+    init_derivatives(app)
+
+    # Live event hub (in-process, or Postgres LISTEN/NOTIFY across workers)
+    init_hub(app)
+    app.extensions["heatmap_cache"] = TileCache(app.config.get("HEATMAP_CACHE_SIZE", 2048),
+                                                app.config.get("HEATMAP_CACHE_TTL", 300))
+    init_leaderboard(app)
+
+    # Write-time aggregate maintenance
+    clusters.register_listeners()
+    changelog.register_listeners()
+    search.register_listeners()
+    analytics.register_listeners()
 
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(incidents_bp)
     app.register_blueprint(media_bp)
+    app.register_blueprint(files_bp)
     app.register_blueprint(comments_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(migrate_bp)
 
+    # CLI commands
+    register_commands(app)
 
     return app
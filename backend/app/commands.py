@@ -0,0 +1,145 @@
+# app/commands.py
+import time
+from datetime import datetime, timedelta
+import click
+from app.extensions import db
+from app.models import Incident, MediaBlob
+from app.utils.analytics import rebuild_analytics
+from app.utils.changelog import prune_changes
+from app.utils.clusters import rebuild_clusters
+from app.utils.derivatives import process_derivatives
+from app.utils.geo import geohash_encode
+from app.utils.mail_queue import deliver_pending, requeue_dead
+from app.utils.passwords import configured_method, hash_password, verify_password
+from app.utils.points import compact_ledger, reconcile_ledger
+from app.utils.search import rebuild_search_index
+from app.utils.storage import collect_blobs
+from app.utils.uploads import expire_uploads
+
+
+def register_commands(app):
+    @app.cli.command("backfill-geohash")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def backfill_geohash(batch_size):
+        """Fill Incident.geohash for rows created before the column existed."""
+        updated = 0
+        while True:
+            rows = Incident.query.filter(Incident.geohash.is_(None)).limit(batch_size).all()
+            if not rows:
+                break
+            for incident in rows:
+                incident.geohash = geohash_encode(incident.latitude, incident.longitude)
+            db.session.commit()
+            updated += len(rows)
+        click.echo(f"Backfilled {updated} incidents")
+
+    @app.cli.command("rebuild-clusters")
+    def rebuild_clusters_command():
+        """Recompute the map cluster aggregates from the incident table."""
+        cells = rebuild_clusters(db.session)
+        click.echo(f"Rebuilt {cells} cluster cells")
+
+    @app.cli.command("prune-changes")
+    @click.option("--days", default=30, show_default=True)
+    def prune_changes_command(days):
+        """Drop sync-feed log entries older than --days."""
+        deleted = prune_changes(db.session, datetime.utcnow() - timedelta(days=days))
+        click.echo(f"Pruned {deleted} change log entries")
+
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        """Re-index every incident for full-text search."""
+        indexed = rebuild_search_index(db.session)
+        click.echo(f"Indexed {indexed} incidents")
+
+    @app.cli.command("rebuild-analytics")
+    def rebuild_analytics_command():
+        """Recompute the daily incident and resolution rollups."""
+        rows = rebuild_analytics(db.session)
+        click.echo(f"Rebuilt {rows} daily status rows")
+
+    @app.cli.command("bench-login")
+    @click.option("--method", "-m", "methods", multiple=True,
+                  help="Hash method to measure (repeatable). Defaults to PASSWORD_HASH_METHOD.")
+    @click.option("--seconds", default=3.0, show_default=True, help="Measuring time per method.")
+    def bench_login(methods, seconds):
+        """Report password verifications (logins) per second on one core."""
+        for method in methods or (configured_method(),):
+            stored = hash_password("benchmark-password", method=method)
+            count = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                verify_password(stored, "benchmark-password")
+                count += 1
+            elapsed = time.perf_counter() - start
+            click.echo(f"{method}: {count / elapsed:.1f} logins/s per core, "
+                       f"{elapsed / count * 1000:.1f} ms per login")
+
+    @app.cli.command("compact-ledger")
+    @click.option("--days", default=90, show_default=True, help="Fold entries older than this.")
+    def compact_ledger_command(days):
+        """Fold old points ledger entries into one entry per user."""
+        folded = compact_ledger(db.session, datetime.utcnow() - timedelta(days=days))
+        click.echo(f"Compacted {folded} ledger entries")
+
+    @app.cli.command("reconcile-ledger")
+    @click.option("--fix", is_flag=True, help="Append adjustment entries for mismatches.")
+    def reconcile_ledger_command(fix):
+        """Check every points balance against its ledger."""
+        mismatches = reconcile_ledger(db.session, fix=fix)
+        for user_id, balance, ledger_sum in mismatches[:50]:
+            click.echo(f"user {user_id}: balance {balance}, ledger {ledger_sum}")
+        click.echo(f"{len(mismatches)} mismatched balances" + (" fixed" if fix and mismatches else ""))
+
+    @app.cli.command("deliver-mail")
+    def deliver_mail_command():
+        """Drain the outbound mail queue once (for deployments without the in-process worker)."""
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_pending()
+            if not sent and not failed:
+                break
+            total_sent += sent
+            total_failed += failed
+        click.echo(f"Sent {total_sent} messages, {total_failed} failed")
+
+    @app.cli.command("requeue-dead-mail")
+    @click.argument("ids", nargs=-1, type=int)
+    def requeue_dead_mail_command(ids):
+        """Retry dead-lettered messages (all of them, or the given ids)."""
+        click.echo(f"Requeued {requeue_dead(ids)} messages")
+
+    @app.cli.command("expire-uploads")
+    def expire_uploads_command():
+        """Delete resumable uploads whose last chunk is older than UPLOAD_EXPIRY_SECONDS."""
+        total = 0
+        while True:
+            removed = expire_uploads()
+            if not removed:
+                break
+            total += removed
+        click.echo(f"Removed {total} expired uploads")
+
+    @app.cli.command("gc-media")
+    def gc_media_command():
+        """Delete stored media blobs no Media row references any more."""
+        total = 0
+        while True:
+            removed = collect_blobs()
+            if not removed:
+                break
+            total += removed
+        click.echo(f"Removed {total} unreferenced blobs")
+
+    @app.cli.command("rebuild-derivatives")
+    @click.option("--all", "rebuild_all", is_flag=True, help="Redo every blob, not just failed ones.")
+    def rebuild_derivatives_command(rebuild_all):
+        """Re-render media thumbnails and poster frames in the foreground."""
+        query = MediaBlob.query
+        if not rebuild_all:
+            query = query.filter(MediaBlob.derivatives_status.in_(("failed", "unsupported")))
+        reset = query.update({"derivatives_status": "pending", "locked_until": None}, synchronize_session=False)
+        db.session.commit()
+        while process_derivatives():
+            pass
+        click.echo(f"Rebuilt derivatives for {reset} blobs")
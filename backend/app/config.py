@@ -24,4 +24,121 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret")
 
+    # Password hashing (werkzeug method string), e.g. "scrypt:32768:8:1" or
+    # "pbkdf2:sha256:600000". Hashes made with other settings are upgraded on
+    # the next successful login. Tune with `flask bench-login`.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+
+    # Delta sync feed (GET /api/v1/incidents/changes): the token waits this
+    # long at a missing change id for the transaction holding it to commit
+    SYNC_COMMIT_LAG_SECONDS = int(os.environ.get("SYNC_COMMIT_LAG_SECONDS", 60))
+
+    # Live event hub: "memory" (single process) or "postgres" (LISTEN/NOTIFY).
+    # Defaults to postgres when DATABASE_URL points at Postgres. Every open
+    # stream holds one of the worker's threads (see Procfile), so each worker
+    # serves at most SSE_MAX_CONNECTIONS streams and answers 503 beyond that.
+    EVENT_HUB = os.environ.get("EVENT_HUB")
+    SSE_MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", 16))
+
+    # Near-duplicate detection on POST /api/v1/incidents/
+    DUPLICATE_RADIUS_M = int(os.environ.get("DUPLICATE_RADIUS_M", 300))
+    DUPLICATE_WINDOW_MINUTES = int(os.environ.get("DUPLICATE_WINDOW_MINUTES", 60))
+    DUPLICATE_MIN_SIMILARITY = float(os.environ.get("DUPLICATE_MIN_SIMILARITY", 0.3))
+
+    # Heatmap tiles kept per worker process (LRU), each for at most HEATMAP_CACHE_TTL seconds
+    HEATMAP_CACHE_SIZE = int(os.environ.get("HEATMAP_CACHE_SIZE", 2048))
+    HEATMAP_CACHE_TTL = int(os.environ.get("HEATMAP_CACHE_TTL", 300))
+
+    # Per-process cache of the authenticated user (see app/utils/security.py)
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+
+    # Seconds between checks of the token revocation table, per process
+    REVOCATION_REFRESH_SECONDS = int(os.environ.get("REVOCATION_REFRESH_SECONDS", 15))
+
+    # How often each worker catches up on points changed by other workers, and
+    # how far behind its last seen updated_at it re-reads (commits land late)
+    LEADERBOARD_SYNC_SECONDS = int(os.environ.get("LEADERBOARD_SYNC_SECONDS", 2))
+    LEADERBOARD_SYNC_LAG_SECONDS = int(os.environ.get("LEADERBOARD_SYNC_LAG_SECONDS", 60))
+
+    # Token-bucket rate limits, checked before the view runs. Keys are an
+    # endpoint ("auth_bp.login", all methods) or a blueprint ("incidents",
+    # write methods only); values are "ip|account|account_ip:count/second|minute|hour|day".
+    # Client addresses come from X-Forwarded-For only when PROXY_FIX_X_FOR
+    # (the number of trusted proxies in front of the app) is set.
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() == "true"
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "memory")   # or "database"
+    RATELIMIT_PRUNE_SECONDS = int(os.environ.get("RATELIMIT_PRUNE_SECONDS", 3600))
+    PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 0))
+    RATELIMITS = {
+        "auth_bp.login": ["ip:20/minute", "account_ip:5/minute"],
+        "auth_bp.signup": ["ip:5/minute"],
+        "auth_bp.password_reset_request": ["ip:5/hour", "account:3/hour"],
+        "incidents": ["account:60/minute"],
+        "comments_bp": ["account:30/minute"],
+        "media_bp.upload_media": ["account:20/minute"],
+        "media_bp.create_upload": ["account:20/minute"],
+    }
+
+    # Outbound mail is queued in the request and sent by a background worker
+    # in batches over one SMTP connection, retrying with exponential backoff
+    MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 50))
+    MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 6))
+    MAIL_RETRY_BASE_SECONDS = int(os.environ.get("MAIL_RETRY_BASE_SECONDS", 30))
+    MAIL_RETRY_MAX_SECONDS = int(os.environ.get("MAIL_RETRY_MAX_SECONDS", 3600))
+    MAIL_POLL_SECONDS = int(os.environ.get("MAIL_POLL_SECONDS", 30))
+    MAIL_LEASE_SECONDS = int(os.environ.get("MAIL_LEASE_SECONDS", 300))
+
+    # Area subscription alerts for new incidents, fanned out in batches by a
+    # background worker. Backends: email "queue"/"memory", SMS "console"/"memory"/"http"
+    NOTIFY_EMAIL_BACKEND = os.environ.get("NOTIFY_EMAIL_BACKEND", "queue")
+    NOTIFY_SMS_BACKEND = os.environ.get("NOTIFY_SMS_BACKEND", "console")
+    NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", 500))
+    NOTIFY_MAX_RADIUS_M = float(os.environ.get("NOTIFY_MAX_RADIUS_M", 50000))
+    NOTIFY_MAX_SUBSCRIPTIONS = int(os.environ.get("NOTIFY_MAX_SUBSCRIPTIONS", 20))
+    NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 5))
+    NOTIFY_LEASE_SECONDS = int(os.environ.get("NOTIFY_LEASE_SECONDS", 300))
+    SMS_GATEWAY_URL = os.environ.get("SMS_GATEWAY_URL")
+    SMS_GATEWAY_USERNAME = os.environ.get("SMS_GATEWAY_USERNAME")
+    SMS_GATEWAY_API_KEY = os.environ.get("SMS_GATEWAY_API_KEY")
+    SMS_SENDER_ID = os.environ.get("SMS_SENDER_ID")
+
+    # Resumable media uploads: partial files expire this long after their last chunk
+    UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 500 * 1024 * 1024))
+    UPLOAD_MAX_CHUNK_BYTES = int(os.environ.get("UPLOAD_MAX_CHUNK_BYTES", 8 * 1024 * 1024))
+    UPLOAD_EXPIRY_SECONDS = int(os.environ.get("UPLOAD_EXPIRY_SECONDS", 86400))
+    UPLOAD_CHUNK_LEASE_SECONDS = int(os.environ.get("UPLOAD_CHUNK_LEASE_SECONDS", 300))
+    UPLOAD_PARTIAL_DIR = os.environ.get("UPLOAD_PARTIAL_DIR")
+
+    # Media blobs are stored once per content hash, sharded as ab/cd/<sha256>.
+    # MEDIA_STORAGE is "local" (MEDIA_ROOT, default app/uploads) or "s3"
+    # (any S3-compatible endpoint; needs boto3)
+    MEDIA_STORAGE = os.environ.get("MEDIA_STORAGE", "local")
+    MEDIA_ROOT = os.environ.get("MEDIA_ROOT")
+    MEDIA_S3_BUCKET = os.environ.get("MEDIA_S3_BUCKET")
+    MEDIA_S3_PREFIX = os.environ.get("MEDIA_S3_PREFIX", "media/")
+    MEDIA_S3_ENDPOINT_URL = os.environ.get("MEDIA_S3_ENDPOINT_URL")
+    MEDIA_S3_PUBLIC_URL = os.environ.get("MEDIA_S3_PUBLIC_URL")
+
+    # Thumbnails (WebP + JPEG per size) and video poster frames, rendered after
+    # upload in a process pool under MEDIA_DERIVATIVES_ROOT and then stored
+    # with the blob backend (for s3 that directory is only scratch space).
+    # A batch gives up on renders still running after MEDIA_DERIVATIVE_TIMEOUT_SECONDS,
+    # which must stay below the lease that keeps other workers off the batch
+    MEDIA_DERIVATIVES_ROOT = os.environ.get("MEDIA_DERIVATIVES_ROOT")
+    MEDIA_THUMBNAIL_SIZES = tuple(int(s) for s in os.environ.get("MEDIA_THUMBNAIL_SIZES", "320,1280").split(","))
+    MEDIA_DERIVATIVE_PROCESSES = int(os.environ.get("MEDIA_DERIVATIVE_PROCESSES", 2))
+    MEDIA_DERIVATIVE_TIMEOUT_SECONDS = int(os.environ.get("MEDIA_DERIVATIVE_TIMEOUT_SECONDS", 300))
+    MEDIA_DERIVATIVE_LEASE_SECONDS = int(os.environ.get("MEDIA_DERIVATIVE_LEASE_SECONDS", 600))
+    FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+    # How /uploads and /derivatives bytes leave the process: "direct" (WSGI
+    # file_wrapper, sendfile under gunicorn), "x-accel" (nginx internal
+    # location MEDIA_ACCEL_REDIRECT_PREFIX with uploads/ and derivatives/
+    # aliased to MEDIA_ROOT and MEDIA_DERIVATIVES_ROOT) or "x-sendfile"
+    MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE", "direct")
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "/_protected")
+    MEDIA_DERIVATIVE_MAX_AGE = int(os.environ.get("MEDIA_DERIVATIVE_MAX_AGE", 86400))
+
 
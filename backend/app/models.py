@@ -1,6 +1,10 @@
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from app.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.geo import geohash_encode
+from app.utils.pagination import created_key
+from app.utils.passwords import hash_password, needs_rehash, verify_password
 
 
 class User(db.Model):
@@ -9,11 +13,11 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     phone = db.Column(db.String(20), unique=True, nullable=False)
     role = db.Column(db.String(20), default="user")   # admin/user
-    points = db.Column(db.Integer, default=0)
+    points = db.Column(db.Integer, default=0, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # ✅ new
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ✅ new
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # ✅ new
 
     # Relationships
     incidents = db.relationship("Incident", backref="user", lazy=True)
@@ -26,10 +30,13 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
 
 class Incident(db.Model):
@@ -38,16 +45,43 @@ class Incident(db.Model):
     description = db.Column(db.Text, nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
+    geohash = db.Column(db.String(12), index=True)   # spatial key, kept in sync with lat/lon
     status = db.Column(db.String(50), default="pending")
     created_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    duplicate_of = db.Column(db.Integer, db.ForeignKey("incident.id"), index=True)  # linked earlier report
+    resolved_at = db.Column(db.DateTime)   # set when status becomes "resolved"
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # ✅ new
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ✅ new
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # ✅ new
 
     # Relationships
     comments = db.relationship("Comment", backref="incident", lazy=True)
     media = db.relationship("Media", backref="incident", lazy=True)
 
+    __table_args__ = (
+        # Keyset pagination order for GET /api/v1/incidents/
+        db.Index("ix_incident_created_at_id", created_key(created_at), "id"),
+        # Spatial + temporal candidate lookup for duplicate detection
+        db.Index("ix_incident_geohash_created_at", "geohash", "created_at"),
+    )
+
+
+@event.listens_for(Incident, "before_insert")
+@event.listens_for(Incident, "before_update")
+def _sync_incident_geohash(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = geohash_encode(float(target.latitude), float(target.longitude))
+
+
+@event.listens_for(Incident, "before_insert")
+@event.listens_for(Incident, "before_update")
+def _sync_incident_resolved_at(mapper, connection, target):
+    if target.status == "resolved":
+        if target.resolved_at is None:
+            target.resolved_at = datetime.utcnow()
+    elif target.resolved_at is not None:
+        target.resolved_at = None
+
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -56,7 +90,7 @@ class Comment(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # ✅ new
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ✅ new
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # ✅ new
 
 
 class Media(db.Model):
@@ -65,6 +99,177 @@ class Media(db.Model):
     file_url = db.Column(db.String(255), nullable=False)
     incident_id = db.Column(db.Integer, db.ForeignKey("incident.id"), nullable=False)
     uploaded_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    content_hash = db.Column(db.String(64), index=True)   # sha256 of the stored blob; None for legacy files
+    size = db.Column(db.BigInteger)
+
+    blob = db.relationship(
+        "MediaBlob", primaryjoin="foreign(Media.content_hash) == MediaBlob.sha256",
+        viewonly=True, lazy="joined"
+    )
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # ✅ new
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ✅ new
+
+
+class MediaBlob(db.Model):
+    """Content-addressed media file, shared by every Media row with the same hash."""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)   # blob is collected at 0
+    kind = db.Column(db.String(10), nullable=False, default="other")   # image, video, other
+    ext = db.Column(db.String(10))   # extension of the first upload; fixes URL and Content-Type
+    # Thumbnails/poster frame: pending -> ready, failed or unsupported
+    derivatives_status = db.Column(db.String(12), nullable=False, default="pending", index=True)
+    derivatives = db.Column(db.JSON)   # variant names, e.g. ["thumb_320.webp", "poster.jpg"]
+    locked_until = db.Column(db.DateTime)
+
+
+class MediaUpload(db.Model):
+    """A resumable upload in progress; bytes so far live in the partial upload directory."""
+    id = db.Column(db.String(32), primary_key=True)   # random hex, used in URLs
+    incident_id = db.Column(db.Integer, nullable=False)   # no FK: checked again on completion
+    uploaded_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    locked_until = db.Column(db.DateTime, nullable=True)   # held by the request writing a chunk
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class IncidentCluster(db.Model):
+    """Pre-aggregated incident counts per map grid cell, zoom level and status."""
+    zoom = db.Column(db.SmallInteger, primary_key=True)
+    cell_x = db.Column(db.Integer, primary_key=True)
+    cell_y = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    lat_sum = db.Column(db.Float, nullable=False, default=0.0)
+    lon_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ChangeLogEntry(db.Model):
+    """Append-only record of incident/comment/media writes, read by the sync feed."""
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)   # incident/comment/media
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)        # create/update/delete
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class IncidentSearchDocument(db.Model):
+    """Weighted tsvector of an incident's title, description and comments (Postgres)."""
+    incident_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    vector = db.Column(TSVECTOR().with_variant(db.Text, "sqlite"))
+
+    __table_args__ = (
+        db.Index("ix_incident_search_document_vector", "vector", postgresql_using="gin")
+        .ddl_if(dialect="postgresql"),
+    )
+
+
+class SearchTerm(db.Model):
+    """Inverted index posting: term -> incident with a field-weighted score (SQLite fallback)."""
+    term = db.Column(db.String(64), primary_key=True)
+    incident_id = db.Column(db.Integer, primary_key=True, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class IncidentDailyStat(db.Model):
+    """Rollup: incidents reported on `day`, by their current status."""
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ResolutionDailyStat(db.Model):
+    """Rollup: incidents resolved on `day` and their summed time to resolution."""
+    day = db.Column(db.Date, primary_key=True)
+    resolved_count = db.Column(db.Integer, nullable=False, default=0)
+    total_resolution_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class TokenRevocation(db.Model):
+    """
+    Revoked JWTs: either one token (jti) or every token a user was issued
+    up to `created_at` (demotion, forced logout, deletion).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)   # no FK: outlives deleted users
+    jti = db.Column(db.String(64), unique=True)   # None = all of the user's tokens
+    reason = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class UserDeletion(db.Model):
+    """Deleted user ids, so per-process caches in other workers can drop them."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)   # no FK: the user is gone
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class PointsLedgerEntry(db.Model):
+    """Append-only record of every change to User.points."""
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(120), nullable=False)   # e.g. "redeem:<reward>", "compacted"
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class RateLimitBucket(db.Model):
+    """Shared token bucket state (RATELIMIT_STORAGE = "database")."""
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)   # unix time; old rows are pruned
+
+
+class OutboundEmail(db.Model):
+    """Mail outbox drained by the background worker; status "dead" rows are the dead-letter store."""
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)   # comma-separated
+    body = db.Column(db.Text, nullable=False)
+    sender = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")   # pending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_outbound_email_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class AreaSubscription(db.Model):
+    """A user's alert area: a point plus radius, or a polygon of [lat, lon] vertices."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    channel = db.Column(db.String(10), nullable=False, default="email")   # email or sms
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    radius_m = db.Column(db.Float, nullable=True)
+    polygon = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    cells = db.relationship("SubscriptionCell", backref="subscription", cascade="all, delete-orphan")
+
+
+class SubscriptionCell(db.Model):
+    """Spatial index: geohash cells (of any length, "" = everywhere) covering a subscription."""
+    cell = db.Column(db.String(12), primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey("area_subscription.id"), primary_key=True)
+
+
+class IncidentAlert(db.Model):
+    """Pending fan-out of a new incident to area subscribers, resumable by subscription id."""
+    incident_id = db.Column(db.Integer, primary_key=True, autoincrement=False)   # no FK: deletes must not wait
+    last_subscription_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default="pending")   # pending, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)   # consecutive failed batches
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -1,9 +1,13 @@
 # app/routes/admin.py
+from datetime import date, timedelta
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db, mail
+from flask_jwt_extended import jwt_required, current_user
+from app.extensions import db
 from app.models import Incident, User
-from flask_mail import Message
+from app.utils.analytics import incident_stats
+from app.utils.fields import parse_fields, pick, select_fields
+from app.utils.geo import apply_geo_filters
+from app.utils.mail_queue import queue_email
 
 admin_bp = Blueprint("admin_bp", __name__, url_prefix="/api/v1/admin")
 
@@ -15,24 +19,30 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user or user.role != "admin":
+        if current_user.role != "admin":
             return jsonify({"msg": "Admin access required"}), 403
         return fn(*args, **kwargs)
     return wrapper
 
+ADMIN_INCIDENT_FIELDS = ("id", "title", "description", "status", "created_by", "created_at")
+
 # ---------------------
-# List all incidents (with optional status filter)
+# List all incidents (with optional status, bbox and near/radius_m filters)
 # GET /api/v1/admin/incidents
 # ---------------------
 @admin_bp.route("/incidents", methods=["GET"])
 @admin_required
 def list_all_incidents():
     status_filter = request.args.get("status")
-    query = Incident.query
+    try:
+        query = apply_geo_filters(Incident.query, Incident, request.args)
+        fields = parse_fields(ADMIN_INCIDENT_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
     if status_filter:
         query = query.filter_by(status=status_filter)
+    if fields:
+        return jsonify([pick(row, fields) for row in select_fields(query, Incident, fields)])
     incidents = query.all()
     result = [
         {
@@ -46,6 +56,26 @@ def list_all_incidents():
     ]
     return jsonify(result)
 
+# ---------------------
+# Incident analytics from rollup tables
+# GET /api/v1/admin/analytics?bucket=day|week&from=YYYY-MM-DD&to=YYYY-MM-DD
+# ---------------------
+@admin_bp.route("/analytics", methods=["GET"])
+@admin_required
+def incident_analytics():
+    bucket = request.args.get("bucket", "day")
+    if bucket not in ("day", "week"):
+        return jsonify({"msg": "bucket must be day or week"}), 400
+    try:
+        end = date.fromisoformat(request.args["to"]) if request.args.get("to") else date.today()
+        start = date.fromisoformat(request.args["from"]) if request.args.get("from") else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({"msg": "from/to must be YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"msg": "from must not be after to"}), 400
+
+    return jsonify(incident_stats(start, end, bucket))
+
 # ---------------------
 # Update incident status
 # PATCH /api/v1/admin/incidents/<id>/status
@@ -60,19 +90,15 @@ def update_incident_status(id):
         return jsonify({"msg": "Invalid status"}), 400
 
     incident.status = new_status
-    db.session.commit()
 
-    # Notify reporter via email
+    # Notify reporter via email (queued; sent after commit by the mail worker)
     reporter = User.query.get(incident.created_by)
     if reporter and reporter.email:
-        try:
-            msg = Message(
-                subject=f"Incident #{incident.id} Status Updated",
-                recipients=[reporter.email],
-                body=f"Hi {reporter.name},\n\nYour incident '{incident.title}' status has been updated to '{new_status}'."
-            )
-            mail.send(msg)
-        except Exception as e:
-            print(f"Email send failed: {e}")
+        queue_email(
+            subject=f"Incident #{incident.id} Status Updated",
+            recipients=[reporter.email],
+            body=f"Hi {reporter.name},\n\nYour incident '{incident.title}' status has been updated to '{new_status}'."
+        )
+    db.session.commit()
 
     return jsonify({"msg": f"Incident status updated to {new_status}"})
@@ -3,12 +3,15 @@ from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     jwt_required,
+    get_jwt,
     get_jwt_identity,
+    current_user,
 )
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
-from app.extensions import db, mail
+from app.extensions import db
 from app.models import User
-from flask_mail import Message
+from app.utils.mail_queue import queue_email
+from app.utils.security import load_user, revoke_token, revoke_user_tokens, token_claims
 
 auth_bp = Blueprint("auth_bp", __name__, url_prefix="/api/v1/auth")
 
@@ -41,6 +44,10 @@ def signup():
     phone = data.get("phone")
     password = data.get("password")
 
+    # name and phone are NOT NULL on user; reject here instead of failing the insert
+    if not all(isinstance(v, str) and v.strip() for v in (name, email, phone, password)):
+        return jsonify({"msg": "name, email, phone and password are required"}), 400
+
     if User.query.filter_by(email=email).first():
         return jsonify({"msg": "Email already registered"}), 400
 
@@ -65,9 +72,15 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({"msg": "Invalid credentials"}), 401
 
-    # 🔑 Cast user.id to str
-    access_token = create_access_token(identity=str(user.id))
-    refresh_token = create_refresh_token(identity=str(user.id))
+    # Upgrade hashes made with an outdated PASSWORD_HASH_METHOD while we have the plaintext
+    if user.password_needs_rehash():
+        user.password = password
+        db.session.commit()
+
+    # 🔑 Cast user.id to str; the role claim lets routes authorize without a DB read
+    claims = token_claims(user)
+    access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+    refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
 
     return jsonify({
         "access_token": access_token,
@@ -109,10 +122,42 @@ def me():
 @jwt_required(refresh=True)
 def refresh():
     user_id = int(get_jwt_identity())  # 🔑 Cast back to int
-    access_token = create_access_token(identity=str(user_id))
+    user = load_user(user_id)
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+    access_token = create_access_token(identity=str(user_id), additional_claims=token_claims(user))
     return jsonify({"access_token": access_token})
 
 
+# ---------------------
+# Logout (revokes the presented token)
+# ---------------------
+@auth_bp.route("/logout", methods=["POST"])
+@jwt_required(verify_type=False)
+def logout():
+    revoke_token(get_jwt())
+    db.session.commit()
+    return jsonify({"msg": "Logged out"})
+
+
+# ---------------------
+# Force logout of every session of a user (Admin only)
+# ---------------------
+@auth_bp.route("/revoke/<int:user_id>", methods=["POST"])
+@jwt_required()
+def revoke_user(user_id):
+    if current_user.role != "admin":
+        return jsonify({"msg": "Admins only"}), 403
+
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    revoke_user_tokens(user.id, "forced_logout")
+    db.session.commit()
+    return jsonify({"msg": f"All sessions of {user.email} revoked"})
+
+
 # ---------------------
 # Password reset request
 # ---------------------
@@ -127,12 +172,12 @@ def password_reset_request():
     token = generate_token(email)
     reset_url = url_for("auth_bp.password_reset", token=token, _external=True)
 
-    msg = Message(
+    queue_email(
         subject="Password Reset Request",
         recipients=[email],
         body=f"Hi {user.name},\n\nClick the link to reset your password: {reset_url}\n\nIf you did not request this, ignore this email."
     )
-    mail.send(msg)
+    db.session.commit()
     return jsonify({"msg": "Password reset email sent"}), 200
 
 
@@ -163,9 +208,6 @@ def password_reset(token):
 @auth_bp.route("/promote/<int:user_id>", methods=["PUT"])
 @jwt_required()
 def promote_user(user_id):
-    current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
-
     if current_user.role != "admin":
         return jsonify({"msg": "Admins only"}), 403
 
@@ -174,6 +216,8 @@ def promote_user(user_id):
         return jsonify({"msg": "User not found"}), 404
 
     user.role = "admin"
+    # Existing tokens carry the old role claim; make the user log in again.
+    revoke_user_tokens(user.id, "role_change")
     db.session.commit()
 
     return jsonify({"msg": f"User {user.email} promoted to admin"}), 200
@@ -3,6 +3,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
 from app.models import Comment, Incident
+from app.utils.fields import parse_fields, pick, select_fields
+from app.utils.http_cache import CacheValidators
 
 comments_bp = Blueprint("comments_bp", __name__, url_prefix="/api/v1/incidents")
 
@@ -30,14 +32,32 @@ def add_comment(incident_id):
     db.session.commit()
     return jsonify({"msg": "Comment added", "comment_id": comment.id}), 201
 
+COMMENT_FIELDS = ("id", "text", "created_by", "created_at")
+
 # ---------------------
 # List all comments for an incident
 # GET /api/v1/incidents/<id>/comments
 # ---------------------
 @comments_bp.route("/<int:incident_id>/comments", methods=["GET"])
 def list_comments(incident_id):
+    try:
+        fields = parse_fields(COMMENT_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
     incident = Incident.query.get_or_404(incident_id)
-    comments = Comment.query.filter_by(incident_id=incident.id).all()
+    query = Comment.query.filter_by(incident_id=incident.id)
+
+    validators = CacheValidators(query, Comment)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+
+    if fields:
+        rows = select_fields(query, Comment, fields).all()
+        return validators.apply(jsonify([pick(row, fields) for row in rows]))
+
+    comments = query.all()
     result = [
         {
             "id": c.id,
@@ -46,4 +66,4 @@ def list_comments(incident_id):
             "created_at": c.created_at
         } for c in comments
     ]
-    return jsonify(result)
+    return validators.apply(jsonify(result))
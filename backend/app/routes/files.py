@@ -0,0 +1,157 @@
+# app/routes/files.py
+import mimetypes
+import os
+import re
+from flask import Blueprint, Response, abort, current_app, redirect, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+from app.extensions import db
+from app.models import MediaBlob
+from app.utils.storage import MEDIA_TYPES, derivative_dir, file_extension, get_storage, media_kind, shard_path
+
+files_bp = Blueprint("files_bp", __name__)
+
+BLOB_KEY = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.(\w{1,10})$")
+DERIVATIVE_KEY = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})/(\w+\.\w+)$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class _BoundedFile:
+    """
+    A file already seeked to the range start that reads at most `length`
+    bytes. Its fileno() and position let gunicorn sendfile() the range
+    directly; other servers fall back to iterating read().
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def _send(path, rel_path, etag, cache_control, mimetype):
+    """
+    Serve a file with a strong ETag, If-None-Match and single-range support.
+    With MEDIA_SENDFILE = "x-accel" or "x-sendfile" only headers are
+    returned and the front server streams the bytes (and handles Range).
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        abort(404)
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if not mimetype.startswith(("image/", "video/")):
+        # Never let the browser render anything else on the API origin
+        headers["Content-Disposition"] = "attachment"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    mode = current_app.config.get("MEDIA_SENDFILE", "direct")
+    if mode == "x-accel":
+        prefix = current_app.config.get("MEDIA_ACCEL_REDIRECT_PREFIX", "/_protected")
+        headers["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{rel_path}"
+        return Response(status=200, headers=headers, mimetype=mimetype)
+    if mode == "x-sendfile":
+        headers["X-Sendfile"] = os.path.abspath(path)
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    start, stop, status = 0, size, 200
+    ranges = request.range
+    if ranges is not None and len(ranges.ranges) == 1 and (
+            request.if_range.etag is None or request.if_range.etag == etag):
+        bounds = ranges.range_for_length(size)
+        if bounds is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+        start, stop = bounds
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    f = open(path, "rb")
+    f.seek(start)
+    body = wrap_file(request.environ, _BoundedFile(f, stop - start))
+    response = Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = stop - start
+    return response
+
+
+# ---------------------
+# Stored media blobs (content-addressed, never change) and legacy flat uploads
+# GET /uploads/<ab>/<cd>/<sha256>.<ext>
+# ---------------------
+@files_bp.route("/uploads/<path:key>", methods=["GET"])
+def serve_upload(key):
+    match = BLOB_KEY.match(key)
+    if match is None:
+        # Files saved before content addressing, under their own name
+        if "/" in key:
+            abort(404)
+        path = safe_join(os.path.join(current_app.root_path, "uploads"), key)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        stat = os.stat(path)
+        return _send(path, f"uploads/{key}", f"{stat.st_mtime_ns:x}-{stat.st_size:x}", "public, max-age=3600",
+                     MEDIA_TYPES.get(file_extension(key), "application/octet-stream"))
+
+    # Blobs are looked up by hash and served with the Content-Type of their
+    # stored extension, so a URL cannot turn a blob into HTML. Blobs from
+    # before extensions were stored must be asked for with one of their kind.
+    sha256, ext = match.groups()
+    blob = db.session.get(MediaBlob, sha256)
+    if ext not in MEDIA_TYPES or blob is None:
+        abort(404)
+    served_ext = blob.ext or (ext if blob.kind == media_kind(f"x.{ext}") else None)
+    if served_ext not in MEDIA_TYPES:
+        abort(404)
+    storage = get_storage()
+    path = storage.local_path(sha256)
+    if path is None:
+        return redirect(storage.object_url(sha256))
+    # The hash is the content, so it is a strong validator and the URL never goes stale
+    return _send(path, f"uploads/{shard_path(sha256)}", sha256, IMMUTABLE, MEDIA_TYPES[served_ext])
+
+
+# ---------------------
+# Thumbnails and poster frames
+# GET /derivatives/<ab>/<cd>/<sha256>/<variant>
+# ---------------------
+@files_bp.route("/derivatives/<path:key>", methods=["GET"])
+def serve_derivative(key):
+    match = DERIVATIVE_KEY.match(key)
+    if match is None:
+        abort(404)
+    sha256, name = match.groups()
+    url = get_storage().derivative_url(sha256, name)
+    if url is not None:
+        blob = db.session.get(MediaBlob, sha256)
+        if blob is None or blob.derivatives_status != "ready" or name not in (blob.derivatives or ()):
+            abort(404)
+        return redirect(url)
+    path = os.path.join(derivative_dir(sha256), name)
+    if not os.path.isfile(path):
+        abort(404)
+    # Re-rendering keeps the URL, so validate by file version instead of forever
+    stat = os.stat(path)
+    etag = f"{sha256[:16]}-{name}-{stat.st_mtime_ns:x}"
+    max_age = current_app.config.get("MEDIA_DERIVATIVE_MAX_AGE", 86400)
+    return _send(path, f"derivatives/{shard_path(sha256)}/{name}", etag,
+                 f"public, max-age={max_age}", mimetypes.guess_type(name)[0] or "application/octet-stream")
@@ -1,8 +1,28 @@
 # app/routes/incidents.py
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import Blueprint, request, jsonify, current_app, Response, abort, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.utils import secure_filename
 from app.extensions import db
-from app.models import Incident, Comment, Media, User
+from app.models import ChangeLogEntry, Incident, Comment, Media, User
+from app.utils.changelog import changes_since, current_token, oldest_token
+from app.utils.clusters import MAX_CLUSTER_ZOOM, clusters_in_bbox
+from app.utils.dedupe import (
+    DEFAULT_MIN_SIMILARITY, DEFAULT_RADIUS_M, DEFAULT_WINDOW_MINUTES, find_duplicates
+)
+from app.utils.derivatives import derivative_urls
+from app.utils.fields import parse_fields, pick, select_fields
+from app.utils.geo import apply_geo_filters, parse_bbox
+from app.utils.heatmap import GRID_SIZE, MAX_HEATMAP_ZOOM, compute_tile, encode_binary, encode_png
+from app.utils.http_cache import CacheValidators
+from app.utils.pagination import DEFAULT_PAGE_SIZE, created_key, decode_cursor, page_limit, paginate_keyset
+from app.utils.pubsub import get_hub
+from app.utils.search import search_incident_ids
+from app.utils.storage import ALLOWED_EXTENSIONS, allowed_file, attach_blob, discard_staged, stage_stream
 
 incidents_bp = Blueprint("incidents", __name__, url_prefix="/api/v1/incidents")
 
@@ -10,46 +30,481 @@ incidents_bp = Blueprint("incidents", __name__, url_prefix="/api/v1/incidents")
 # ------------------------
 # Create a new incident
 # ------------------------
+REQUIRED_INCIDENT_FIELDS = ("title", "description", "latitude", "longitude")
+MAX_TITLE_LENGTH = 120          # Incident.title column
+MAX_DESCRIPTION_LENGTH = 10000
+MAX_BATCH_SIZE = 1000
+
+
+def _incident_payload_error(data):
+    """Return an error message for an invalid incident payload, or None."""
+    if not isinstance(data, dict) or not all(k in data for k in REQUIRED_INCIDENT_FIELDS):
+        return "Missing required fields"
+    for field, max_length in (("title", MAX_TITLE_LENGTH), ("description", MAX_DESCRIPTION_LENGTH)):
+        value = data[field]
+        if not isinstance(value, str) or not value.strip():
+            return f"{field} must be a non-empty string"
+        if len(value) > max_length:
+            return f"{field} must be at most {max_length} characters"
+    if any(isinstance(data[k], bool) for k in ("latitude", "longitude")):
+        return "latitude and longitude must be numbers"
+    try:
+        lat, lon = float(data["latitude"]), float(data["longitude"])
+    except (TypeError, ValueError):
+        return "latitude and longitude must be numbers"
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return "latitude/longitude out of range"
+    return None
+
+
+def _new_incident(data, user_id):
+    return Incident(
+        title=data["title"],
+        description=data["description"],
+        latitude=float(data["latitude"]),
+        longitude=float(data["longitude"]),
+        status="pending",
+        created_by=user_id
+    )
+
+
+def _find_duplicates(data):
+    config = current_app.config
+    return find_duplicates(
+        float(data["latitude"]), float(data["longitude"]), data["title"], data["description"],
+        radius_m=config.get("DUPLICATE_RADIUS_M", DEFAULT_RADIUS_M),
+        window_minutes=config.get("DUPLICATE_WINDOW_MINUTES", DEFAULT_WINDOW_MINUTES),
+        min_similarity=config.get("DUPLICATE_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY),
+    )
+
+
+# Body may set "link_duplicate": true to attach the report to the best
+# matching recent incident instead of leaving it standalone.
 @incidents_bp.route("/", methods=["POST"])
 @jwt_required()
 def create_incident():
     data = request.get_json()
     current_user_id = get_jwt_identity()
 
-    if not data or not all(k in data for k in ("title", "description", "latitude", "longitude")):
-        return jsonify({"msg": "Missing required fields"}), 400
+    error = _incident_payload_error(data)
+    if error:
+        return jsonify({"msg": error}), 400
 
-    incident = Incident(
-        title=data["title"],
-        description=data["description"],
-        latitude=data["latitude"],
-        longitude=data["longitude"],
-        status="pending",
-        created_by=current_user_id
-    )
+    duplicates = _find_duplicates(data)
+    incident = _new_incident(data, current_user_id)
+    if duplicates and data.get("link_duplicate"):
+        best = duplicates[0]
+        incident.duplicate_of = best["duplicate_of"] or best["id"]
     db.session.add(incident)
     db.session.commit()
 
-    return jsonify({"msg": "Incident created", "id": incident.id}), 201
+    return jsonify({
+        "msg": "Incident created",
+        "id": incident.id,
+        "duplicate_of": incident.duplicate_of,
+        "duplicates": duplicates
+    }), 201
+
+
+# ------------------------
+# Create many incidents in one transaction
+# POST /api/v1/incidents/batch
+# Body: [ {title, description, latitude, longitude}, ... ]
+# ------------------------
+@incidents_bp.route("/batch", methods=["POST"])
+@jwt_required()
+def create_incidents_batch():
+    items = request.get_json()
+    current_user_id = get_jwt_identity()
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"msg": "Expected a non-empty array of incidents"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"msg": f"At most {MAX_BATCH_SIZE} incidents per batch"}), 400
+
+    created, errors = [], []
+    for index, data in enumerate(items):
+        error = _incident_payload_error(data)
+        if error:
+            errors.append({"index": index, "msg": error})
+        else:
+            created.append((index, _new_incident(data, current_user_id)))
+
+    # add_all + a single flush lets SQLAlchemy send batched multi-row
+    # INSERT ... RETURNING, while the write-time listeners still run.
+    db.session.add_all([incident for _, incident in created])
+    db.session.commit()
+
+    return jsonify({
+        "msg": f"{len(created)} incidents created",
+        "created": [{"index": index, "id": incident.id} for index, incident in created],
+        "errors": errors
+    }), 201 if created else 400
 
 
 # ------------------------
 # Get all incidents
+#   ?limit=&after=<cursor>  -> one keyset page plus next_cursor
+#   ?stream=1               -> whole table as a streamed JSON array
+#   ?bbox=min_lat,min_lon,max_lat,max_lon / ?near=lat,lon&radius_m=
+# ------------------------
+STREAM_BATCH_SIZE = 500
+
+
+def _serialize_comment(c):
+    return {
+        "id": c.id,
+        "text": c.text,
+        "incident_id": c.incident_id,
+        "created_by": c.created_by,
+        "created_at": c.created_at
+    }
+
+
+def _serialize_media(m):
+    return {
+        "id": m.id,
+        "filename": m.filename,
+        "file_url": m.file_url,
+        "incident_id": m.incident_id,
+        "uploaded_by": m.uploaded_by,
+        "size": m.size,
+        "derivatives": derivative_urls(m)
+    }
+
+
+def _serialize_incident(i, expand=()):
+    result = {
+        "id": i.id,
+        "title": i.title,
+        "description": i.description,
+        "latitude": i.latitude,
+        "longitude": i.longitude,
+        "status": i.status,
+        "created_by": i.created_by,
+        "duplicate_of": i.duplicate_of,
+        "created_at": i.created_at
+    }
+    if "comments" in expand:
+        result["comments"] = [_serialize_comment(c) for c in i.comments]
+    if "media" in expand:
+        result["media"] = [_serialize_media(m) for m in i.media]
+    if "user" in expand:
+        result["user"] = {"id": i.user.id, "name": i.user.name} if i.user else None
+    return result
+
+
+# ------------------------
+# ?expand=comments,media,user
+# Related rows are eager-loaded with a fixed number of queries per
+# request: selectin for the collections, a join for the reporter.
 # ------------------------
+EXPANDABLE = {
+    "comments": lambda: selectinload(Incident.comments),
+    "media": lambda: selectinload(Incident.media),
+    "user": lambda: joinedload(Incident.user),
+}
+
+
+def _parse_expand():
+    """Return the requested relations as a tuple; raises ValueError on unknown names."""
+    names = tuple(n.strip() for n in request.args.get("expand", "").split(",") if n.strip())
+    unknown = [n for n in names if n not in EXPANDABLE]
+    if unknown:
+        raise ValueError(f"Cannot expand: {', '.join(unknown)}")
+    return names
+
+
+def _expand_options(expand):
+    return [EXPANDABLE[name]() for name in expand]
+
+
+def _expand_validators(query, expand):
+    """Extra (query, model) pairs so expanded children also drive the ETag."""
+    ids = query.with_entities(Incident.id).order_by(None)
+    extra = []
+    if "comments" in expand:
+        extra.append((Comment.query.filter(Comment.incident_id.in_(ids)), Comment))
+    if "media" in expand:
+        extra.append((Media.query.filter(Media.incident_id.in_(ids)), Media))
+    if "user" in expand:
+        extra.append((User.query.filter(User.id.in_(query.with_entities(Incident.created_by).order_by(None))), User))
+    return extra
+
+
+INCIDENT_FIELDS = (
+    "id", "title", "description", "latitude", "longitude", "status", "created_by", "duplicate_of", "created_at"
+)
+
+
+def _stream_incidents(query, serialize):
+    # yield_per turns on a server-side cursor (stream_results) on Postgres,
+    # so only one batch of rows is held in memory at a time.
+    dumps = current_app.json.dumps
+    yield "["
+    first = True
+    for incident in query.yield_per(STREAM_BATCH_SIZE):
+        yield ("" if first else ",") + dumps(serialize(incident))
+        first = False
+    yield "]"
+
+
 @incidents_bp.route("/", methods=["GET"])
 def get_incidents():
-    incidents = Incident.query.all()
-    return jsonify([
-        {
-            "id": i.id,
-            "title": i.title,
-            "description": i.description,
-            "latitude": i.latitude,
-            "longitude": i.longitude,
-            "status": i.status,
-            "created_by": i.created_by
-        } for i in incidents
-    ])
+    try:
+        query = apply_geo_filters(Incident.query, Incident, request.args)
+        expand = _parse_expand()
+        fields = parse_fields(INCIDENT_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    if fields and expand:
+        return jsonify({"msg": "fields and expand cannot be combined"}), 400
+
+    validators = CacheValidators(query, Incident, _expand_validators(query, expand))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+
+    if fields:
+        # Only the requested columns are selected; the keyset columns ride along.
+        query = select_fields(query, Incident, fields, required=("id", "created_at"))
+
+        def serialize(row):
+            return pick(row, fields)
+    else:
+        query = query.options(*_expand_options(expand))
+
+        def serialize(incident):
+            return _serialize_incident(incident, expand)
+
+    if request.args.get("stream") in ("1", "true"):
+        query = query.order_by(created_key(Incident.created_at), Incident.id)
+        response = Response(stream_with_context(_stream_incidents(query, serialize)), mimetype="application/json")
+        return validators.apply(response)
+
+    if "limit" in request.args or "after" in request.args:
+        after = None
+        if request.args.get("after"):
+            after = decode_cursor(request.args["after"])
+            if after is None:
+                return jsonify({"msg": "Invalid cursor"}), 400
+        incidents, next_cursor = paginate_keyset(query, Incident, after=after, limit=page_limit())
+        return validators.apply(jsonify({
+            "items": [serialize(i) for i in incidents],
+            "next_cursor": next_cursor
+        }))
+
+    # The bare list is kept for older clients but bounded to one default page;
+    # the rest is reachable through the Link header or ?stream=1.
+    incidents, next_cursor = paginate_keyset(query, Incident, limit=DEFAULT_PAGE_SIZE)
+    response = jsonify([serialize(i) for i in incidents])
+    if next_cursor:
+        args = {**request.args.to_dict(), "after": next_cursor, "limit": DEFAULT_PAGE_SIZE}
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return validators.apply(response)
+
+
+# ------------------------
+# Map clusters for a viewport
+# GET /api/v1/incidents/clusters?bbox=min_lat,min_lon,max_lat,max_lon&zoom=
+# ------------------------
+@incidents_bp.route("/clusters", methods=["GET"])
+def get_clusters():
+    try:
+        bbox = parse_bbox(request.args.get("bbox", ""))
+        zoom = int(request.args.get("zoom", ""))
+    except ValueError:
+        return jsonify({"msg": "bbox and zoom are required"}), 400
+    if not 0 <= zoom <= MAX_CLUSTER_ZOOM:
+        return jsonify({"msg": f"zoom must be between 0 and {MAX_CLUSTER_ZOOM}"}), 400
+
+    return jsonify(clusters_in_bbox(bbox, zoom))
+
+
+# ------------------------
+# Heatmap density tiles
+# GET /api/v1/incidents/heatmap/<z>/<x>/<y>?status=&from=&to=&format=bin|png
+# bin: GRID_SIZE x GRID_SIZE little-endian uint16 counts, row 0 = north
+# ------------------------
+@incidents_bp.route("/heatmap/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_heatmap_tile(z, x, y):
+    if not (0 <= z <= MAX_HEATMAP_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return jsonify({"msg": "Invalid tile"}), 400
+    fmt = request.args.get("format", "bin")
+    if fmt not in ("bin", "png"):
+        return jsonify({"msg": "format must be bin or png"}), 400
+    status = request.args.get("status") or None
+    try:
+        since = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        until = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"msg": "from/to must be ISO dates"}), 400
+
+    cache = current_app.extensions["heatmap_cache"]
+    cache.attach(get_hub())
+    key = (z, x, y, status, since, until)
+    grid = cache.get(key)
+    if grid is None:
+        generation = cache.generation
+        grid = compute_tile(z, x, y, status=status, since=since, until=until)
+        cache.put(key, grid, generation)
+
+    if fmt == "png":
+        response = Response(encode_png(grid), mimetype="image/png")
+    else:
+        response = Response(encode_binary(grid), mimetype="application/octet-stream")
+        response.headers["X-Grid-Size"] = str(GRID_SIZE)
+    response.headers["X-Max-Count"] = str(int(grid.max()))
+    return response
+
+
+# ------------------------
+# Delta sync feed for offline clients
+# GET /api/v1/incidents/changes?since=<token>&limit=
+# GET /api/v1/incidents/changes/token  -> token to poll from after a full sync
+#
+# New clients (and clients answered 410) take a token first, then list
+# incidents in full, then poll `changes` from that token.
+# ------------------------
+@incidents_bp.route("/changes/token", methods=["GET"])
+def get_changes_token():
+    return jsonify({"token": str(current_token())})
+
+
+@incidents_bp.route("/changes", methods=["GET"])
+def get_changes():
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return jsonify({"msg": "Invalid token"}), 400
+
+    oldest = oldest_token()
+    if oldest is not None and since < oldest - 1:
+        # Entries after this token were pruned; the client must do a full sync.
+        return jsonify({"msg": "Token expired, full resync required", "token": str(current_token())}), 410
+
+    upserts, deletes, next_token, has_more = changes_since(since, page_limit())
+
+    def load(model, ids):
+        return model.query.filter(model.id.in_(ids)).all() if ids else []
+
+    return jsonify({
+        "incidents": [_serialize_incident(i) for i in load(Incident, upserts["incident"])],
+        "comments": [_serialize_comment(c) for c in load(Comment, upserts["comment"])],
+        "media": [_serialize_media(m) for m in load(Media, upserts["media"])],
+        "deleted": {name: sorted(ids) for name, ids in deletes.items()},
+        "next_token": str(next_token),
+        "has_more": has_more
+    })
+
+
+# ------------------------
+# Full-text search over titles, descriptions and comments
+# GET /api/v1/incidents/search?q=&limit=&page=
+# ------------------------
+@incidents_bp.route("/search", methods=["GET"])
+def search_incidents():
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"msg": "q is required"}), 400
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+    except ValueError:
+        return jsonify({"msg": "Invalid page"}), 400
+    limit = page_limit()
+
+    hits = search_incident_ids(db.session, q, limit, (page - 1) * limit)
+    incidents = {i.id: i for i in Incident.query.filter(Incident.id.in_([h[0] for h in hits]))} if hits else {}
+
+    items = []
+    for incident_id, rank in hits:
+        if incident_id in incidents:
+            item = _serialize_incident(incidents[incident_id])
+            item["rank"] = rank
+            items.append(item)
+    return jsonify({"items": items, "page": page, "limit": limit})
+
+
+# ------------------------
+# Live feed of incident and comment events (Server-Sent Events)
+# GET /api/v1/incidents/stream?bbox=&status=
+# Resumes after the Last-Event-ID header (or ?last_event_id=).
+# ------------------------
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _event_matcher(bbox, statuses):
+    def matches(evt):
+        if statuses and evt.get("status") not in statuses:
+            return False
+        if bbox:
+            lat, lon = evt.get("latitude"), evt.get("longitude")
+            if lat is None or lon is None:
+                return False
+            min_lat, min_lon, max_lat, max_lon = bbox
+            return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+        return True
+    return matches
+
+
+def _sse(evt):
+    return f"id: {evt['id']}\nevent: {evt['type']}\ndata: {json.dumps(evt)}\n\n"
+
+
+def _event_stream(hub, subscription, matches, last_event_id):
+    try:
+        yield "retry: 3000\n\n"
+        if last_event_id is not None:
+            missed, complete = hub.replay(last_event_id)
+            if not complete:
+                # Events were dropped from the replay buffer; tell the client to refetch.
+                yield "event: reset\ndata: {}\n\n"
+            for evt in missed:
+                if matches(evt):
+                    yield _sse(evt)
+            last_event_id = missed[-1]["id"] if missed else last_event_id
+        while True:
+            evt = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+            if subscription.overflowed:
+                # This client fell too far behind and events were dropped
+                subscription.overflowed = False
+                yield "event: reset\ndata: {}\n\n"
+            if evt is None:
+                yield ": keep-alive\n\n"
+            elif (last_event_id is None or evt["id"] > last_event_id) and matches(evt):
+                yield _sse(evt)
+    finally:
+        subscription.close()
+
+
+@incidents_bp.route("/stream", methods=["GET"])
+def stream_events():
+    try:
+        bbox = parse_bbox(request.args["bbox"]) if request.args.get("bbox") else None
+        raw_last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        last_event_id = int(raw_last_id) if raw_last_id else None
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid stream parameters: {e}"}), 400
+    statuses = {s for s in request.args.get("status", "").split(",") if s}
+
+    hub = get_hub()
+    # Subscribe before replaying so nothing published in between is missed.
+    # Each open stream holds a worker thread, so past the cap clients retry later.
+    subscription = hub.subscribe(current_app.config.get("SSE_MAX_CONNECTIONS", 16))
+    if subscription is None:
+        response = jsonify({"msg": "Too many live connections, retry shortly"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "10"
+        return response
+    if last_event_id is not None:
+        # Events committed before this worker's first stream are not in its
+        # buffer; anything later is, so Last-Event-ID replay can tell the two apart.
+        hub.start_after(db.session.query(func.max(ChangeLogEntry.id)).scalar() or 0)
+    stream = _event_stream(hub, subscription, _event_matcher(bbox, statuses), last_event_id)
+    return Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 
 # ------------------------
@@ -57,16 +512,21 @@ def get_incidents():
 # ------------------------
 @incidents_bp.route("/<int:incident_id>", methods=["GET"])
 def get_incident(incident_id):
-    incident = Incident.query.get_or_404(incident_id)
-    return jsonify({
-        "id": incident.id,
-        "title": incident.title,
-        "description": incident.description,
-        "latitude": incident.latitude,
-        "longitude": incident.longitude,
-        "status": incident.status,
-        "created_by": incident.created_by
-    })
+    try:
+        expand = _parse_expand()
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    query = Incident.query.filter_by(id=incident_id)
+    validators = CacheValidators(query, Incident, _expand_validators(query, expand))
+    if not validators.count:
+        abort(404)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+
+    incident = query.options(*_expand_options(expand)).first_or_404()
+    return validators.apply(jsonify(_serialize_incident(incident, expand)))
 
 
 # ------------------------
@@ -95,22 +555,29 @@ def my_incidents():
 @jwt_required()
 def update_incident(incident_id):
     data = request.get_json()
-    current_user_id = get_jwt_identity()
     incident = Incident.query.get_or_404(incident_id)
 
-    user = User.query.get(current_user_id)
-    if incident.created_by != current_user_id and user.role != "admin":
+    if incident.created_by != current_user.id and current_user.role != "admin":
         return jsonify({"msg": "Not authorized"}), 403
 
+    if not isinstance(data, dict):
+        return jsonify({"msg": "Invalid payload"}), 400
+    # Validate the incident as it will be stored; titles and descriptions
+    # feed duplicate detection for every later report nearby.
+    merged = {k: data.get(k, getattr(incident, k)) for k in REQUIRED_INCIDENT_FIELDS}
+    error = _incident_payload_error(merged)
+    if error:
+        return jsonify({"msg": error}), 400
+
     # Update only provided fields
     if "title" in data:
         incident.title = data["title"]
     if "description" in data:
         incident.description = data["description"]
     if "latitude" in data:
-        incident.latitude = data["latitude"]
+        incident.latitude = float(data["latitude"])
     if "longitude" in data:
-        incident.longitude = data["longitude"]
+        incident.longitude = float(data["longitude"])
     if "status" in data:
         incident.status = data["status"]
 
@@ -124,11 +591,9 @@ def update_incident(incident_id):
 @incidents_bp.route("/<int:incident_id>", methods=["DELETE"])
 @jwt_required()
 def delete_incident(incident_id):
-    current_user_id = get_jwt_identity()
     incident = Incident.query.get_or_404(incident_id)
 
-    user = User.query.get(current_user_id)
-    if incident.created_by != current_user_id and user.role != "admin":
+    if incident.created_by != current_user.id and current_user.role != "admin":
         return jsonify({"msg": "Not authorized"}), 403
 
     db.session.delete(incident)
@@ -165,24 +630,31 @@ def add_comment(incident_id):
 @incidents_bp.route("/<int:incident_id>/media", methods=["POST"])
 @jwt_required()
 def upload_media(incident_id):
+    incident = Incident.query.get_or_404(incident_id)
+    if incident.created_by != current_user.id and current_user.role != "admin":
+        return jsonify({"msg": "Not authorized"}), 403
+
     if "file" not in request.files:
         return jsonify({"msg": "No file uploaded"}), 400
 
     file = request.files["file"]
     if file.filename == "":
         return jsonify({"msg": "Empty filename"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"msg": f"File type not allowed: {sorted(ALLOWED_EXTENSIONS)}"}), 400
 
-    filename = file.filename
-    file_url = f"/uploads/{filename}"
-
-    current_user_id = get_jwt_identity()
     media = Media(
-        filename=filename,
-        file_url=file_url,
-        incident_id=incident_id,
-        uploaded_by=current_user_id
+        filename=secure_filename(file.filename),
+        incident_id=incident.id,
+        uploaded_by=current_user.id
     )
-    db.session.add(media)
-    db.session.commit()
-
-    return jsonify({"msg": "Media uploaded", "id": media.id, "file_url": file_url}), 201
+    staged = stage_stream(file.stream)
+    try:
+        attach_blob(media, staged)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        discard_staged(staged)
+        raise
+
+    return jsonify({"msg": "Media uploaded", "id": media.id, "file_url": media.file_url}), 201
@@ -1,30 +1,31 @@
 import os
+import secrets
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import or_
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, current_user
 from app.extensions import db
-from app.models import Media, Incident, User
+from app.models import Media, MediaUpload, Incident
+from app.utils.storage import (
+    ALLOWED_EXTENSIONS, allowed_file, attach_blob, discard_staged, stage_file, stage_stream
+)
+from app.utils.uploads import ChunkError, discard_upload, partial_path, write_chunk
 
 media_bp = Blueprint("media_bp", __name__, url_prefix="/api/v1/media")
 
-# Allowed extensions
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "mp4", "mov", "avi"}
-
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
-
 # ---------------------
 # Upload media to an incident
 # ---------------------
 @media_bp.route("/<int:incident_id>/upload", methods=["POST"])
 @jwt_required()
 def upload_media(incident_id):
-    user_id = get_jwt_identity()
+    user_id = current_user.id
     incident = Incident.query.get_or_404(incident_id)
-    
+
     # Check owner/admin
-    user = User.query.get(user_id)
-    if incident.created_by != user_id and user.role != "admin":
+    if incident.created_by != user_id and current_user.role != "admin":
         return jsonify({"msg": "Unauthorized"}), 403
 
     if "file" not in request.files:
@@ -34,42 +35,232 @@ def upload_media(incident_id):
     if file.filename == "":
         return jsonify({"msg": "No selected file"}), 400
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        upload_folder = os.path.join(current_app.root_path, "uploads")
-        os.makedirs(upload_folder, exist_ok=True)
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
-
-        file_url = f"/uploads/{filename}"  # For serving files later
         media = Media(
-            filename=filename,
-            file_url=file_url,
+            filename=secure_filename(file.filename),
             incident_id=incident.id,
             uploaded_by=user_id
         )
-        db.session.add(media)
-        db.session.commit()
-        return jsonify({"msg": "File uploaded", "media_id": media.id, "file_url": file_url})
+        staged = stage_stream(file.stream)
+        try:
+            attach_blob(media, staged)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            discard_staged(staged)
+            raise
+        return jsonify({"msg": "File uploaded", "media_id": media.id, "file_url": media.file_url})
     else:
         return jsonify({"msg": f"File type not allowed: {ALLOWED_EXTENSIONS}"}), 400
 
+# ---------------------
+# Resumable uploads
+# POST   /api/v1/media/<incident_id>/uploads      Body: { "filename", "size" } -> upload id
+# PUT    /api/v1/media/uploads/<id>?offset=N      raw chunk body, optional X-Chunk-SHA256
+# GET    /api/v1/media/uploads/<id>               current offset, to resume
+# POST   /api/v1/media/uploads/<id>/complete      Body: { "sha256"? } -> Media
+# DELETE /api/v1/media/uploads/<id>               abort
+# ---------------------
+def _upload_expiry():
+    return datetime.utcnow() + timedelta(seconds=current_app.config.get("UPLOAD_EXPIRY_SECONDS", 86400))
+
+
+def _serialize_upload(upload):
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.received,
+        "expires_at": upload.expires_at.isoformat(),
+        "max_chunk_size": current_app.config.get("UPLOAD_MAX_CHUNK_BYTES", 8 * 1024 * 1024),
+    }
+
+
+def _get_upload(upload_id, lock=False):
+    """The caller's unexpired upload, or None."""
+    query = MediaUpload.query.filter_by(id=upload_id, uploaded_by=current_user.id)
+    if lock:
+        query = query.with_for_update()
+    upload = query.first()
+    if upload is None or upload.expires_at < datetime.utcnow():
+        return None
+    return upload
+
+
+def _claim_upload(upload_id, received):
+    """
+    Lease the upload to this request while it is at `received`, in a short
+    transaction of its own so no row lock or connection is held while the
+    body streams in. Returns the lease token, or None if another request
+    holds it or the offset has moved.
+    """
+    now = datetime.utcnow()
+    token = now + timedelta(seconds=current_app.config.get("UPLOAD_CHUNK_LEASE_SECONDS", 300))
+    claimed = (
+        MediaUpload.query
+        .filter(
+            MediaUpload.id == upload_id,
+            MediaUpload.received == received,
+            or_(MediaUpload.locked_until.is_(None), MediaUpload.locked_until < now),
+        )
+        .update({"locked_until": token}, synchronize_session=False)
+    )
+    db.session.commit()
+    return token if claimed else None
+
+
+def _release_upload(upload_id, token, **values):
+    """Drop the lease, applying `values`, if this request still holds it. Returns True if it did."""
+    released = (
+        MediaUpload.query
+        .filter_by(id=upload_id, locked_until=token)
+        .update({"locked_until": None, **values}, synchronize_session=False)
+    )
+    db.session.commit()
+    return bool(released)
+
+
+@media_bp.route("/<int:incident_id>/uploads", methods=["POST"])
+@jwt_required()
+def create_upload(incident_id):
+    incident = Incident.query.get_or_404(incident_id)
+    if incident.created_by != current_user.id and current_user.role != "admin":
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    data = request.get_json() or {}
+    filename = data.get("filename") or ""
+    size = data.get("size")
+    if not allowed_file(filename):
+        return jsonify({"msg": f"File type not allowed: {ALLOWED_EXTENSIONS}"}), 400
+    max_size = current_app.config.get("UPLOAD_MAX_BYTES", 500 * 1024 * 1024)
+    if not isinstance(size, int) or not 0 < size <= max_size:
+        return jsonify({"msg": f"size must be between 1 and {max_size} bytes"}), 400
+
+    upload = MediaUpload(
+        id=secrets.token_hex(16),
+        incident_id=incident.id,
+        uploaded_by=current_user.id,
+        filename=secure_filename(filename),
+        size=size,
+        received=0,
+        expires_at=_upload_expiry(),
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(_serialize_upload(upload)), 201
+
+
+@media_bp.route("/uploads/<upload_id>", methods=["GET"])
+@jwt_required()
+def get_upload(upload_id):
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"msg": "Upload not found or expired"}), 404
+    return jsonify(_serialize_upload(upload))
+
+
+@media_bp.route("/uploads/<upload_id>", methods=["PUT"])
+@jwt_required()
+def upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get("offset", request.headers.get("Upload-Offset", "")))
+    except ValueError:
+        return jsonify({"msg": "offset is required"}), 400
+
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"msg": "Upload not found or expired"}), 404
+    if offset != upload.received:
+        return jsonify({"msg": "Offset mismatch", "offset": upload.received}), 409
+    size = upload.size
+
+    # The lease serialises concurrent chunks for the same upload
+    token = _claim_upload(upload_id, offset)
+    if token is None:
+        return jsonify({"msg": "Another chunk is in progress", "offset": offset}), 409
+
+    max_chunk = current_app.config.get("UPLOAD_MAX_CHUNK_BYTES", 8 * 1024 * 1024)
+    try:
+        written = write_chunk(
+            partial_path(upload_id), offset, request.stream,
+            min(max_chunk, size - offset), request.headers.get("X-Chunk-SHA256"),
+        )
+    except ChunkError as e:
+        _release_upload(upload_id, token)
+        return jsonify({"msg": str(e), "offset": offset}), e.status
+    except ClientDisconnected:
+        _release_upload(upload_id, token)
+        return jsonify({"msg": "Client disconnected", "offset": offset}), 400
+
+    if not _release_upload(upload_id, token, received=offset + written, expires_at=_upload_expiry()):
+        return jsonify({"msg": "Upload lease expired, resume from the current offset"}), 409
+    return jsonify({"offset": offset + written, "size": size})
+
+
+@media_bp.route("/uploads/<upload_id>/complete", methods=["POST"])
+@jwt_required()
+def complete_upload(upload_id):
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"msg": "Upload not found or expired"}), 404
+    if upload.received != upload.size:
+        return jsonify({"msg": "Upload incomplete", "offset": upload.received}), 409
+    if db.session.get(Incident, upload.incident_id) is None:
+        discard_upload(upload)
+        db.session.commit()
+        return jsonify({"msg": "Incident not found"}), 404
+
+    # Hashing a large file takes a while, so it runs under the lease too
+    media = Media(
+        filename=upload.filename,
+        incident_id=upload.incident_id,
+        uploaded_by=upload.uploaded_by
+    )
+    token = _claim_upload(upload_id, upload.size)
+    if token is None:
+        return jsonify({"msg": "Upload is being completed"}), 409
+
+    staged = stage_file(partial_path(upload_id))
+    expected = (request.get_json(silent=True) or {}).get("sha256")
+    if expected and staged.sha256 != expected.lower():
+        _release_upload(upload_id, token)
+        return jsonify({"msg": "File checksum mismatch"}), 409
+
+    upload = MediaUpload.query.filter_by(id=upload_id, locked_until=token).with_for_update().first()
+    if upload is None:
+        return jsonify({"msg": "Upload lease expired, retry"}), 409
+    db.session.delete(upload)
+    attach_blob(media, staged)
+    db.session.commit()
+    return jsonify({"msg": "File uploaded", "media_id": media.id, "file_url": media.file_url}), 201
+
+
+@media_bp.route("/uploads/<upload_id>", methods=["DELETE"])
+@jwt_required()
+def abort_upload(upload_id):
+    upload = _get_upload(upload_id, lock=True)
+    if upload is None:
+        return jsonify({"msg": "Upload not found or expired"}), 404
+    discard_upload(upload)
+    db.session.commit()
+    return jsonify({"msg": "Upload aborted"})
+
 # ---------------------
 # Delete media
 # ---------------------
 @media_bp.route("/<int:media_id>", methods=["DELETE"])
 @jwt_required()
 def delete_media(media_id):
-    user_id = get_jwt_identity()
     media = Media.query.get_or_404(media_id)
-    user = User.query.get(user_id)
 
-    if media.uploaded_by != user_id and user.role != "admin":
+    if media.uploaded_by != current_user.id and current_user.role != "admin":
         return jsonify({"msg": "Unauthorized"}), 403
 
-    # Remove file from filesystem
-    file_path = os.path.join(current_app.root_path, "uploads", media.filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Stored blobs are reference-counted and collected once unused;
+    # legacy files sit flat in app/uploads under their own name
+    if not media.content_hash:
+        file_path = os.path.join(current_app.root_path, "uploads", media.filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
     db.session.delete(media)
     db.session.commit()
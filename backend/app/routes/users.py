@@ -1,8 +1,12 @@
 # app/routes/users.py
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from app.extensions import db
-from app.models import User
+from app.models import AreaSubscription, User
+from app.utils.fields import parse_fields
+from app.utils.http_cache import CacheValidators
+from app.utils.notifications import MAX_POLYGON_VERTICES, index_subscription
+from app.utils.points import adjust_points
 
 users_bp = Blueprint("users_bp", __name__, url_prefix="/api/v1/users")
 
@@ -30,32 +34,172 @@ def redeem_points():
     reward_name = data.get("reward")
     if not redeem_points or not reward_name:
         return jsonify({"msg": "Points and reward are required"}), 400
+    if isinstance(redeem_points, bool) or not isinstance(redeem_points, int) or redeem_points <= 0:
+        return jsonify({"msg": "Points must be a positive integer"}), 400
 
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-
-    if user.points < redeem_points:
+    user_id = int(get_jwt_identity())
+    remaining = adjust_points(user_id, -redeem_points, f"redeem:{reward_name}")
+    if remaining is None:
+        db.session.rollback()
+        if not User.query.get(user_id):
+            return jsonify({"msg": "User not found"}), 404
         return jsonify({"msg": "Insufficient points"}), 400
-
-    user.points -= redeem_points
     db.session.commit()
 
-    # You can log reward redemption to a separate table if needed
-    return jsonify({"msg": f"Redeemed {redeem_points} points for {reward_name}", "points_remaining": user.points})
+    return jsonify({"msg": f"Redeemed {redeem_points} points for {reward_name}", "points_remaining": remaining})
+
+LEADERBOARD_FIELDS = ("id", "name", "points", "rank")
+MAX_LEADERBOARD_SIZE = 100
+MAX_RANK_NEIGHBOURS = 50
+
+
+def _leaderboard_entries(entries, fields=None):
+    """Turn (position, user_id, points) tuples into response dicts; names are fetched by PK."""
+    ranking = current_app.extensions["leaderboard"]
+    fields = fields or ("id", "name", "points")
+    names = {}
+    if "name" in fields and entries:
+        ids = [user_id for _, user_id, _ in entries]
+        names = dict(User.query.with_entities(User.id, User.name).filter(User.id.in_(ids)).all())
+    result = []
+    for _, user_id, points in entries:
+        row = {"id": user_id, "name": names.get(user_id), "points": points}
+        if "rank" in fields:
+            row["rank"] = ranking.rank(user_id)
+        result.append({f: row[f] for f in fields})
+    return result
+
 
 # ---------------------
 # Leaderboard: Top reporters by points
-# GET /api/v1/users/leaderboard
+# GET /api/v1/users/leaderboard?top=10
+# Served from the in-process ranking, not ORDER BY over the user table.
 # ---------------------
 @users_bp.route("/leaderboard", methods=["GET"])
 def leaderboard():
-    top_n = int(request.args.get("top", 10))
-    users = User.query.order_by(User.points.desc()).limit(top_n).all()
-    result = [
-        {
-            "id": u.id,
-            "name": u.name,
-            "points": u.points
-        } for u in users
-    ]
-    return jsonify(result)
+    try:
+        top_n = min(max(int(request.args.get("top", 10)), 1), MAX_LEADERBOARD_SIZE)
+        fields = parse_fields(LEADERBOARD_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    # The ETag hashes the body itself, so it always matches the ranking
+    # this worker serves rather than the table it trails.
+    entries = _leaderboard_entries(current_app.extensions["leaderboard"].top(top_n), fields)
+    validators = CacheValidators.for_payload(entries)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    return validators.apply(jsonify(entries))
+
+# ---------------------
+# Rank of a user and the users around them
+# GET /api/v1/users/leaderboard/rank?user_id=&around=5
+# ---------------------
+@users_bp.route("/leaderboard/rank", methods=["GET"])
+@jwt_required()
+def leaderboard_rank():
+    try:
+        user_id = int(request.args.get("user_id", current_user.id))
+        around = min(max(int(request.args.get("around", 5)), 0), MAX_RANK_NEIGHBOURS)
+    except ValueError:
+        return jsonify({"msg": "user_id and around must be integers"}), 400
+
+    found = current_app.extensions["leaderboard"].around(user_id, around)
+    if found is None:
+        return jsonify({"msg": "User not found"}), 404
+    rank, points, neighbours = found
+    return jsonify({
+        "id": user_id,
+        "rank": rank,
+        "points": points,
+        "neighbours": _leaderboard_entries(neighbours, ("id", "name", "points", "rank"))
+    })
+
+
+def _serialize_subscription(sub):
+    return {
+        "id": sub.id,
+        "channel": sub.channel,
+        "latitude": sub.latitude,
+        "longitude": sub.longitude,
+        "radius_m": sub.radius_m,
+        "polygon": sub.polygon,
+    }
+
+
+def _subscription_area(data):
+    """Validated (latitude, longitude, radius_m, polygon) from a request body; raises ValueError."""
+    polygon = data.get("polygon")
+    if polygon is not None:
+        if not isinstance(polygon, list) or not 3 <= len(polygon) <= MAX_POLYGON_VERTICES:
+            raise ValueError(f"polygon needs 3 to {MAX_POLYGON_VERTICES} [lat, lon] points")
+        try:
+            polygon = [[float(lat), float(lon)] for lat, lon in polygon]
+        except (TypeError, ValueError):
+            raise ValueError("polygon points must be [lat, lon] numbers")
+        if not all(-90 <= lat <= 90 and -180 <= lon <= 180 for lat, lon in polygon):
+            raise ValueError("polygon points out of range")
+        return None, None, None, polygon
+
+    try:
+        lat, lon, radius = float(data["latitude"]), float(data["longitude"]), float(data["radius_m"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("latitude, longitude and radius_m, or polygon, are required")
+    max_radius = current_app.config.get("NOTIFY_MAX_RADIUS_M", 50000)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius <= max_radius):
+        raise ValueError(f"Invalid point or radius (max {max_radius:g} m)")
+    return lat, lon, radius, None
+
+
+# ---------------------
+# Subscribe to alerts for new incidents in an area
+# POST /api/v1/users/subscriptions
+# Body: { "channel": "email"|"sms", "latitude", "longitude", "radius_m" } or { "channel", "polygon": [[lat, lon], ...] }
+# ---------------------
+@users_bp.route("/subscriptions", methods=["POST"])
+@jwt_required()
+def create_subscription():
+    data = request.get_json() or {}
+    channel = data.get("channel", "email")
+    if channel not in ("email", "sms"):
+        return jsonify({"msg": "channel must be email or sms"}), 400
+    try:
+        lat, lon, radius, polygon = _subscription_area(data)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    limit = current_app.config.get("NOTIFY_MAX_SUBSCRIPTIONS", 20)
+    if AreaSubscription.query.filter_by(user_id=current_user.id).count() >= limit:
+        return jsonify({"msg": f"At most {limit} subscriptions per user"}), 400
+
+    sub = AreaSubscription(user_id=current_user.id, channel=channel, latitude=lat,
+                           longitude=lon, radius_m=radius, polygon=polygon)
+    index_subscription(sub)
+    db.session.add(sub)
+    db.session.commit()
+    return jsonify(_serialize_subscription(sub)), 201
+
+# ---------------------
+# List my subscriptions
+# GET /api/v1/users/subscriptions
+# ---------------------
+@users_bp.route("/subscriptions", methods=["GET"])
+@jwt_required()
+def list_subscriptions():
+    subs = AreaSubscription.query.filter_by(user_id=current_user.id).order_by(AreaSubscription.id).all()
+    return jsonify([_serialize_subscription(s) for s in subs])
+
+# ---------------------
+# Unsubscribe
+# DELETE /api/v1/users/subscriptions/<id>
+# ---------------------
+@users_bp.route("/subscriptions/<int:id>", methods=["DELETE"])
+@jwt_required()
+def delete_subscription(id):
+    sub = AreaSubscription.query.filter_by(id=id, user_id=current_user.id).first()
+    if sub is None:
+        return jsonify({"msg": "Subscription not found"}), 404
+    db.session.delete(sub)
+    db.session.commit()
+    return jsonify({"msg": "Subscription deleted"})
@@ -0,0 +1,101 @@
+# app/utils/analytics.py
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import Incident, IncidentDailyStat, ResolutionDailyStat
+from app.utils.changes import ensure_active_history, tracked_changes
+from app.utils.counters import add_to_counters
+
+_TRACKED = ("status", "resolved_at", "created_at")
+
+
+class _Deltas:
+    def __init__(self):
+        self.daily = defaultdict(int)
+        self.resolution = defaultdict(lambda: [0, 0.0])
+
+    def add(self, created_at, status, resolved_at, sign):
+        if created_at is None:
+            return
+        self.daily[(created_at.date(), status or "pending")] += sign
+        if status == "resolved" and resolved_at is not None:
+            r = self.resolution[resolved_at.date()]
+            r[0] += sign
+            r[1] += sign * (resolved_at - created_at).total_seconds()
+
+    def apply(self, connection):
+        add_to_counters(connection, IncidentDailyStat.__table__, ("day", "status"), [
+            {"day": day, "status": status, "count": n}
+            for (day, status), n in self.daily.items() if n
+        ])
+        add_to_counters(connection, ResolutionDailyStat.__table__, ("day",), [
+            {"day": day, "resolved_count": n, "total_resolution_seconds": secs}
+            for day, (n, secs) in self.resolution.items() if n or secs
+        ])
+
+
+def _after_flush(session, flush_context):
+    deltas = _Deltas()
+    for op, incident, old in tracked_changes(session, Incident, _TRACKED):
+        if op in ("update", "delete"):
+            deltas.add(old["created_at"], old["status"], old["resolved_at"], -1)
+        if op in ("create", "update"):
+            deltas.add(incident.created_at, incident.status, incident.resolved_at, 1)
+    deltas.apply(session.connection())
+
+
+def register_listeners():
+    ensure_active_history(Incident, _TRACKED)
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def _bucket(day, bucket):
+    return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+
+def incident_stats(start, end, bucket="day"):
+    """
+    Per-bucket counts by status plus resolution stats for days in
+    [start, end]. Reads only rollup rows, so cost depends on the range,
+    not on how many incidents exist.
+    """
+    periods = {}
+
+    def period(day):
+        key = _bucket(day, bucket)
+        return periods.setdefault(key, {
+            "period": key.isoformat(), "total": 0, "by_status": {},
+            "resolved": 0, "_seconds": 0.0,
+        })
+
+    for row in IncidentDailyStat.query.filter(IncidentDailyStat.day.between(start, end)):
+        p = period(row.day)
+        p["total"] += row.count
+        p["by_status"][row.status] = p["by_status"].get(row.status, 0) + row.count
+    for row in ResolutionDailyStat.query.filter(ResolutionDailyStat.day.between(start, end)):
+        p = period(row.day)
+        p["resolved"] += row.resolved_count
+        p["_seconds"] += row.total_resolution_seconds
+
+    result = []
+    for key in sorted(periods):
+        p = periods[key]
+        seconds = p.pop("_seconds")
+        p["avg_resolution_hours"] = round(seconds / p["resolved"] / 3600, 2) if p["resolved"] else None
+        result.append(p)
+    return result
+
+
+def rebuild_analytics(session, batch_size=1000):
+    """Recompute both rollup tables from the incident table (for backfills)."""
+    session.query(IncidentDailyStat).delete()
+    session.query(ResolutionDailyStat).delete()
+    deltas = _Deltas()
+    query = session.query(Incident.created_at, Incident.status, Incident.resolved_at)
+    for created_at, status, resolved_at in query.yield_per(batch_size):
+        deltas.add(created_at, status, resolved_at, 1)
+    deltas.apply(session.connection())
+    session.commit()
+    return len(deltas.daily)
@@ -0,0 +1,161 @@
+# app/utils/changelog.py
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import ChangeLogEntry, Comment, Incident, Media
+from app.utils.changes import ensure_active_history, tracked_changes
+from app.utils.pubsub import publish
+
+SYNCED_MODELS = {"incident": Incident, "comment": Comment, "media": Media}
+
+
+PENDING_EVENTS_KEY = "pending_change_events"
+INCIDENT_EVENT_KEYS = ("status", "latitude", "longitude")
+
+
+def _event_payload(session, entity, op, obj, old):
+    """Small, JSON-safe snapshot of a change for the live event stream."""
+    if entity == "incident":
+        kind = f"incident.{op}d"
+        if op == "update" and old["status"] != obj.status:
+            kind = "incident.status_changed"
+        incident = obj
+    elif entity == "comment":
+        kind = f"comment.{op}d"
+        with session.no_autoflush:
+            incident = session.get(Incident, obj.incident_id)
+    else:
+        return None
+    payload = {"type": kind, "incident_id": obj.incident_id if entity == "comment" else obj.id}
+    if incident is not None:
+        payload.update(latitude=incident.latitude, longitude=incident.longitude, status=incident.status)
+    if entity == "comment":
+        payload["comment_id"] = obj.id
+    elif op == "update" and (old["latitude"], old["longitude"]) != (obj.latitude, obj.longitude):
+        payload.update(previous_latitude=old["latitude"], previous_longitude=old["longitude"])
+    return payload
+
+
+def _after_flush(session, flush_context):
+    rows, payloads = [], []
+    now = datetime.utcnow()
+    for entity, model in SYNCED_MODELS.items():
+        keys = INCIDENT_EVENT_KEYS if model is Incident else ()
+        for op, obj, old in tracked_changes(session, model, keys):
+            rows.append({"entity": entity, "entity_id": obj.id, "op": op, "changed_at": now})
+            payloads.append(_event_payload(session, entity, op, obj, old))
+    if not rows:
+        return
+
+    table = ChangeLogEntry.__table__
+    ids = session.connection().execute(
+        table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+    # Log ids are global across workers, so they double as SSE event ids.
+    pending = session.info.setdefault(PENDING_EVENTS_KEY, [])
+    for entry_id, payload in zip(ids, payloads):
+        if payload is not None:
+            pending.append({"id": entry_id, "at": now.isoformat() + "Z", **payload})
+
+
+def _after_commit(session):
+    publish(session.info.pop(PENDING_EVENTS_KEY, []))
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+def register_listeners():
+    ensure_active_history(Incident, INCIDENT_EVENT_KEYS)
+    for name, fn in (("after_flush", _after_flush),
+                     ("after_commit", _after_commit),
+                     ("after_soft_rollback", _after_rollback)):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
+
+
+def changes_since(token, limit, now=None):
+    """
+    Collapse the log entries after `token` to the latest op per row.
+    Returns (upserts, deletes, next_token, has_more) where upserts and
+    deletes map entity name -> set of ids.
+
+    Ids are taken when a transaction flushes but become visible when it
+    commits, so a missing id may belong to a transaction still in flight.
+    The token never passes a gap younger than SYNC_COMMIT_LAG_SECONDS (its
+    age is bounded by the next entry's flush time); older gaps are treated
+    as rolled back.
+    """
+    now = now or datetime.utcnow()
+    settled = now - timedelta(seconds=current_app.config.get("SYNC_COMMIT_LAG_SECONDS", 60))
+    entries = (
+        ChangeLogEntry.query
+        .filter(ChangeLogEntry.id > token)
+        .order_by(ChangeLogEntry.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    expected = token + 1
+    for i, e in enumerate(entries):
+        if e.id != expected and e.changed_at > settled:
+            entries, has_more = entries[:i], False
+            break
+        expected = e.id + 1
+
+    latest = {}
+    for e in entries:
+        latest[(e.entity, e.entity_id)] = e.op
+
+    upserts = {name: set() for name in SYNCED_MODELS}
+    deletes = {name: set() for name in SYNCED_MODELS}
+    for (entity, entity_id), op in latest.items():
+        (deletes if op == "delete" else upserts)[entity].add(entity_id)
+
+    next_token = entries[-1].id if entries else token
+    return upserts, deletes, next_token, has_more
+
+
+def current_token(now=None):
+    """
+    Token a client can start polling from after a full sync: the end of
+    the log, but never past a gap that may still be an uncommitted
+    transaction (same rule as changes_since). Fetch it before the
+    snapshot so nothing between the two is missed.
+    """
+    now = now or datetime.utcnow()
+    settled = now - timedelta(seconds=current_app.config.get("SYNC_COMMIT_LAG_SECONDS", 60))
+    settled_max, oldest = db.session.query(
+        func.max(ChangeLogEntry.id).filter(ChangeLogEntry.changed_at <= settled),
+        func.min(ChangeLogEntry.id),
+    ).one()
+    # Everything below the oldest entry was pruned, so it is not in flight.
+    token = max(settled_max or 0, (oldest or 1) - 1)
+    recent = (
+        ChangeLogEntry.query.with_entities(ChangeLogEntry.id)
+        .filter(ChangeLogEntry.id > token)
+        .order_by(ChangeLogEntry.id)
+    )
+    for entry_id, in recent:
+        if entry_id != token + 1:
+            break
+        token = entry_id
+    return token
+
+
+def oldest_token():
+    first = ChangeLogEntry.query.order_by(ChangeLogEntry.id).first()
+    return first.id if first else None
+
+
+def prune_changes(session, before):
+    """Delete log entries older than `before`; clients behind that must resync."""
+    deleted = session.query(ChangeLogEntry).filter(ChangeLogEntry.changed_at < before).delete()
+    session.commit()
+    return deleted
@@ -0,0 +1,66 @@
+# app/utils/changes.py
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_HISTORY_KEYS = {}   # model -> attributes whose previous values tracked_changes() reports
+
+
+def _old_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    if not history.added and key in state.unloaded and not state.was_deleted:
+        # Expired or deferred but not modified, so the row still holds the old value
+        return getattr(state.obj(), key)
+    return None
+
+
+def tracked_changes(session, model, keys):
+    """
+    Yield (op, obj, old) for every `model` instance in a flush, where op is
+    "create", "update" or "delete" and `old` maps each of `keys` to its
+    pre-flush value (None for creates). Must be called from after_flush,
+    while the session still holds pre-flush history.
+    """
+    for obj in session.new:
+        if isinstance(obj, model):
+            yield "create", obj, None
+    for obj in session.dirty:
+        if isinstance(obj, model) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            yield "update", obj, {k: _old_value(state, k) for k in keys}
+    for obj in session.deleted:
+        if isinstance(obj, model):
+            state = inspect(obj)
+            yield "delete", obj, {k: _old_value(state, k) for k in keys}
+
+
+def _noop(target, value, oldvalue, initiator):
+    return value
+
+
+def _load_deleted(session, flush_context, instances):
+    """Load tracked attributes of expired instances being deleted, while their rows still exist."""
+    for obj in session.deleted:
+        for model, keys in _HISTORY_KEYS.items():
+            if isinstance(obj, model):
+                for key in keys & inspect(obj).unloaded:
+                    getattr(obj, key)
+
+
+def ensure_active_history(model, keys):
+    """
+    Make sure the previous value of each attribute is loaded before it is
+    overwritten or its row deleted, so tracked_changes() sees it even on
+    expired instances. Every caller passing `keys` to tracked_changes()
+    must register them here.
+    """
+    _HISTORY_KEYS.setdefault(model, set()).update(keys)
+    if not event.contains(Session, "before_flush", _load_deleted):
+        event.listen(Session, "before_flush", _load_deleted)
+    for key in keys:
+        attr = getattr(model, key)
+        if not event.contains(attr, "set", _noop):
+            event.listen(attr, "set", _noop, active_history=True, retval=True)
@@ -0,0 +1,118 @@
+# app/utils/clusters.py
+import math
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import Incident, IncidentCluster
+from app.utils.changes import ensure_active_history, tracked_changes
+from app.utils.counters import add_to_counters
+
+MAX_CLUSTER_ZOOM = 16
+CELL_BITS = 2                 # each map tile is split into 4x4 cluster cells
+MAX_MERCATOR_LAT = 85.05112878
+
+_TRACKED = ("latitude", "longitude", "status")
+
+
+def cell_for(lat, lon, zoom):
+    """Web-mercator grid cell of a point at the given zoom level."""
+    n = 1 << (zoom + CELL_BITS)
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    x = int((lon + 180.0) / 360.0 * n)
+    rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _point_deltas(deltas, lat, lon, status, sign):
+    if lat is None or lon is None:
+        return
+    status = status or "pending"
+    for zoom in range(MAX_CLUSTER_ZOOM + 1):
+        x, y = cell_for(lat, lon, zoom)
+        d = deltas[(zoom, x, y, status)]
+        d[0] += sign
+        d[1] += sign * lat
+        d[2] += sign * lon
+
+
+def collect_deltas(session):
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for op, incident, old in tracked_changes(session, Incident, _TRACKED):
+        if op in ("update", "delete"):
+            _point_deltas(deltas, old["latitude"], old["longitude"], old["status"], -1)
+        if op in ("create", "update"):
+            _point_deltas(deltas, incident.latitude, incident.longitude, incident.status, 1)
+    return {k: v for k, v in deltas.items() if v[0] or v[1] or v[2]}
+
+
+def apply_deltas(connection, deltas):
+    if not deltas:
+        return
+    rows = [
+        {"zoom": z, "cell_x": x, "cell_y": y, "status": s,
+         "count": d[0], "lat_sum": d[1], "lon_sum": d[2]}
+        for (z, x, y, s), d in deltas.items()
+    ]
+    add_to_counters(connection, IncidentCluster.__table__, ("zoom", "cell_x", "cell_y", "status"), rows)
+
+
+def _after_flush(session, flush_context):
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def register_listeners():
+    ensure_active_history(Incident, _TRACKED)
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def clusters_in_bbox(bbox, zoom):
+    """Aggregate the stored cells inside `bbox` into one entry per cell."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    x0, y0 = cell_for(max_lat, min_lon, zoom)   # mercator y grows southwards
+    x1, y1 = cell_for(min_lat, max_lon, zoom)
+    rows = IncidentCluster.query.filter(
+        IncidentCluster.zoom == zoom,
+        IncidentCluster.cell_x.between(x0, x1),
+        IncidentCluster.cell_y.between(y0, y1),
+        IncidentCluster.count > 0,
+    ).all()
+
+    cells = {}
+    for r in rows:
+        cell = cells.setdefault((r.cell_x, r.cell_y), {
+            "cell": [zoom, r.cell_x, r.cell_y], "count": 0,
+            "lat_sum": 0.0, "lon_sum": 0.0, "statuses": {},
+        })
+        cell["count"] += r.count
+        cell["lat_sum"] += r.lat_sum
+        cell["lon_sum"] += r.lon_sum
+        cell["statuses"][r.status] = r.count
+
+    result = []
+    for cell in cells.values():
+        count = cell.pop("count")
+        lat_sum, lon_sum = cell.pop("lat_sum"), cell.pop("lon_sum")
+        result.append({
+            "cell": cell["cell"],
+            "count": count,
+            "latitude": lat_sum / count,
+            "longitude": lon_sum / count,
+            "statuses": cell["statuses"],
+        })
+    return result
+
+
+def rebuild_clusters(session, batch_size=1000):
+    """Recompute every cluster cell from the incident table (for backfills)."""
+    session.query(IncidentCluster).delete()
+    query = session.query(Incident.latitude, Incident.longitude, Incident.status)
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for lat, lon, status in query.yield_per(batch_size):
+        _point_deltas(deltas, lat, lon, status, 1)
+    apply_deltas(session.connection(), deltas)
+    session.commit()
+    return len(deltas)
@@ -0,0 +1,24 @@
+# app/utils/counters.py
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def add_to_counters(connection, table, key_columns, rows, value_columns=None):
+    """
+    Upsert `rows` into `table`, adding each value column (default: every
+    non-key column) to the stored one (INSERT ... ON CONFLICT DO UPDATE SET
+    col = col + excluded.col); other columns are only used on insert.
+    Concurrent writers never lose increments and no row lock is held
+    across a read-modify-write.
+    """
+    if not rows:
+        return
+    insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(table)
+    if value_columns is None:
+        value_columns = [c for c in rows[0] if c not in key_columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={c: table.c[c] + stmt.excluded[c] for c in value_columns},
+    )
+    connection.execute(stmt, rows)
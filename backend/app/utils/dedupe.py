@@ -0,0 +1,64 @@
+# app/utils/dedupe.py
+import re
+from datetime import datetime, timedelta
+from app.models import Incident
+from app.utils.geo import haversine_m, within_radius
+
+DEFAULT_RADIUS_M = 300
+DEFAULT_WINDOW_MINUTES = 60
+DEFAULT_MIN_SIMILARITY = 0.3
+MAX_CANDIDATES = 200
+SHINGLE_SIZE = 3
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def shingles(value, k=SHINGLE_SIZE):
+    """Character k-shingles of normalised text (lower-case, single spaces)."""
+    norm = _NON_WORD.sub(" ", (value or "").lower()).strip()
+    if len(norm) <= k:
+        return {norm} if norm else set()
+    return {norm[i:i + k] for i in range(len(norm) - k + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def find_duplicates(lat, lon, title, description, radius_m=DEFAULT_RADIUS_M,
+                    window_minutes=DEFAULT_WINDOW_MINUTES, min_similarity=DEFAULT_MIN_SIMILARITY,
+                    now=None, exclude_id=None):
+    """
+    Recent incidents within `radius_m` whose title/description look like the
+    given report, best match first, as dicts with similarity and distance.
+    Candidates come from the geohash + created_at index, never a table scan.
+    """
+    since = (now or datetime.utcnow()) - timedelta(minutes=window_minutes)
+    query = within_radius(Incident.query, Incident, lat, lon, radius_m).filter(Incident.created_at >= since)
+    if exclude_id is not None:
+        query = query.filter(Incident.id != exclude_id)
+    candidates = query.with_entities(
+        Incident.id, Incident.title, Incident.description, Incident.latitude,
+        Incident.longitude, Incident.duplicate_of, Incident.created_at
+    ).order_by(Incident.created_at.desc()).limit(MAX_CANDIDATES).all()
+
+    title_sh = shingles(title)
+    text_sh = title_sh | shingles(description)
+    matches = []
+    for c in candidates:
+        c_title = shingles(c.title)
+        similarity = max(jaccard(title_sh, c_title), jaccard(text_sh, c_title | shingles(c.description)))
+        if similarity >= min_similarity:
+            matches.append({
+                "id": c.id,
+                "title": c.title,
+                # Point at the root report so chains of duplicates collapse.
+                "duplicate_of": c.duplicate_of,
+                "similarity": round(similarity, 3),
+                "distance_m": round(haversine_m(lat, lon, c.latitude, c.longitude), 1),
+                "created_at": c.created_at,
+            })
+    matches.sort(key=lambda m: (-m["similarity"], m["distance_m"]))
+    return matches
@@ -0,0 +1,222 @@
+# app/utils/derivatives.py
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from app.extensions import db
+from app.models import MediaBlob
+from app.utils.storage import derivative_dir, get_storage, shard_path
+from app.utils.workers import register_worker
+
+DEFAULT_THUMBNAIL_SIZES = (320, 1280)
+THUMBNAIL_FORMATS = (
+    ("webp", "WEBP", {"quality": 80}),
+    ("jpg", "JPEG", {"quality": 85, "progressive": True}),
+)
+POSTER_NAME = "poster.jpg"
+
+
+# ---------------------
+# Rendering (runs in pool processes; no app or database access)
+# ---------------------
+def _save_atomic(image, path, fmt, options):
+    tmp = f"{path}.tmp"
+    image.save(tmp, fmt, **options)
+    os.replace(tmp, path)
+
+
+def _thumbnails(image, out_dir, sizes):
+    from PIL import ImageOps
+
+    image.draft("RGB", (max(sizes), max(sizes)))   # JPEG: decode at reduced scale
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    names = []
+    for size in sizes:
+        thumb = image.copy()
+        thumb.thumbnail((size, size))
+        for ext, fmt, options in THUMBNAIL_FORMATS:
+            name = f"thumb_{size}.{ext}"
+            _save_atomic(thumb, os.path.join(out_dir, name), fmt, options)
+            names.append(name)
+    return names
+
+
+def _poster_frame(source, out_dir, ffmpeg):
+    poster = os.path.join(out_dir, POSTER_NAME)
+    tmp = f"{poster}.tmp.jpg"
+    error = ""
+    for offset in ("1", "0"):   # a frame one second in, or the first one for very short clips
+        result = subprocess.run(
+            [ffmpeg, "-v", "error", "-y", "-ss", offset, "-i", source, "-frames:v", "1", "-q:v", "3", tmp],
+            capture_output=True, timeout=120,
+        )
+        if result.returncode == 0 and os.path.exists(tmp) and os.path.getsize(tmp):
+            os.replace(tmp, poster)
+            return poster
+        error = result.stderr.decode(errors="replace")[-500:]
+    raise RuntimeError(f"ffmpeg could not extract a frame: {error}")
+
+
+def render_derivatives(source, out_dir, kind, sizes, ffmpeg=None):
+    """
+    Write thumbnails (and a poster frame for videos) for `source` into
+    `out_dir`. Returns (status, variant names); status is "unsupported"
+    when Pillow, or ffmpeg for videos, is not available.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return "unsupported", []
+    if kind == "video" and not ffmpeg:
+        return "unsupported", []
+    if kind not in ("image", "video"):
+        return "unsupported", []
+
+    os.makedirs(out_dir, exist_ok=True)
+    names = []
+    if kind == "video":
+        source = _poster_frame(source, out_dir, ffmpeg)
+        names.append(POSTER_NAME)
+    with Image.open(source) as image:
+        names.extend(_thumbnails(image, out_dir, sizes))
+    return "ready", names
+
+
+# ---------------------
+# Queue (runs in the web process's worker thread)
+# ---------------------
+def _pool():
+    pool = current_app.extensions.get("derivative_pool")
+    if pool is None:
+        # spawn, not fork: the web process is multi-threaded
+        pool = current_app.extensions["derivative_pool"] = ProcessPoolExecutor(
+            max_workers=current_app.config.get("MEDIA_DERIVATIVE_PROCESSES", 2),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return pool
+
+
+def _claim(batch_size, now):
+    lease = timedelta(seconds=current_app.config.get("MEDIA_DERIVATIVE_LEASE_SECONDS", 600))
+    query = (
+        MediaBlob.query
+        .filter(
+            MediaBlob.derivatives_status == "pending",
+            MediaBlob.ref_count > 0,
+            or_(MediaBlob.locked_until.is_(None), MediaBlob.locked_until < now),
+        )
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    blobs = query.all()
+    for blob in blobs:
+        blob.locked_until = now + lease
+    db.session.commit()
+    return blobs
+
+
+def _local_copy(storage, sha256):
+    """(path, is_temporary): the blob itself for local storage, else a downloaded copy."""
+    path = storage.local_path(sha256)
+    if path:
+        return path, False
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, "wb") as f, storage.open(sha256) as src:
+        shutil.copyfileobj(src, f)
+    return path, True
+
+
+def _stop_pool():
+    """
+    Kill the pool's processes and drop it, so renders that overran their
+    batch stop using CPU; the next batch starts a fresh pool.
+    ProcessPoolExecutor has no public way to stop a running task.
+    """
+    pool = current_app.extensions.pop("derivative_pool", None)
+    if pool is None:
+        return
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_derivatives(batch_size=None):
+    """
+    Render derivatives for one batch of pending blobs in the process pool.
+    The whole batch finishes within MEDIA_DERIVATIVE_TIMEOUT_SECONDS (kept
+    below the lease): renders still running then are failed and stopped,
+    ones not yet started stay pending. Returns how many blobs were handled
+    (0 when idle).
+    """
+    config = current_app.config
+    lease = config.get("MEDIA_DERIVATIVE_LEASE_SECONDS", 600)
+    budget = min(config.get("MEDIA_DERIVATIVE_TIMEOUT_SECONDS", 300), lease * 0.8)
+    blobs = _claim(batch_size or config.get("MEDIA_DERIVATIVE_BATCH_SIZE", 8), datetime.utcnow())
+    if not blobs:
+        return 0
+
+    storage = get_storage()
+    sizes = tuple(config.get("MEDIA_THUMBNAIL_SIZES", DEFAULT_THUMBNAIL_SIZES))
+    ffmpeg = shutil.which(config.get("FFMPEG_BINARY", "ffmpeg"))
+    jobs = []
+    for blob in blobs:
+        if blob.kind not in ("image", "video"):
+            blob.derivatives_status = "unsupported"
+            continue
+        try:
+            source, temporary = _local_copy(storage, blob.sha256)
+        except Exception as e:
+            current_app.logger.warning("Derivatives for %s failed: %s", blob.sha256, e)
+            blob.derivatives_status = "failed"
+            continue
+        future = _pool().submit(render_derivatives, source, derivative_dir(blob.sha256), blob.kind, sizes, ffmpeg)
+        jobs.append((blob, future, source, temporary))
+
+    wait([future for _, future, _, _ in jobs], timeout=budget)
+    overran = False
+    for blob, future, source, temporary in jobs:
+        try:
+            if future.cancel():
+                continue   # never started; stays pending for the next batch
+            if not future.done():
+                overran = True
+                raise TimeoutError(f"still rendering after {budget:.0f}s")
+            blob.derivatives_status, blob.derivatives = future.result()
+            if blob.derivatives_status == "ready":
+                storage.put_derivatives(blob.sha256, blob.derivatives)
+        except Exception as e:
+            current_app.logger.warning("Derivatives for %s failed: %s", blob.sha256, e)
+            blob.derivatives_status = "failed"
+        finally:
+            if temporary and not overran:
+                os.remove(source)
+    if overran:
+        _stop_pool()
+        for _, _, source, temporary in jobs:
+            if temporary and os.path.exists(source):
+                os.remove(source)
+
+    for blob in blobs:
+        blob.locked_until = None
+    db.session.commit()
+    return len(blobs)
+
+
+def derivative_urls(media):
+    """{variant: url} for a Media row's ready derivatives."""
+    blob = media.blob
+    if blob is None or blob.derivatives_status != "ready":
+        return {}
+    return {name: f"/derivatives/{shard_path(blob.sha256)}/{name}" for name in blob.derivatives or ()}
+
+
+def init_derivatives(app):
+    register_worker(app, "derivatives", process_derivatives, app.config.get("MEDIA_DERIVATIVE_POLL_SECONDS", 300))
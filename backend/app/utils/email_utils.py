@@ -0,0 +1,33 @@
+# app/utils/email_utils.py
+from flask import current_app
+from app.utils.mail_queue import queue_email
+
+
+class QueuedEmailBackend:
+    """Bulk e-mail through the outbound mail queue (retries, dead letters, SMTP reuse)."""
+
+    def send_batch(self, recipients, subject, body):
+        for recipient in recipients:
+            queue_email(subject=subject, recipients=[recipient], body=body)
+
+
+class MemoryEmailBackend:
+    """Local stand-in that keeps (recipients, subject, body) in memory."""
+
+    def __init__(self):
+        self.outbox = []
+
+    def send_batch(self, recipients, subject, body):
+        self.outbox.append((list(recipients), subject, body))
+
+
+EMAIL_BACKENDS = {"queue": QueuedEmailBackend, "memory": MemoryEmailBackend}
+
+
+def get_email_backend():
+    """The NOTIFY_EMAIL_BACKEND instance for the current app (one per process)."""
+    backend = current_app.extensions.get("email_backend")
+    if backend is None:
+        name = current_app.config.get("NOTIFY_EMAIL_BACKEND", "queue")
+        backend = current_app.extensions["email_backend"] = EMAIL_BACKENDS[name]()
+    return backend
@@ -0,0 +1,31 @@
+# app/utils/fields.py
+from flask import request
+
+
+def parse_fields(allowed):
+    """
+    Read ?fields=a,b,c from the request. Returns a tuple of names in request
+    order, or None when the parameter is absent. Raises ValueError on names
+    outside `allowed`.
+    """
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    names = tuple(dict.fromkeys(n.strip() for n in raw.split(",") if n.strip()))
+    unknown = [n for n in names if n not in allowed]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return names
+
+
+def select_fields(query, model, fields, required=()):
+    """
+    Narrow the SQL SELECT to `fields` (plus any `required` for ordering or
+    cursors). Rows come back as lightweight tuples, not ORM objects.
+    """
+    names = tuple(dict.fromkeys((*fields, *required)))
+    return query.with_entities(*[getattr(model, n) for n in names])
+
+
+def pick(row, fields):
+    return {f: getattr(row, f) for f in fields}
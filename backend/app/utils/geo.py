@@ -0,0 +1,179 @@
+# app/utils/geo.py
+import math
+from sqlalchemy import and_, or_
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9          # ~5m cells, stored on Incident.geohash
+MAX_COVER_CELLS = 32           # upper bound on prefixes used per viewport query
+METERS_PER_DEGREE = 111320.0
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given length."""
+    total = 5 * precision
+    lat_bits = total // 2
+    lon_bits = total - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Return the geohash prefixes covering a bbox, using the finest precision
+    that needs at most `max_cells` cells. Returns [] when the box is so large
+    that a prefix filter would not narrow anything.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_h, cell_w = _cell_size(precision)
+        rows = range(int((min_lat + 90) // cell_h), int((max_lat + 90) // cell_h) + 1)
+        cols = range(int((min_lon + 180) // cell_w), int((max_lon + 180) // cell_w) + 1)
+        if len(rows) * len(cols) > max_cells:
+            continue
+        cells = set()
+        for r in rows:
+            lat = min(-90 + (r + 0.5) * cell_h, 90.0)
+            for c in cols:
+                lon = min(-180 + (c + 0.5) * cell_w, 180.0)
+                cells.add(geohash_encode(lat, lon, precision))
+        return sorted(cells)
+    return []
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest geohash string greater than every string starting with `prefix`."""
+    stripped = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not stripped:
+        return None
+    nxt = GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(stripped[-1]) + 1]
+    return stripped[:-1] + nxt
+
+
+def prefix_filter(column, prefixes):
+    # Range predicates (not LIKE) so a plain btree index is usable under any collation.
+    clauses = []
+    for p in prefixes:
+        upper = _prefix_upper_bound(p)
+        clauses.append(column >= p if upper is None else and_(column >= p, column < upper))
+    return or_(*clauses)
+
+
+def radius_to_bbox(lat, lon, radius_m):
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return (max(lat - dlat, -90.0), max(lon - dlon, -180.0),
+            min(lat + dlat, 90.0), min(lon + dlon, 180.0))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(a))
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Ray-casting test; `polygon` is a list of [lat, lon] vertices."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+def parse_bbox(value):
+    """Parse "min_lat,min_lon,max_lat,max_lon". Raises ValueError if malformed."""
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    min_lat, min_lon, max_lat, max_lon = parts
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise ValueError("bbox out of range")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def parse_point(value):
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 2 or not (-90 <= parts[0] <= 90 and -180 <= parts[1] <= 180):
+        raise ValueError("near must be lat,lon")
+    return parts[0], parts[1]
+
+
+def within_bbox(query, model, bbox):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    prefixes = geohash_cover(min_lat, min_lon, max_lat, max_lon)
+    if prefixes:
+        query = query.filter(prefix_filter(model.geohash, prefixes))
+    return query.filter(
+        model.latitude.between(min_lat, max_lat),
+        model.longitude.between(min_lon, max_lon),
+    )
+
+
+def within_radius(query, model, lat, lon, radius_m):
+    query = within_bbox(query, model, radius_to_bbox(lat, lon, radius_m))
+    # Equirectangular distance: plain arithmetic, so it runs on SQLite too,
+    # and is accurate to well under 1% at city-scale radii.
+    k = math.cos(math.radians(lat))
+    dlat = model.latitude - lat
+    dlon = (model.longitude - lon) * k
+    limit = radius_m / METERS_PER_DEGREE
+    return query.filter(dlat * dlat + dlon * dlon <= limit * limit)
+
+
+def apply_geo_filters(query, model, args):
+    """
+    Apply ?bbox= and ?near=lat,lon&radius_m= from request args.
+    Raises ValueError with a client-facing message on bad input.
+    """
+    if args.get("bbox"):
+        try:
+            bbox = parse_bbox(args["bbox"])
+        except ValueError as e:
+            raise ValueError(f"Invalid bbox: {e}")
+        query = within_bbox(query, model, bbox)
+    if args.get("near"):
+        try:
+            lat, lon = parse_point(args["near"])
+            radius_m = float(args.get("radius_m", 1000))
+        except ValueError as e:
+            raise ValueError(f"Invalid near/radius_m: {e}")
+        if radius_m <= 0:
+            raise ValueError("radius_m must be positive")
+        query = within_radius(query, model, lat, lon, radius_m)
+    return query
@@ -0,0 +1,169 @@
+# app/utils/heatmap.py
+import math
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from app.models import Incident
+from app.utils.geo import within_bbox
+
+GRID_SIZE = 64                # bins per tile side
+MAX_HEATMAP_ZOOM = 18
+DEFAULT_CACHE_SIZE = 2048     # tiles per process
+DEFAULT_CACHE_TTL = 300       # seconds; bounds staleness if an invalidation is missed
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_bbox(z, x, y):
+    """(min_lat, min_lon, max_lat, max_lon) of a slippy-map tile."""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for(lat, lon, z):
+    n = 1 << z
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def bin_points(lats, lons, z, x, y, size=GRID_SIZE):
+    """Vectorised mercator binning of points into a size x size count grid (row 0 = north)."""
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lons = np.asarray(lons, dtype=np.float64)
+    scale = (1 << z) * size
+    px = (lons + 180.0) / 360.0 * scale - x * size
+    py = (1.0 - np.arcsinh(np.tan(np.radians(lats))) / np.pi) / 2.0 * scale - y * size
+    col = np.clip(px.astype(np.int64), 0, size - 1)
+    row = np.clip(py.astype(np.int64), 0, size - 1)
+    counts = np.bincount(row * size + col, minlength=size * size)
+    return counts.reshape(size, size)
+
+
+def compute_tile(z, x, y, status=None, since=None, until=None):
+    query = within_bbox(Incident.query, Incident, tile_bbox(z, x, y))
+    if status:
+        query = query.filter(Incident.status == status)
+    if since:
+        query = query.filter(Incident.created_at >= since)
+    if until:
+        query = query.filter(Incident.created_at < until)
+    rows = query.with_entities(Incident.latitude, Incident.longitude).all()
+    if not rows:
+        return np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.int64)
+    lats, lons = zip(*rows)
+    return bin_points(lats, lons, z, x, y)
+
+
+def encode_binary(grid):
+    """Row-major little-endian uint16 counts (saturating at 65535)."""
+    return np.minimum(grid, 0xFFFF).astype("<u2").tobytes()
+
+
+def encode_png(grid):
+    """8-bit greyscale PNG, intensity scaled to the tile's peak count."""
+    peak = int(grid.max())
+    pixels = (grid * (255.0 / peak)).astype(np.uint8) if peak else np.zeros(grid.shape, np.uint8)
+    height, width = pixels.shape
+    raw = b"".join(b"\x00" + pixels[r].tobytes() for r in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+class TileCache:
+    """
+    Per-process LRU of computed grids. Keys start with (z, x, y); a side
+    index maps each tile to its cached filter variants so a change can
+    evict exactly the tiles that contain it. Entries also expire after
+    `ttl` seconds, and everything is dropped if the hub reports lost
+    events, since invalidations were lost with them.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._grids = OrderedDict()
+        self._by_tile = {}
+        self._generation = 0
+        self._attached = False
+
+    @property
+    def generation(self):
+        """Bumped on every invalidation; guards against caching a grid computed before it."""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._grids.get(key)
+            if entry is None:
+                return None
+            grid, expires = entry
+            if expires <= time.monotonic():
+                del self._grids[key]
+                self._forget(key)
+                return None
+            self._grids.move_to_end(key)
+            return grid
+
+    def put(self, key, grid, generation):
+        with self._lock:
+            if self._generation != generation:
+                return   # incidents changed while this grid was being computed
+            self._grids[key] = (grid, time.monotonic() + self.ttl)
+            self._grids.move_to_end(key)
+            self._by_tile.setdefault(key[:3], set()).add(key)
+            while len(self._grids) > self.max_size:
+                old, _ = self._grids.popitem(last=False)
+                self._forget(old)
+
+    def _forget(self, key):
+        variants = self._by_tile.get(key[:3])
+        if variants:
+            variants.discard(key)
+            if not variants:
+                del self._by_tile[key[:3]]
+
+    def invalidate_point(self, lat, lon):
+        """Drop every cached tile, at every zoom, that contains the point."""
+        with self._lock:
+            self._generation += 1
+            for z in range(MAX_HEATMAP_ZOOM + 1):
+                x, y = tile_for(lat, lon, z)
+                for key in self._by_tile.pop((z, x, y), ()):
+                    self._grids.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._grids.clear()
+            self._by_tile.clear()
+
+    def handle_event(self, evt):
+        if not evt.get("type", "").startswith("incident."):
+            return
+        for lat_key, lon_key in (("latitude", "longitude"), ("previous_latitude", "previous_longitude")):
+            if evt.get(lat_key) is not None and evt.get(lon_key) is not None:
+                self.invalidate_point(evt[lat_key], evt[lon_key])
+
+    def attach(self, hub):
+        """Evict on hub events in every worker, without taking an SSE connection slot."""
+        with self._lock:
+            if self._attached:
+                return
+            self._attached = True
+        # Lost events mean lost invalidations
+        hub.add_listener(self.handle_event, self.clear)
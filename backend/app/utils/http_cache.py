@@ -0,0 +1,62 @@
+# app/utils/http_cache.py
+import hashlib
+import json
+from datetime import timezone
+from flask import request, make_response
+from sqlalchemy import func
+
+
+class CacheValidators:
+    """
+    Weak ETag / Last-Modified for a collection, derived from one aggregate
+    query: max(updated_at), count and max(id) of the rows in `query`.
+    The request path and query string are mixed in so each view (filters,
+    page, limit...) gets its own tag. `extra` is a list of further
+    (query, model) pairs whose rows are embedded in the response.
+    """
+
+    def __init__(self, query, model, extra=()):
+        parts = [request.full_path]
+        newest = None
+        for i, (q, m) in enumerate([(query, model), *extra]):
+            last_modified, count, max_id = q.with_entities(
+                func.max(m.updated_at), func.count(m.id), func.max(m.id)
+            ).order_by(None).one()
+            if i == 0:
+                self.count = count
+            if last_modified and (newest is None or last_modified > newest):
+                newest = last_modified
+            parts.append(f"{last_modified}|{count}|{max_id}")
+        self.last_modified = newest.replace(tzinfo=timezone.utc, microsecond=0) if newest else None
+        self.etag = hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+    @classmethod
+    def for_payload(cls, payload):
+        """
+        Validators hashed from a response body built in memory, for views
+        whose source of truth is not a table (no query, no Last-Modified).
+        """
+        validators = cls.__new__(cls)
+        validators.count = None
+        validators.last_modified = None
+        body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        validators.etag = hashlib.sha1(f"{request.full_path}|{body}".encode()).hexdigest()[:20]
+        return validators
+
+    def not_modified(self):
+        """Return a 304 response if the client's copy is current, else None."""
+        if request.if_none_match:
+            fresh = request.if_none_match.contains_weak(self.etag)
+        elif request.if_modified_since and self.last_modified:
+            fresh = self.last_modified <= request.if_modified_since
+        else:
+            fresh = False
+        if not fresh:
+            return None
+        return self.apply(make_response("", 304))
+
+    def apply(self, response):
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+        return response
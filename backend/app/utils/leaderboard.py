@@ -0,0 +1,315 @@
+# app/utils/leaderboard.py
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import User, UserDeletion
+from app.utils.changes import ensure_active_history, tracked_changes
+
+DEFAULT_SYNC_SECONDS = 2
+DEFAULT_SYNC_LAG_SECONDS = 60
+PENDING_POINTS_KEY = "pending_points_changes"
+
+
+class PointsRanking:
+    """
+    Order-statistic structure over (points desc, id asc).
+
+    A Fenwick tree counts users per distinct points value, indexed by a
+    slot per value in value order, so "how many users are ahead" and
+    "which value holds position k" are O(log D) for D distinct values
+    however large the points get. Users sharing a value sit in an
+    id-sorted bucket.
+
+    Rebuilds leave free slots between values (up to SLOT_GAP, never more
+    than the integers in between) and above the highest value, so a new
+    value normally takes a free slot in O(D) memmove at worst; only when
+    its neighbours are packed is the tree rebuilt, in O(D).
+    """
+
+    SLOT_GAP = 4
+
+    def __init__(self):
+        self._values = []       # sorted values that own a slot
+        self._slots = {}        # value -> tree index
+        self._slot_values = [None]   # tree index -> value
+        self._tree = [0]
+        self._buckets = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    # Fenwick helpers
+    def _add(self, value, delta):
+        i = self._slots[value]
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, value):
+        """Number of users with points <= value."""
+        i = bisect.bisect_right(self._values, value)
+        if i == 0:
+            return 0
+        i, total = self._slots[self._values[i - 1]], 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _kth_smallest_value(self, k):
+        pos, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return self._slot_values[pos + 1]
+
+    def _rebuild(self, extra=None):
+        """Re-slot the held values (plus `extra`) with free gaps and rebuild the tree."""
+        values = [v for v in self._values if v in self._buckets]
+        if extra is not None and extra not in self._slots:
+            bisect.insort(values, extra)
+        slots, slot_values, counts, prev = {}, [None], [0], None
+        for value in values:
+            gap = self.SLOT_GAP if prev is None else min(self.SLOT_GAP, value - prev - 1)
+            slot_values += [None] * gap
+            counts += [0] * gap
+            slots[value] = len(slot_values)
+            slot_values.append(value)
+            counts.append(len(self._buckets.get(value, ())))
+            prev = value
+        headroom = len(values) // 2 + self.SLOT_GAP
+        slot_values += [None] * headroom
+        counts += [0] * headroom
+        for i in range(1, len(counts)):
+            parent = i + (i & -i)
+            if parent < len(counts):
+                counts[parent] += counts[i]
+        self._values, self._slots, self._slot_values, self._tree = values, slots, slot_values, counts
+
+    def _take_slot(self, value):
+        """Give `value` a free slot between its neighbours; False if there is none."""
+        i = bisect.bisect_left(self._values, value)
+        lo = self._slots[self._values[i - 1]] if i else 0
+        hi = self._slots[self._values[i]] if i < len(self._values) else len(self._slot_values)
+        if hi - lo < 2:
+            return False
+        if i == len(self._values):
+            slot = lo + 1            # points mostly grow; keep the headroom for later values
+        elif i == 0:
+            slot = hi - 1
+        else:
+            below, above = self._values[i - 1], self._values[i]
+            slot = lo + max(1, min(hi - lo - 1, (value - below) * (hi - lo) // (above - below)))
+        if self._slot_values[slot] is not None:
+            return False
+        self._values.insert(i, value)
+        self._slots[value] = slot
+        self._slot_values[slot] = value
+        return True
+
+    @classmethod
+    def build(cls, rows):
+        """Ranking over (user_id, points) rows, building the tree once."""
+        ranking = cls()
+        for user_id, points in rows:
+            points = max(points or 0, 0)
+            ranking._points[user_id] = points
+            ranking._buckets.setdefault(points, []).append(user_id)
+        for bucket in ranking._buckets.values():
+            bucket.sort()
+        ranking._values = sorted(ranking._buckets)
+        ranking._rebuild()
+        return ranking
+
+    def update(self, changes):
+        """Apply (user_id, points) changes; points None removes the user."""
+        for user_id, points in changes:
+            if points is not None:
+                points = max(points, 0)
+            old = self._points.get(user_id)
+            if old == points:
+                continue
+            if old is not None:
+                del self._points[user_id]
+                bucket = self._buckets[old]
+                del bucket[bisect.bisect_left(bucket, user_id)]
+                if not bucket:
+                    del self._buckets[old]
+                self._add(old, -1)
+            if points is None:
+                continue
+            bisect.insort(self._buckets.setdefault(points, []), user_id)
+            self._points[user_id] = points
+            if points in self._slots or self._take_slot(points):
+                self._add(points, 1)
+            else:
+                self._rebuild(points)   # counts come from the buckets
+
+    def set(self, user_id, points):
+        self.update([(user_id, points or 0)])
+
+    def remove(self, user_id):
+        self.update([(user_id, None)])
+
+    def points(self, user_id):
+        return self._points.get(user_id)
+
+    def rank(self, user_id):
+        """Competition rank (1 + users with more points), or None if unknown."""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return len(self) - self._prefix(points) + 1
+
+    def position(self, user_id):
+        """1-based position in (points desc, id asc) order."""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return self.rank(user_id) + bisect.bisect_left(self._buckets[points], user_id)
+
+    def at(self, position):
+        """(user_id, points) at a 1-based position."""
+        value = self._kth_smallest_value(len(self) - position + 1)
+        ahead = len(self) - self._prefix(value)
+        return self._buckets[value][position - ahead - 1], value
+
+    def range(self, start, stop):
+        """Entries at positions start..stop inclusive, clipped to the board."""
+        start, stop = max(start, 1), min(stop, len(self))
+        return [(pos, *self.at(pos)) for pos in range(start, stop + 1)]
+
+
+class Leaderboard:
+    """
+    Per-process PointsRanking kept current from two sources: commits in
+    this process (applied straight away) and a periodic catch-up on
+    users whose indexed updated_at moved, and on user_deletion rows, for
+    writes in other workers.
+
+    updated_at is stamped at flush, before commit, so a row can become
+    visible with a timestamp below the watermark; each catch-up re-reads
+    `lag` seconds behind it. Queries run outside the ranking lock, which
+    is only held to swap in a new ranking or apply a batch of changes.
+    """
+
+    def __init__(self, sync_seconds=DEFAULT_SYNC_SECONDS, lag_seconds=DEFAULT_SYNC_LAG_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.lag = timedelta(seconds=lag_seconds)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._ranking = None
+        self._synced_at = 0.0
+        self._watermark = None
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._ranking is not None and now - self._synced_at < self.sync_seconds:
+            return
+        # One thread syncs; once a ranking exists the others serve it as is.
+        if not self._sync_lock.acquire(blocking=self._ranking is None):
+            return
+        try:
+            if self._ranking is not None and now - self._synced_at < self.sync_seconds:
+                return
+            query = User.query.with_entities(User.id, User.points, User.updated_at)
+            watermark = self._watermark
+            if self._ranking is None:
+                rows = query.all()
+                changes = []
+            else:
+                # Re-read the overlap window; updates are idempotent.
+                since = watermark - self.lag if watermark else None
+                rows = query.filter(User.updated_at >= since).all() if since else query.all()
+                deleted = UserDeletion.query.with_entities(UserDeletion.user_id)
+                if since:
+                    deleted = deleted.filter(UserDeletion.deleted_at >= since)
+                changes = [(user_id, None) for user_id, in deleted]
+            for _, _, updated_at in rows:
+                if updated_at and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+            changes += [(user_id, points or 0) for user_id, points, _ in rows]
+
+            if self._ranking is None:
+                ranking = PointsRanking.build((user_id, points) for user_id, points in changes)
+                with self._lock:
+                    self._ranking = ranking
+            else:
+                with self._lock:
+                    self._ranking.update(changes)
+            self._watermark, self._synced_at = watermark, now
+        finally:
+            self._sync_lock.release()
+
+    def apply(self, changes):
+        with self._lock:
+            if self._ranking is not None:
+                self._ranking.update(changes)
+
+    def top(self, n):
+        self._sync()
+        with self._lock:
+            return self._ranking.range(1, n)
+
+    def rank(self, user_id):
+        self._sync()
+        with self._lock:
+            return self._ranking.rank(user_id)
+
+    def around(self, user_id, k):
+        """(rank, points, neighbours) for a user, or None if unknown."""
+        self._sync()
+        with self._lock:
+            ranking = self._ranking
+            position = ranking.position(user_id)
+            if position is None:
+                return None
+            return ranking.rank(user_id), ranking.points(user_id), ranking.range(position - k, position + k)
+
+
+def _after_flush(session, flush_context):
+    pending, deleted = session.info.setdefault(PENDING_POINTS_KEY, []), []
+    for op, user, old in tracked_changes(session, User, ("points",)):
+        if op == "delete":
+            pending.append((user.id, None))
+            deleted.append({"user_id": user.id, "deleted_at": datetime.utcnow()})
+        elif op == "create" or old["points"] != user.points:
+            pending.append((user.id, user.points or 0))
+    if deleted:
+        session.connection().execute(UserDeletion.__table__.insert(), deleted)
+
+
+def record_points_change(session, user_id, points):
+    """Queue a points change made outside the ORM (e.g. a Core UPDATE) for after_commit."""
+    session.info.setdefault(PENDING_POINTS_KEY, []).append((user_id, points))
+
+
+def _after_commit(session):
+    changes = session.info.pop(PENDING_POINTS_KEY, None)
+    if changes and has_app_context() and "leaderboard" in current_app.extensions:
+        current_app.extensions["leaderboard"].apply(changes)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(PENDING_POINTS_KEY, None)
+
+
+def init_leaderboard(app):
+    app.extensions["leaderboard"] = Leaderboard(
+        app.config.get("LEADERBOARD_SYNC_SECONDS", DEFAULT_SYNC_SECONDS),
+        app.config.get("LEADERBOARD_SYNC_LAG_SECONDS", DEFAULT_SYNC_LAG_SECONDS),
+    )
+    ensure_active_history(User, ("points",))
+    for name, fn in (("after_flush", _after_flush),
+                     ("after_commit", _after_commit),
+                     ("after_soft_rollback", _after_rollback)):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
@@ -0,0 +1,128 @@
+# app/utils/mail_queue.py
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import or_
+from app.extensions import db, mail
+from app.models import OutboundEmail
+from app.utils.workers import register_worker, wake_after_commit
+
+
+def queue_email(subject, recipients, body, sender=None):
+    """
+    Add a message to the outbox in the current session. It is sent by the
+    background worker once the caller commits; a rollback discards it.
+    """
+    entry = OutboundEmail(
+        subject=subject,
+        recipients=",".join(recipients),
+        body=body,
+        sender=sender,
+    )
+    db.session.add(entry)
+    wake_after_commit(db.session, "mail")
+    return entry
+
+
+def _backoff(attempts):
+    base = current_app.config.get("MAIL_RETRY_BASE_SECONDS", 30)
+    cap = current_app.config.get("MAIL_RETRY_MAX_SECONDS", 3600)
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)))
+
+
+def _claim(batch_size, now):
+    """Lease a batch of due messages so concurrent workers skip them."""
+    lease = timedelta(seconds=current_app.config.get("MAIL_LEASE_SECONDS", 300))
+    query = (
+        OutboundEmail.query
+        .filter(
+            OutboundEmail.status == "pending",
+            OutboundEmail.next_attempt_at <= now,
+            or_(OutboundEmail.locked_until.is_(None), OutboundEmail.locked_until < now),
+        )
+        .order_by(OutboundEmail.id)
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    rows = query.all()
+    for row in rows:
+        row.locked_until = now + lease
+    db.session.commit()
+    return rows
+
+
+def _to_message(row):
+    return Message(
+        subject=row.subject,
+        recipients=row.recipients.split(","),
+        body=row.body,
+        sender=row.sender or current_app.config.get("MAIL_DEFAULT_SENDER"),
+    )
+
+
+def _record_failure(row, error, now):
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    row.locked_until = None
+    if row.attempts >= current_app.config.get("MAIL_MAX_ATTEMPTS", 6):
+        row.status = "dead"
+    else:
+        row.next_attempt_at = now + _backoff(row.attempts)
+
+
+def deliver_pending(batch_size=None):
+    """
+    Send one batch of due messages over a single SMTP connection.
+    Returns (sent, failed).
+    """
+    batch_size = batch_size or current_app.config.get("MAIL_BATCH_SIZE", 50)
+    now = datetime.utcnow()
+    rows = _claim(batch_size, now)
+    if not rows:
+        return 0, 0
+
+    sent = failed = 0
+    try:
+        with mail.connect() as conn:
+            for row in rows:
+                try:
+                    conn.send(_to_message(row))
+                except Exception as e:
+                    _record_failure(row, e, now)
+                    failed += 1
+                else:
+                    row.status = "sent"
+                    row.sent_at = datetime.utcnow()
+                    row.locked_until = None
+                    sent += 1
+    except Exception as e:
+        # Connect/login/QUIT failed: everything not yet marked sent is retried
+        for row in rows:
+            if row.status == "pending" and row.locked_until is not None:
+                _record_failure(row, e, now)
+                failed += 1
+    db.session.commit()
+    return sent, failed
+
+
+def requeue_dead(ids=None):
+    """Move dead letters back to the outbox for another round of attempts."""
+    query = OutboundEmail.query.filter(OutboundEmail.status == "dead")
+    if ids:
+        query = query.filter(OutboundEmail.id.in_(ids))
+    count = query.update(
+        {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow(), "locked_until": None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return count
+
+
+def _drain_mail():
+    sent, failed = deliver_pending()
+    return sent or failed
+
+
+def init_mail_queue(app):
+    register_worker(app, "mail", _drain_mail, app.config.get("MAIL_POLL_SECONDS", 30))
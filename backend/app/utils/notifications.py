@@ -0,0 +1,159 @@
+# app/utils/notifications.py
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import AreaSubscription, Incident, IncidentAlert, SubscriptionCell, User
+from app.utils.changes import tracked_changes
+from app.utils.email_utils import get_email_backend
+from app.utils.geo import GEOHASH_PRECISION, geohash_cover, geohash_encode, haversine_m, point_in_polygon, radius_to_bbox
+from app.utils.sms_utils import get_sms_backend
+from app.utils.workers import register_worker, wake_after_commit
+
+SUBSCRIPTION_MAX_CELLS = 16     # cover cells per subscription; larger areas use coarser cells
+MAX_POLYGON_VERTICES = 200
+
+
+def subscription_cells(sub):
+    """Geohash cells covering a subscription's bbox ("" when it covers most of the globe)."""
+    if sub.polygon:
+        lats = [p[0] for p in sub.polygon]
+        lons = [p[1] for p in sub.polygon]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+    else:
+        bbox = radius_to_bbox(sub.latitude, sub.longitude, sub.radius_m)
+    return geohash_cover(*bbox, max_cells=SUBSCRIPTION_MAX_CELLS) or [""]
+
+
+def index_subscription(sub):
+    sub.cells = [SubscriptionCell(cell=cell) for cell in subscription_cells(sub)]
+
+
+def _contains(row, lat, lon):
+    if row.polygon:
+        return point_in_polygon(lat, lon, row.polygon)
+    return haversine_m(lat, lon, row.latitude, row.longitude) <= row.radius_m
+
+
+def matching_subscribers(lat, lon, after_id=0, limit=500):
+    """
+    Subscriptions whose area contains the point, in id order after `after_id`.
+    Candidates come from the cell index (every prefix of the point's geohash),
+    then get an exact radius/polygon check. Returns (rows, last_candidate_id).
+    """
+    point_hash = geohash_encode(lat, lon, GEOHASH_PRECISION)
+    prefixes = [point_hash[:n] for n in range(GEOHASH_PRECISION + 1)]
+    # Ids first, straight off the cell index, so the planner cannot choose to
+    # walk every subscription in id order instead.
+    ids = [
+        sub_id for (sub_id,) in
+        db.session.query(SubscriptionCell.subscription_id)
+        .filter(SubscriptionCell.cell.in_(prefixes), SubscriptionCell.subscription_id > after_id)
+        .order_by(SubscriptionCell.subscription_id)
+        .limit(limit)
+    ]
+    if not ids:
+        return [], after_id
+    candidates = (
+        db.session.query(
+            AreaSubscription.id, AreaSubscription.user_id, AreaSubscription.channel,
+            AreaSubscription.latitude, AreaSubscription.longitude, AreaSubscription.radius_m,
+            AreaSubscription.polygon, User.email, User.phone,
+        )
+        .join(User, User.id == AreaSubscription.user_id)
+        .filter(AreaSubscription.id.in_(ids))
+        .order_by(AreaSubscription.id)
+        .all()
+    )
+    last_id = ids[-1]
+    return [row for row in candidates if _contains(row, lat, lon)], last_id
+
+
+def _claim_alert(now):
+    lease = timedelta(seconds=current_app.config.get("NOTIFY_LEASE_SECONDS", 300))
+    query = (
+        IncidentAlert.query
+        .filter(
+            IncidentAlert.status == "pending",
+            or_(IncidentAlert.locked_until.is_(None), IncidentAlert.locked_until < now),
+        )
+        .order_by(IncidentAlert.created_at)
+        .limit(1)
+    )
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    alert = query.first()
+    if alert is not None:
+        alert.locked_until = now + lease
+    db.session.commit()
+    return alert
+
+
+def deliver_alerts():
+    """
+    Send one batch of one pending incident alert. Progress is stored on the
+    alert (deleted once every subscriber is done), so a crash or a failing
+    backend only repeats the current batch, once the lease runs out. After
+    NOTIFY_MAX_ATTEMPTS failures in a row the alert is marked "dead".
+    Returns False when idle.
+    """
+    alert = _claim_alert(datetime.utcnow())
+    if alert is None:
+        return False
+
+    incident = db.session.get(Incident, alert.incident_id)
+    batch_size = current_app.config.get("NOTIFY_BATCH_SIZE", 500)
+    rows, last_id = [], alert.last_subscription_id
+    if incident is not None:
+        rows, last_id = matching_subscribers(incident.latitude, incident.longitude,
+                                             alert.last_subscription_id, batch_size)
+
+    try:
+        if rows:
+            _send_alert(incident, rows)
+    except Exception as e:
+        db.session.rollback()   # nothing queued by a half-sent batch survives
+        current_app.logger.warning("Alert for incident %s failed: %s", alert.incident_id, e)
+        alert.attempts += 1
+        alert.last_error = str(e)[:1000]
+        if alert.attempts >= current_app.config.get("NOTIFY_MAX_ATTEMPTS", 5):
+            alert.status = "dead"
+            alert.locked_until = None
+        db.session.commit()
+        return True
+
+    if incident is None or last_id == alert.last_subscription_id:
+        db.session.delete(alert)
+    else:
+        alert.last_subscription_id = last_id
+        alert.attempts = 0
+        alert.locked_until = None
+    db.session.commit()
+    return True
+
+
+def _send_alert(incident, rows):
+    rows = [r for r in rows if r.user_id != incident.created_by]
+    text = f"Ajali alert: {incident.title} reported near you ({incident.latitude:.4f}, {incident.longitude:.4f})."
+    emails = sorted({r.email for r in rows if r.channel == "email" and r.email})
+    phones = sorted({r.phone for r in rows if r.channel == "sms" and r.phone})
+    if emails:
+        get_email_backend().send_batch(emails, f"Incident near you: {incident.title}", text)
+    if phones:
+        get_sms_backend().send_batch(phones, text)
+
+
+def _after_flush(session, flush_context):
+    rows = [{"incident_id": obj.id, "last_subscription_id": 0, "status": "pending", "attempts": 0,
+             "created_at": datetime.utcnow()}
+            for op, obj, old in tracked_changes(session, Incident, ()) if op == "create"]
+    if rows:
+        session.connection().execute(IncidentAlert.__table__.insert(), rows)
+        wake_after_commit(session, "alerts")
+
+
+def init_notifications(app):
+    register_worker(app, "alerts", deliver_alerts, app.config.get("NOTIFY_POLL_SECONDS", 30))
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
@@ -0,0 +1,69 @@
+# app/utils/pagination.py
+import base64
+from datetime import datetime
+from flask import request
+from sqlalchemy import DateTime, and_, func, literal, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows from before created_at had a default hold NULL; they page as the epoch.
+EPOCH = datetime(1970, 1, 1)
+
+
+def created_key(created_at):
+    """Sort key for a created_at column; matches the keyset expression indexes."""
+    return func.coalesce(created_at, literal(EPOCH, DateTime))
+
+
+def encode_cursor(created_at, row_id):
+    raw = f"{(created_at or EPOCH).isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from an opaque cursor, or None if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_limit():
+    """Read ?limit= from the request, clamped to MAX_PAGE_SIZE."""
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_filter(query, model, cursor):
+    """Restrict `query` to rows strictly after `cursor` in (created_at, id) order."""
+    created_at, row_id = cursor
+    key = created_key(model.created_at)
+    return query.filter(
+        or_(
+            key > created_at,
+            and_(key == created_at, model.id > row_id),
+        )
+    )
+
+
+def paginate_keyset(query, model, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page ordered by (created_at, id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if after is not None:
+        query = keyset_filter(query, model, after)
+    rows = query.order_by(created_key(model.created_at), model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
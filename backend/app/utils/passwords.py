@@ -0,0 +1,42 @@
+# app/utils/passwords.py
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"   # werkzeug's default scrypt cost
+DEFAULT_SALT_LENGTH = 16
+
+
+def canonical_method(method):
+    """Spell out werkzeug's implicit defaults so stored and configured methods compare equal."""
+    parts = method.split(":")
+    if parts[0] == "scrypt" and len(parts) == 1:
+        return "scrypt:32768:8:1"
+    if parts[0] == "pbkdf2":
+        algo = parts[1] if len(parts) > 1 else "sha256"
+        iterations = parts[2] if len(parts) > 2 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f"pbkdf2:{algo}:{iterations}"
+    return method
+
+
+def configured_method():
+    method = DEFAULT_HASH_METHOD
+    if has_app_context():
+        method = current_app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_HASH_METHOD
+    return canonical_method(method)
+
+
+def hash_password(password, method=None):
+    salt_length = DEFAULT_SALT_LENGTH
+    if has_app_context():
+        salt_length = current_app.config.get("PASSWORD_SALT_LENGTH", DEFAULT_SALT_LENGTH)
+    return generate_password_hash(password, method=method or configured_method(), salt_length=salt_length)
+
+
+def verify_password(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when the stored hash was made with a different method or cost than configured."""
+    stored = password_hash.split("$", 1)[0]
+    return canonical_method(stored) != configured_method()
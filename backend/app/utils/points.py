@@ -0,0 +1,101 @@
+# app/utils/points.py
+from datetime import datetime
+from sqlalchemy import func
+from app.extensions import db
+from app.models import PointsLedgerEntry, User
+from app.utils.leaderboard import record_points_change
+from app.utils.security import evict_user
+
+
+def adjust_points(user_id, delta, reason, require_balance=True):
+    """
+    Atomically add `delta` to a user's balance and append a ledger entry.
+
+    The balance changes with one conditional UPDATE (points + delta >= 0
+    when `require_balance`), so concurrent redemptions can never overdraw
+    and no row lock is held across a read-modify-write. Returns the new
+    balance, or None if the user is unknown or the balance is too low.
+    The caller commits.
+    """
+    table = User.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == user_id)
+        .values(points=func.coalesce(table.c.points, 0) + delta, updated_at=datetime.utcnow())
+        .returning(table.c.points)
+    )
+    if require_balance and delta < 0:
+        stmt = stmt.where(func.coalesce(table.c.points, 0) >= -delta)
+    balance = db.session.execute(stmt).scalar()
+    if balance is None:
+        return None
+
+    db.session.add(PointsLedgerEntry(user_id=user_id, delta=delta, reason=reason[:120]))
+    record_points_change(db.session, user_id, balance)
+    evict_user(user_id)
+    return balance
+
+
+def compact_ledger(session, before):
+    """
+    Fold each user's entries older than `before` into one "compacted" entry.
+    Balances are unaffected; the ledger just gets shorter.
+    """
+    old = session.query(
+        PointsLedgerEntry.user_id, func.sum(PointsLedgerEntry.delta), func.count(PointsLedgerEntry.id)
+    ).filter(PointsLedgerEntry.created_at < before).group_by(PointsLedgerEntry.user_id).all()
+    folded = 0
+    for user_id, total, count in old:
+        if count < 2:
+            continue
+        session.query(PointsLedgerEntry).filter(
+            PointsLedgerEntry.user_id == user_id, PointsLedgerEntry.created_at < before
+        ).delete(synchronize_session=False)
+        session.add(PointsLedgerEntry(user_id=user_id, delta=int(total), reason="compacted", created_at=before))
+        folded += count
+    session.commit()
+    return folded
+
+
+def _ledger_sum(session, user_id):
+    return int(session.query(func.coalesce(func.sum(PointsLedgerEntry.delta), 0))
+               .filter(PointsLedgerEntry.user_id == user_id).scalar())
+
+
+def reconcile_ledger(session, fix=False):
+    """
+    Compare every balance with the sum of its ledger. Returns a list of
+    (user_id, balance, ledger_sum). With `fix`, append "adjustment" entries
+    so the ledger matches the balance, which is the source of truth (this
+    also seeds opening balances that predate the ledger).
+
+    Balances and sums come from one statement, so both are read from the
+    same snapshot. Each mismatch is checked again with the user row locked
+    (adjust_points() updates that row first) before it is adjusted, so a
+    redemption committing mid-run is never mistaken for drift.
+    """
+    sums = (
+        session.query(PointsLedgerEntry.user_id, func.sum(PointsLedgerEntry.delta).label("total"))
+        .group_by(PointsLedgerEntry.user_id)
+        .subquery()
+    )
+    balance, ledger_sum = func.coalesce(User.points, 0), func.coalesce(sums.c.total, 0)
+    mismatches = [
+        (user_id, int(b), int(total)) for user_id, b, total in
+        session.query(User.id, balance, ledger_sum)
+        .outerjoin(sums, sums.c.user_id == User.id)
+        .filter(balance != ledger_sum)
+        .order_by(User.id)
+    ]
+    if not fix:
+        return mismatches
+
+    verified = []
+    for user_id, _, _ in mismatches:
+        points = session.query(User.points).filter(User.id == user_id).with_for_update().scalar() or 0
+        total = _ledger_sum(session, user_id)
+        if points != total:
+            session.add(PointsLedgerEntry(user_id=user_id, delta=points - total, reason="adjustment"))
+            verified.append((user_id, points, total))
+        session.commit()
+    return verified
@@ -0,0 +1,243 @@
+# app/utils/pubsub.py
+import json
+import queue
+import select
+import threading
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy.engine import make_url
+from app.models import ChangeLogEntry
+
+CHANNEL = "incident_events"
+REPLAY_BUFFER_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    def __init__(self, hub):
+        self.hub = hub
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False   # set when events were dropped; the reader resets it
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class InMemoryHub:
+    """
+    Fan-out of events to the subscribers in this process, with a short
+    replay buffer for Last-Event-ID. Also serves as the local delivery
+    layer of PostgresHub.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=REPLAY_BUFFER_SIZE)
+        # Event ids have gaps (changes with no event, rolled-back inserts) and
+        # may arrive out of order, so completeness is tracked explicitly: ids at
+        # or below _floor predate this hub, and _evicted is the highest id
+        # pushed out of the replay buffer.
+        self._floor = None
+        self._evicted = 0
+        self._listeners = []   # in-process (on_event, on_reset) hooks; not SSE readers
+
+    def add_listener(self, on_event, on_reset):
+        """
+        Call on_event(evt) for every delivered event and on_reset() when
+        events were lost. For in-process caches: listeners run on the
+        delivering thread and do not count toward the subscriber limit.
+        """
+        with self._lock:
+            self._listeners.append((on_event, on_reset))
+
+    def publish(self, events):
+        self._deliver(events)
+
+    def _deliver(self, events):
+        if not events:
+            return
+        with self._lock:
+            if self._floor is None:
+                self._floor = min(e["id"] for e in events) - 1
+            for evt in events:
+                if len(self._recent) == self._recent.maxlen:
+                    self._evicted = max(self._evicted, self._recent[0]["id"])
+                self._recent.append(evt)
+            subscribers, listeners = list(self._subscribers), list(self._listeners)
+        for on_event, _ in listeners:
+            try:
+                for evt in events:
+                    on_event(evt)
+            except Exception:
+                if self.logger:
+                    self.logger.exception("Event listener failed")
+        for sub in subscribers:
+            for evt in events:
+                try:
+                    sub.queue.put_nowait(evt)
+                except queue.Full:
+                    # A stalled reader must not block publishers; it is told
+                    # through `overflowed` that it missed events.
+                    sub.overflowed = True
+
+    def _events_lost(self, floor=None):
+        """
+        Events may have been dropped before reaching this hub: nothing at or
+        below `floor` can be replayed any more (unknown if None), and every
+        live reader is told to resync.
+        """
+        with self._lock:
+            self._floor = None if floor is None else max(self._floor or 0, floor)
+            subscribers, listeners = list(self._subscribers), list(self._listeners)
+        for sub in subscribers:
+            sub.overflowed = True
+        for _, on_reset in listeners:
+            on_reset()
+
+    def start_after(self, event_id):
+        """Declare that every event after `event_id` will reach this hub (first call wins)."""
+        with self._lock:
+            if self._floor is None:
+                self._floor = event_id
+
+    def subscribe(self, limit=None):
+        """A new Subscription, or None if `limit` subscribers are already connected."""
+        sub = Subscription(self)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def replay(self, after_id):
+        """
+        Buffered events with id > after_id. The second value is False when
+        events after `after_id` may have been missed: evicted from the
+        buffer, or published before this hub started listening.
+        """
+        with self._lock:
+            recent = list(self._recent)
+            complete = self._floor is not None and after_id >= max(self._floor, self._evicted)
+        return [e for e in recent if e["id"] > after_id], complete
+
+
+class PostgresHub(InMemoryHub):
+    """
+    Cross-worker hub: publish() sends NOTIFY, and a listener thread in
+    each worker process LISTENs and hands events to local subscribers.
+    NOTIFY payloads are limited to 8000 bytes, so events stay small.
+    """
+
+    reconnect_delay = 1   # seconds
+
+    def __init__(self, database_uri, logger=None):
+        super().__init__(logger)
+        self._dsn = make_url(database_uri).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+        self._listener = None
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self._dsn)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, events):
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = self._connect()
+                    with self._publish_conn.cursor() as cur:
+                        for evt in events:
+                            cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(evt)))
+                    return
+                except Exception as e:
+                    self._publish_conn = None
+                    if attempt and self.logger:
+                        self.logger.warning("Event publish failed: %s", e)
+
+    def subscribe(self, limit=None):
+        self._ensure_listener()
+        return super().subscribe(limit)
+
+    def add_listener(self, on_event, on_reset):
+        self._ensure_listener()
+        super().add_listener(on_event, on_reset)
+
+    def _ensure_listener(self):
+        # Started lazily so each forked gunicorn worker gets its own thread.
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        lost = False
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                    if lost:
+                        cur.execute(f"SELECT max(id) FROM {ChangeLogEntry.__tablename__}")
+                        floor = cur.fetchone()[0] or 0
+                if lost:
+                    # Notifications sent while disconnected are gone for good.
+                    self._events_lost(floor)
+                    lost = False
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    events = []
+                    while conn.notifies:
+                        events.append(json.loads(conn.notifies.pop(0).payload))
+                    if events:
+                        self._deliver(events)
+            except Exception as e:
+                lost = True
+                if self.logger:
+                    self.logger.warning("Event listener reconnecting: %s", e)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            threading.Event().wait(self.reconnect_delay)
+
+
+def init_hub(app):
+    """Pick the hub from EVENT_HUB ("memory"/"postgres"), defaulting by database."""
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+    kind = app.config.get("EVENT_HUB") or ("postgres" if uri.startswith("postgres") else "memory")
+    # The listener thread has no app context, so the hub keeps the app's logger
+    hub = PostgresHub(uri, app.logger) if kind == "postgres" else InMemoryHub(app.logger)
+    app.extensions["event_hub"] = hub
+    return app.extensions["event_hub"]
+
+
+def get_hub():
+    return current_app.extensions["event_hub"]
+
+
+def publish(events):
+    """Publish committed events if a hub is configured for the current app."""
+    if events and has_app_context() and "event_hub" in current_app.extensions:
+        get_hub().publish(events)
@@ -0,0 +1,185 @@
+# app/utils/ratelimit.py
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from sqlalchemy import case, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.extensions import db
+from app.models import RateLimitBucket
+from app.utils.workers import register_worker
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+SCOPES = ("ip", "account", "account_ip")
+
+
+class Rule:
+    """
+    One "scope:count/period" limit, e.g. "ip:10/minute" or "account:5/hour".
+    "account_ip" counts per account and client address together, so a
+    guesser elsewhere cannot lock the real user out.
+    """
+
+    def __init__(self, spec):
+        scope, _, rate = spec.partition(":")
+        count, _, period = rate.partition("/")
+        if scope not in SCOPES or period not in PERIODS:
+            raise ValueError(f"Invalid rate limit rule: {spec}")
+        self.spec = spec
+        self.scope = scope
+        self.capacity = int(count)
+        self.period = PERIODS[period]
+        self.per_second = self.capacity / self.period
+
+
+class MemoryStorage:
+    """Token buckets in this process only (bounded LRU)."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, per_second, now=None):
+        """Spend one token. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / per_second
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class DatabaseStorage:
+    """
+    Token buckets shared by all workers in the rate_limit_bucket table.
+    Each take() is a single conditional UPDATE on its own connection, so
+    it never joins or blocks the request's transaction.
+    """
+
+    def take(self, key, capacity, per_second, now=None):
+        now = time.time() if now is None else now
+        table = RateLimitBucket.__table__
+        refilled = table.c.tokens + (literal(now) - table.c.updated_at) * per_second
+        available = case((refilled > capacity, literal(float(capacity))), else_=refilled)
+        with db.engine.begin() as conn:
+            insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+            conn.execute(
+                insert(table).values(key=key, tokens=float(capacity), updated_at=now)
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            taken = conn.execute(
+                table.update()
+                .where(table.c.key == key, available >= 1)
+                .values(tokens=available - 1, updated_at=now)
+            ).rowcount
+            if taken:
+                return 0
+            tokens = conn.execute(
+                table.select().with_only_columns(available).where(table.c.key == key)
+            ).scalar() or 0.0
+            return (1 - tokens) / per_second
+
+    def prune(self, idle_seconds, now=None):
+        """Delete buckets idle long enough to have refilled; a missing row reads as full."""
+        now = time.time() if now is None else now
+        table = RateLimitBucket.__table__
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(table.c.updated_at < now - idle_seconds)).rowcount
+
+
+def _account_key():
+    """JWT subject if a valid token is present, else the e-mail in the JSON body."""
+    try:
+        verify_jwt_in_request(optional=True)
+        sub = get_jwt().get("sub")
+        if sub:
+            return f"user:{sub}"
+    except Exception:
+        pass
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get("email"), str):
+        return f"email:{data['email'].strip().lower()}"
+    return None
+
+
+_parsed = {}
+
+
+def _rules(target):
+    specs = tuple((current_app.config.get("RATELIMITS") or {}).get(target, ()))
+    if specs not in _parsed:
+        _parsed[specs] = [Rule(spec) for spec in specs]
+    return _parsed[specs]
+
+
+def _ident(scope):
+    if scope == "ip":
+        return request.remote_addr
+    account = _account_key()
+    if scope == "account_ip" and account:
+        return f"{account}|{request.remote_addr}"
+    return account
+
+
+def _rules_for_request():
+    """Endpoint rules apply to every method; blueprint rules only to writes."""
+    matched = list(_rules(request.endpoint))
+    if request.blueprint and request.method in WRITE_METHODS:
+        matched.extend(_rules(request.blueprint))
+    return matched
+
+
+def prune_buckets():
+    """
+    Delete idle database buckets. Each refills within its rule's period, so
+    after the longest period in use an idle row is the same as no row.
+    """
+    specs = [spec for specs in (current_app.config.get("RATELIMITS") or {}).values() for spec in specs]
+    longest = max((Rule(spec).period for spec in specs), default=PERIODS["day"])
+    current_app.extensions["rate_limiter"].prune(longest)
+    return False
+
+
+def init_rate_limits(app):
+    # Fail at startup on a bad rule rather than on the first matching request
+    for specs in (app.config.get("RATELIMITS") or {}).values():
+        for spec in specs:
+            Rule(spec)
+    kind = app.config.get("RATELIMIT_STORAGE", "memory")
+    storage = DatabaseStorage() if kind == "database" else MemoryStorage()
+    app.extensions["rate_limiter"] = storage
+    if kind == "database":
+        register_worker(app, "ratelimits", prune_buckets, app.config.get("RATELIMIT_PRUNE_SECONDS", 3600))
+
+    @app.before_request
+    def _check_rate_limits():
+        if not current_app.config.get("RATELIMIT_ENABLED", True) or request.endpoint is None:
+            return None
+        retry_after = 0
+        for rule in _rules_for_request():
+            ident = _ident(rule.scope)
+            if not ident:
+                continue
+            key = f"{request.endpoint}|{rule.spec}|{ident}"
+            retry_after = max(retry_after, storage.take(key, rule.capacity, rule.per_second))
+        if retry_after:
+            response = jsonify({"msg": "Too many requests"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            return response
+        return None
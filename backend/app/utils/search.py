@@ -0,0 +1,160 @@
+# app/utils/search.py
+import re
+from collections import Counter
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.orm import Session
+from app.models import Comment, Incident, IncidentSearchDocument, SearchTerm
+from app.utils.changes import tracked_changes
+
+TS_CONFIG = "english"
+# Each field adds at most its weight per term (SQLite scoring below), and a
+# title of up to ~20 terms still adds > 3.5, so any title match outranks a
+# description/comments-only match.
+FIELD_WEIGHTS = {"title": 10.0, "description": 2.0, "comments": 1.0}
+FIELD_LENGTHS = {"title": 8, "description": 40, "comments": 40}   # typical length in terms
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "near", "of", "on", "or", "the", "to", "was", "with",
+}
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_PG_REFRESH = text(f"""
+    INSERT INTO incident_search_document (incident_id, vector)
+    SELECT i.id,
+           setweight(to_tsvector('{TS_CONFIG}', coalesce(i.title, '')), 'A') ||
+           setweight(to_tsvector('{TS_CONFIG}', coalesce(i.description, '')), 'B') ||
+           setweight(to_tsvector('{TS_CONFIG}', coalesce(
+               (SELECT string_agg(c.text, ' ') FROM comment c WHERE c.incident_id = i.id), ''
+           )), 'C')
+    FROM incident i
+    WHERE i.id = ANY(:ids)
+    ON CONFLICT (incident_id) DO UPDATE SET vector = EXCLUDED.vector
+""")
+
+_PG_SEARCH = text(f"""
+    SELECT d.incident_id, ts_rank(d.vector, q, 1) AS rank   -- 1: divide by 1 + log(length)
+    FROM incident_search_document d, websearch_to_tsquery('{TS_CONFIG}', :q) q
+    WHERE d.vector @@ q
+    ORDER BY rank DESC, d.incident_id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def tokenize(value):
+    return [w for w in _WORD.findall((value or "").lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def _is_postgres(connection):
+    return connection.dialect.name == "postgresql"
+
+
+def refresh_documents(connection, incident_ids):
+    """Rebuild the index entries of the given incidents from their current rows."""
+    ids = sorted(incident_ids)
+    if not ids:
+        return
+    if _is_postgres(connection):
+        documents = IncidentSearchDocument.__table__
+        connection.execute(documents.delete().where(documents.c.incident_id.in_(ids)))
+        connection.execute(_PG_REFRESH, {"ids": ids})
+        return
+
+    postings = SearchTerm.__table__
+    connection.execute(postings.delete().where(postings.c.incident_id.in_(ids)))
+
+    incidents = connection.execute(
+        Incident.__table__.select()
+        .with_only_columns(Incident.id, Incident.title, Incident.description)
+        .where(Incident.id.in_(ids))
+    ).all()
+    comments = connection.execute(
+        Comment.__table__.select()
+        .with_only_columns(Comment.incident_id, Comment.text)
+        .where(Comment.incident_id.in_(ids))
+    ).all()
+    comment_text = {}
+    for incident_id, body in comments:
+        comment_text.setdefault(incident_id, []).append(body)
+
+    rows = []
+    for incident_id, title, description in incidents:
+        scores = Counter()
+        fields = {
+            "title": title,
+            "description": description,
+            "comments": " ".join(comment_text.get(incident_id, [])),
+        }
+        for field, value in fields.items():
+            counts = Counter(term[:64] for term in tokenize(value))
+            # BM25-style: repeats saturate, and a match in a long field counts for less
+            norm = 0.5 + 0.5 * sum(counts.values()) / FIELD_LENGTHS[field]
+            for term, tf in counts.items():
+                scores[term] += FIELD_WEIGHTS[field] * tf / (tf + norm)
+        rows.extend({"term": t, "incident_id": incident_id, "score": s} for t, s in scores.items())
+    if rows:
+        connection.execute(postings.insert(), rows)
+
+
+def _touched_incidents(session):
+    touched = set()
+    for op, incident, _ in tracked_changes(session, Incident, ()):
+        state = inspect(incident)
+        if op != "update" or any(state.attrs[k].history.has_changes() for k in ("title", "description")):
+            touched.add(incident.id)
+    for _, comment, _ in tracked_changes(session, Comment, ()):
+        touched.add(comment.incident_id)
+    touched.discard(None)
+    return touched
+
+
+def _after_flush(session, flush_context):
+    touched = _touched_incidents(session)
+    if touched:
+        refresh_documents(session.connection(), touched)
+
+
+def register_listeners():
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def search_incident_ids(session, query, limit, offset):
+    """Return [(incident_id, rank)] best match first; every query term must match."""
+    connection = session.connection()
+    if _is_postgres(connection):
+        rows = connection.execute(_PG_SEARCH, {"q": query, "limit": limit, "offset": offset})
+        return [(r.incident_id, float(r.rank)) for r in rows]
+
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    score = func.sum(SearchTerm.score).label("rank")
+    rows = (
+        session.query(SearchTerm.incident_id, score)
+        .filter(SearchTerm.term.in_(terms))
+        .group_by(SearchTerm.incident_id)
+        .having(func.count(SearchTerm.term) == len(terms))
+        .order_by(score.desc(), SearchTerm.incident_id)
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
+    return [(incident_id, float(rank)) for incident_id, rank in rows]
+
+
+def rebuild_search_index(session, batch_size=1000):
+    """Re-index every incident (for backfills)."""
+    total = 0
+    last_id = 0
+    while True:
+        ids = [
+            row.id for row in session.query(Incident.id)
+            .filter(Incident.id > last_id).order_by(Incident.id).limit(batch_size)
+        ]
+        if not ids:
+            break
+        refresh_documents(session.connection(), ids)
+        session.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    return total
@@ -0,0 +1,290 @@
+# app/utils/security.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import TokenRevocation, User
+from app.utils.changes import tracked_changes
+
+DEFAULT_USER_CACHE_SIZE = 10000
+DEFAULT_USER_CACHE_TTL = 30   # seconds; bounds staleness in other workers
+DEFAULT_REVOCATION_REFRESH = 15   # seconds between revocation list checks
+REVOCATIONS_PENDING_KEY = "revocations_pending"
+
+# Read-only snapshot used for authorization checks. Routes that modify the
+# user still load the ORM row.
+CachedUser = namedtuple("CachedUser", "id name email role points")
+
+
+class UserCache:
+    """Small per-process TTL + LRU cache of CachedUser snapshots by id."""
+
+    def __init__(self, max_size=DEFAULT_USER_CACHE_SIZE, ttl=DEFAULT_USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+def load_user(user_id):
+    """Return a CachedUser for `user_id`, hitting the database at most once per TTL."""
+    cache = current_app.extensions["user_cache"]
+    user = cache.get(user_id)
+    if user is None:
+        row = (
+            User.query.with_entities(User.id, User.name, User.email, User.role, User.points)
+            .filter_by(id=user_id).first()
+        )
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        cache.put(user)
+    return user
+
+
+class TokenUser:
+    """
+    current_user for tokens that carry a role claim: id and role come from
+    the token, anything else is loaded (through the cache) on first use.
+    """
+
+    def __init__(self, user_id, role):
+        self.id = user_id
+        self.role = role
+        self._user = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = load_user(self.id)
+            if self._user is None:
+                raise AttributeError(name)
+        return getattr(self._user, name)
+
+
+def token_claims(user):
+    """Extra JWT claims so authorization needs no database read."""
+    return {"role": user.role or "user"}
+
+
+class BloomFilter:
+    def __init__(self, size_bits=1 << 16, hashes=4):
+        self.size = size_bits
+        self.hashes = hashes
+        self.bits = bytearray(size_bits // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i:4 * i + 4], "little") % self.size
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def _longest_token_lifetime():
+    """Longest configured JWT lifetime as a timedelta, or None if some tokens never expire."""
+    lifetimes = []
+    for key, default in (("JWT_ACCESS_TOKEN_EXPIRES", timedelta(minutes=15)),
+                         ("JWT_REFRESH_TOKEN_EXPIRES", timedelta(days=30))):
+        value = current_app.config.get(key, default)
+        if value is False or value is None:
+            return None
+        lifetimes.append(timedelta(seconds=value) if isinstance(value, int) else value)
+    return max(lifetimes)
+
+
+class RevocationList:
+    """
+    Per-process copy of token_revocation. A bloom filter answers the common
+    "not revoked" case; hits are confirmed against the exact maps. The copy
+    is checked for changes at most every `refresh_seconds` and only
+    reloaded when the table's max(id) or row count moved (a lower id can
+    commit after a higher one). One thread reloads at a time, outside the
+    lock; the others keep answering from the current copy.
+    """
+
+    def __init__(self, refresh_seconds=DEFAULT_REVOCATION_REFRESH):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._version = None      # (max id, row count) the copy was loaded at
+        self._stale = 0           # bumped by mark_stale
+        self._refreshing = False
+        self._bloom = BloomFilter()
+        self._users = {}      # user_id -> latest "revoke everything before" timestamp
+        self._jtis = set()
+
+    def mark_stale(self):
+        """Force a check on next use; call after the revocation has committed."""
+        with self._lock:
+            self._checked_at = None
+            self._stale += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._refreshing or (self._checked_at is not None and now - self._checked_at < self.refresh_seconds):
+                return
+            self._refreshing, stale, known = True, self._stale, self._version
+        try:
+            version = tuple(db.session.query(func.max(TokenRevocation.id), func.count(TokenRevocation.id)).one())
+            loaded = None
+            if version != known:
+                loaded = self._load()
+            with self._lock:
+                if loaded is not None:
+                    self._bloom, self._users, self._jtis = loaded
+                self._version = version
+                # A revocation committed while this ran may be missing: check again next time.
+                self._checked_at = now if self._stale == stale else None
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _load(self):
+        # Revocations older than the longest token lifetime cannot match anything.
+        query = TokenRevocation.query.with_entities(
+            TokenRevocation.user_id, TokenRevocation.jti, TokenRevocation.created_at
+        )
+        lifetime = _longest_token_lifetime()
+        if lifetime is not None:
+            query = query.filter(TokenRevocation.created_at >= datetime.utcnow() - lifetime)
+
+        bloom, users, jtis = BloomFilter(), {}, set()
+        for user_id, jti, created_at in query:
+            if jti:
+                jtis.add(jti)
+                bloom.add(f"j:{jti}")
+            else:
+                ts = created_at.replace(tzinfo=timezone.utc).timestamp()
+                users[user_id] = max(users.get(user_id, 0), ts)
+                bloom.add(f"u:{user_id}")
+        return bloom, users, jtis
+
+    def is_revoked(self, payload):
+        self._refresh()
+        user_key, jti_key = f"u:{payload.get('sub')}", f"j:{payload.get('jti')}"
+        bloom = self._bloom
+        if user_key not in bloom and jti_key not in bloom:
+            return False
+        if payload.get("jti") in self._jtis:
+            return True
+        try:
+            revoked_before = self._users.get(int(payload["sub"]))
+        except (KeyError, TypeError, ValueError):
+            return False
+        # iat has one-second resolution; a token from the revocation's own second is revoked too.
+        return revoked_before is not None and payload.get("iat", 0) <= int(revoked_before)
+
+
+def revoke_user_tokens(user_id, reason):
+    """Revoke every token issued to the user so far. Caller commits."""
+    db.session.add(TokenRevocation(user_id=user_id, reason=reason))
+    db.session.info[REVOCATIONS_PENDING_KEY] = True
+
+
+def revoke_token(payload, reason="logout"):
+    """Revoke a single token by jti. Caller commits."""
+    db.session.add(TokenRevocation(user_id=int(payload["sub"]), jti=payload["jti"], reason=reason))
+    db.session.info[REVOCATIONS_PENDING_KEY] = True
+
+
+def evict_user(user_id):
+    """Drop a cached snapshot after a write that bypassed the ORM."""
+    if has_app_context() and "user_cache" in current_app.extensions:
+        current_app.extensions["user_cache"].evict(user_id)
+
+
+def _after_flush(session, flush_context):
+    if not has_app_context() or "user_cache" not in current_app.extensions:
+        return
+    cache = current_app.extensions["user_cache"]
+    deleted = []
+    for op, user, _ in tracked_changes(session, User, ()):
+        if op != "create":
+            cache.evict(user.id)
+        if op == "delete":
+            deleted.append({"user_id": user.id, "reason": "user_deleted", "created_at": datetime.utcnow()})
+    if deleted:
+        # Tokens carry the role, so a deleted user's tokens must be revoked outright
+        session.connection().execute(TokenRevocation.__table__.insert(), deleted)
+        session.info[REVOCATIONS_PENDING_KEY] = True
+
+
+def _after_commit(session):
+    # Only now can a reload see the new rows; marking earlier lets a
+    # concurrent refresh cache the pre-commit table.
+    if session.info.pop(REVOCATIONS_PENDING_KEY, False) and has_app_context() \
+            and "revocation_list" in current_app.extensions:
+        current_app.extensions["revocation_list"].mark_stale()
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(REVOCATIONS_PENDING_KEY, None)
+
+
+def init_user_loader(app, jwt):
+    app.extensions["user_cache"] = UserCache(
+        app.config.get("USER_CACHE_SIZE", DEFAULT_USER_CACHE_SIZE),
+        app.config.get("USER_CACHE_TTL", DEFAULT_USER_CACHE_TTL),
+    )
+
+    app.extensions["revocation_list"] = RevocationList(
+        app.config.get("REVOCATION_REFRESH_SECONDS", DEFAULT_REVOCATION_REFRESH)
+    )
+
+    # flask_jwt_extended calls this once per authenticated request and
+    # exposes the result as `current_user`.
+    @jwt.user_lookup_loader
+    def _user_lookup(jwt_header, jwt_data):
+        try:
+            user_id = int(jwt_data["sub"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if "role" in jwt_data:
+            return TokenUser(user_id, jwt_data["role"])
+        return load_user(user_id)   # tokens issued before role claims existed
+
+    @jwt.token_in_blocklist_loader
+    def _token_revoked(jwt_header, jwt_data):
+        return current_app.extensions["revocation_list"].is_revoked(jwt_data)
+
+    for name, fn in (("after_flush", _after_flush),
+                     ("after_commit", _after_commit),
+                     ("after_soft_rollback", _after_rollback)):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
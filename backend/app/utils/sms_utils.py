@@ -0,0 +1,74 @@
+# app/utils/sms_utils.py
+import json
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from flask import current_app
+
+
+class ConsoleSmsBackend:
+    """Development backend: logs messages instead of sending them."""
+
+    def send_batch(self, phones, text):
+        for phone in phones:
+            current_app.logger.info("SMS to %s: %s", phone, text)
+
+
+class MemorySmsBackend:
+    """Local stand-in that keeps (phones, text) in memory."""
+
+    def __init__(self):
+        self.outbox = []
+
+    def send_batch(self, phones, text):
+        self.outbox.append((list(phones), text))
+
+
+class HttpSmsBackend:
+    """
+    Bulk SMS gateway taking a comma-separated recipient list per POST
+    (Africa's Talking style). Raises on HTTP errors so the batch is retried.
+    """
+
+    def __init__(self, url, username, api_key, sender=None, max_recipients=1000, timeout=10):
+        self.url = url
+        self.username = username
+        self.api_key = api_key
+        self.sender = sender
+        self.max_recipients = max_recipients
+        self.timeout = timeout
+
+    def send_batch(self, phones, text):
+        phones = list(phones)
+        for start in range(0, len(phones), self.max_recipients):
+            form = {"username": self.username, "to": ",".join(phones[start:start + self.max_recipients]), "message": text}
+            if self.sender:
+                form["from"] = self.sender
+            req = Request(
+                self.url,
+                data=urlencode(form).encode(),
+                headers={"apiKey": self.api_key, "Accept": "application/json"},
+            )
+            with urlopen(req, timeout=self.timeout) as resp:
+                json.load(resp)
+
+
+def _http_backend():
+    config = current_app.config
+    return HttpSmsBackend(
+        config["SMS_GATEWAY_URL"],
+        config.get("SMS_GATEWAY_USERNAME"),
+        config.get("SMS_GATEWAY_API_KEY"),
+        sender=config.get("SMS_SENDER_ID"),
+    )
+
+
+SMS_BACKENDS = {"console": ConsoleSmsBackend, "memory": MemorySmsBackend, "http": _http_backend}
+
+
+def get_sms_backend():
+    """The NOTIFY_SMS_BACKEND instance for the current app (one per process)."""
+    backend = current_app.extensions.get("sms_backend")
+    if backend is None:
+        name = current_app.config.get("NOTIFY_SMS_BACKEND", "console")
+        backend = current_app.extensions["sms_backend"] = SMS_BACKENDS[name]()
+    return backend
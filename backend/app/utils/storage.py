@@ -0,0 +1,336 @@
+# app/utils/storage.py
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import Counter, namedtuple
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import Media, MediaBlob
+from app.utils.changes import ensure_active_history, tracked_changes
+from app.utils.counters import add_to_counters
+from app.utils.workers import register_worker, wake_after_commit
+
+READ_SIZE = 64 * 1024
+
+# A hashed file waiting to be stored; `path` is removed once stored or discarded
+StagedBlob = namedtuple("StagedBlob", "sha256 size path")
+
+
+# The only types accepted for upload, and the only Content-Types they are served with
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "mp4": "video/mp4",
+    "mov": "video/quicktime",
+    "avi": "video/x-msvideo",
+}
+ALLOWED_EXTENSIONS = set(MEDIA_TYPES)
+IMAGE_EXTENSIONS = {ext for ext, mimetype in MEDIA_TYPES.items() if mimetype.startswith("image/")}
+VIDEO_EXTENSIONS = {ext for ext, mimetype in MEDIA_TYPES.items() if mimetype.startswith("video/")}
+
+
+def shard_path(sha256):
+    """"abcdef..." -> "ab/cd/abcdef...", so no directory holds more than a few entries."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def blob_url(sha256, ext):
+    """Stable URL stored on Media rows, whatever the backend (see routes/files.py)."""
+    return f"/uploads/{shard_path(sha256)}.{ext}"
+
+
+def file_extension(filename):
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+
+def allowed_file(filename):
+    return file_extension(filename) in ALLOWED_EXTENSIONS
+
+
+def media_kind(filename):
+    ext = file_extension(filename)
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return "other"
+
+
+def derivatives_root():
+    """
+    Where thumbnails and poster frames are rendered: their home for local
+    storage, scratch space that put_derivatives() empties for S3.
+    """
+    return current_app.config.get("MEDIA_DERIVATIVES_ROOT") or os.path.join(current_app.root_path, "derivatives")
+
+
+def derivative_dir(sha256):
+    return os.path.join(derivatives_root(), *shard_path(sha256).split("/"))
+
+
+class LocalStorage:
+    """Blobs on the local filesystem under `root`, sharded by hash."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def staging_dir(self):
+        # Same filesystem as the blobs, so put() is an atomic rename
+        folder = os.path.join(self.root, "tmp")
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def local_path(self, sha256):
+        return os.path.join(self.root, *shard_path(sha256).split("/"))
+
+    def exists(self, sha256):
+        return os.path.exists(self.local_path(sha256))
+
+    def put(self, staged, content_type=None):
+        target = self.local_path(staged.sha256)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(staged.path, target)
+
+    def open(self, sha256):
+        return open(self.local_path(sha256), "rb")
+
+    def delete(self, sha256):
+        try:
+            os.remove(self.local_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def object_url(self, sha256):
+        return None   # served by the /uploads route itself
+
+    def put_derivatives(self, sha256, names):
+        pass   # rendered in place under derivative_dir()
+
+    def derivative_url(self, sha256, name):
+        return None   # served by the /derivatives route itself
+
+    def delete_derivatives(self, sha256):
+        shutil.rmtree(derivative_dir(sha256), ignore_errors=True)
+
+
+class S3Storage:
+    """
+    Blobs in an S3-compatible bucket (AWS, MinIO, or a local stand-in via
+    `endpoint_url`). `client` may be any object with the boto3 S3 client
+    methods used here; by default one is built with boto3.
+    """
+
+    def __init__(self, bucket, prefix="media/", client=None, public_url=None, **client_kwargs):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("MEDIA_STORAGE=s3 requires the boto3 package")
+            client = boto3.client("s3", **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url
+
+    def staging_dir(self):
+        return current_app.config.get("MEDIA_STAGING_DIR") or tempfile.gettempdir()
+
+    def key(self, sha256):
+        return f"{self.prefix}{shard_path(sha256)}"
+
+    def derivative_key(self, sha256, name):
+        return f"{self.prefix}derivatives/{shard_path(sha256)}/{name}"
+
+    def local_path(self, sha256):
+        return None
+
+    def exists(self, sha256):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(sha256))
+            return True
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, staged, content_type=None):
+        if not self.exists(staged.sha256):
+            extra = {"CacheControl": "public, max-age=31536000, immutable"}
+            if content_type:
+                extra["ContentType"] = content_type
+            self.client.upload_file(staged.path, self.bucket, self.key(staged.sha256), ExtraArgs=extra)
+        os.remove(staged.path)
+
+    def open(self, sha256):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(sha256))["Body"]
+
+    def delete(self, sha256):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(sha256))
+
+    def _url(self, key):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=3600
+        )
+
+    def object_url(self, sha256):
+        """Where /uploads redirects; presigned URLs are made per request, never stored."""
+        return self._url(self.key(sha256))
+
+    def put_derivatives(self, sha256, names):
+        """Upload rendered variants from derivative_dir() and clear it, so every worker sees them."""
+        folder = derivative_dir(sha256)
+        for name in names:
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            self.client.upload_file(os.path.join(folder, name), self.bucket, self.derivative_key(sha256, name),
+                                    ExtraArgs={"ContentType": content_type})
+        shutil.rmtree(folder, ignore_errors=True)
+
+    def derivative_url(self, sha256, name):
+        return self._url(self.derivative_key(sha256, name))
+
+    def delete_derivatives(self, sha256):
+        prefix = self.derivative_key(sha256, "")
+        listing = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+        for obj in listing.get("Contents", ()):
+            self.client.delete_object(Bucket=self.bucket, Key=obj["Key"])
+        shutil.rmtree(derivative_dir(sha256), ignore_errors=True)
+
+
+def get_storage():
+    """The MEDIA_STORAGE backend for the current app (one per process)."""
+    storage = current_app.extensions.get("media_storage")
+    if storage is None:
+        config = current_app.config
+        if config.get("MEDIA_STORAGE", "local") == "s3":
+            storage = S3Storage(
+                config["MEDIA_S3_BUCKET"],
+                prefix=config.get("MEDIA_S3_PREFIX", "media/"),
+                public_url=config.get("MEDIA_S3_PUBLIC_URL"),
+                endpoint_url=config.get("MEDIA_S3_ENDPOINT_URL"),
+            )
+        else:
+            storage = LocalStorage(config.get("MEDIA_ROOT") or os.path.join(current_app.root_path, "uploads"))
+        current_app.extensions["media_storage"] = storage
+    return storage
+
+
+def stage_stream(stream):
+    """Copy a stream to a staging file, hashing it on the way. Returns a StagedBlob."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=get_storage().staging_dir())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                block = stream.read(READ_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                size += len(block)
+                f.write(block)
+    except Exception:
+        os.remove(path)
+        raise
+    return StagedBlob(digest.hexdigest(), size, path)
+
+
+def stage_file(path):
+    """Hash an already complete file (e.g. an assembled chunked upload) and stage it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return StagedBlob(digest.hexdigest(), os.path.getsize(path), path)
+
+
+def discard_staged(staged):
+    if os.path.exists(staged.path):
+        os.remove(staged.path)
+
+
+def attach_blob(media, staged):
+    """
+    Point `media` at the staged content and store the blob. The flush takes
+    the blob's row lock (reference count +1) before the file is written, so
+    a concurrent collect_blobs() cannot delete it underneath us. The caller
+    commits.
+    """
+    storage = get_storage()
+    media.content_hash = staged.sha256
+    media.size = staged.size
+    ext = file_extension(media.filename)
+    media.file_url = blob_url(staged.sha256, ext)
+    db.session.add(media)
+    db.session.flush()
+    # Identical bytes uploaded under another extension share the first upload's URL
+    blob_ext = db.session.query(MediaBlob.ext).filter_by(sha256=staged.sha256).scalar()
+    if blob_ext and blob_ext != ext:
+        ext = blob_ext
+        media.file_url = blob_url(staged.sha256, ext)
+    if storage.exists(staged.sha256):
+        discard_staged(staged)          # deduplicated
+    else:
+        storage.put(staged, MEDIA_TYPES.get(ext))
+
+
+def collect_blobs(batch_size=100):
+    """
+    Delete unreferenced blobs. Rows are deleted first and files removed
+    while the row locks are still held, so a concurrent upload of the same
+    content waits and then re-creates both. Returns how many were removed.
+    """
+    storage = get_storage()
+    table = MediaBlob.__table__
+    with db.engine.begin() as conn:
+        doomed = conn.execute(
+            table.select().with_only_columns(table.c.sha256)
+            .where(table.c.ref_count <= 0).limit(batch_size)
+        ).scalars().all()
+        if not doomed:
+            return 0
+        deleted = conn.execute(
+            table.delete()
+            .where(table.c.sha256.in_(doomed), table.c.ref_count <= 0)
+            .returning(table.c.sha256)
+        ).scalars().all()
+        for sha256 in deleted:
+            storage.delete(sha256)
+            storage.delete_derivatives(sha256)
+    return len(deleted)
+
+
+def _after_flush(session, flush_context):
+    deltas, created = Counter(), {}
+    for op, obj, old in tracked_changes(session, Media, ("content_hash",)):
+        if op == "create" and obj.content_hash:
+            deltas[obj.content_hash] += 1
+            created[obj.content_hash] = obj
+        elif op == "delete" and old["content_hash"]:
+            deltas[old["content_hash"]] -= 1
+    rows = [{"sha256": sha, "ref_count": delta,
+             "size": created[sha].size if sha in created else 0,
+             "kind": media_kind(created[sha].filename) if sha in created else "other",
+             "ext": file_extension(created[sha].filename) if sha in created else None,
+             "derivatives_status": "pending"}
+            for sha, delta in deltas.items() if delta]
+    if rows:
+        add_to_counters(session.connection(), MediaBlob.__table__, ["sha256"], rows, ["ref_count"])
+    if any(delta < 0 for delta in deltas.values()):
+        wake_after_commit(session, "blobs")
+    if created:
+        wake_after_commit(session, "derivatives")
+
+
+def init_storage(app):
+    register_worker(app, "blobs", collect_blobs, app.config.get("MEDIA_GC_POLL_SECONDS", 3600))
+    ensure_active_history(Media, ("content_hash",))
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
@@ -0,0 +1,79 @@
+# app/utils/uploads.py
+import hashlib
+import os
+from datetime import datetime
+from flask import current_app
+from app.extensions import db
+from app.models import MediaUpload
+from app.utils.workers import register_worker
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(ValueError):
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+def partial_path(upload_id):
+    folder = current_app.config.get("UPLOAD_PARTIAL_DIR") or os.path.join(current_app.root_path, "uploads_partial")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, upload_id)
+
+
+def write_chunk(path, offset, stream, max_bytes, expected_sha256=None):
+    """
+    Stream a chunk into `path` at `offset` without buffering it, truncating
+    first so bytes left by an interrupted chunk are overwritten. On a bad
+    checksum or oversize body the file is cut back to `offset` and
+    ChunkError is raised. Returns the number of bytes written.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    mode = "r+b" if os.path.exists(path) else "w+b"
+    with open(path, mode) as f:
+        f.truncate(offset)
+        f.seek(offset)
+        try:
+            while True:
+                block = stream.read(READ_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > max_bytes:
+                    raise ChunkError(f"Chunk larger than {max_bytes} bytes", 413)
+                digest.update(block)
+                f.write(block)
+            if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+                raise ChunkError("Chunk checksum mismatch", 400)
+        except Exception:
+            f.truncate(offset)
+            raise
+    return written
+
+
+def discard_upload(upload):
+    path = partial_path(upload.id)
+    if os.path.exists(path):
+        os.remove(path)
+    db.session.delete(upload)
+
+
+def expire_uploads(batch_size=100):
+    """Delete one batch of expired partial uploads. Returns how many were removed."""
+    expired = (
+        MediaUpload.query
+        .filter(MediaUpload.expires_at < datetime.utcnow())
+        .order_by(MediaUpload.expires_at)
+        .limit(batch_size)
+        .all()
+    )
+    for upload in expired:
+        discard_upload(upload)
+    db.session.commit()
+    return len(expired)
+
+
+def init_uploads(app):
+    register_worker(app, "uploads", expire_uploads, app.config.get("UPLOAD_EXPIRY_POLL_SECONDS", 600))
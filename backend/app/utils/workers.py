@@ -0,0 +1,95 @@
+# app/utils/workers.py
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.extensions import db
+
+WAKE_WORKERS_KEY = "wake_workers"
+
+
+class QueueWorker:
+    """
+    Per-process background thread draining a database-backed queue. It is
+    woken after a commit that queued work and also polls, so retries and
+    work left behind by other processes are picked up.
+    """
+
+    def __init__(self, app, drain, poll_seconds=30):
+        self.app = app
+        self.drain = drain          # callable; returns truthy while work remains
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._thread = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def wake(self):
+        # CLI commands and migrations never call start(), so commits there queue work silently
+        if self._started:
+            self.start()
+            self._wake.set()
+
+    def start(self):
+        # is_alive() is also False in a forked child, which then starts its own
+        with self._lock:
+            self._started = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.poll_seconds)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    while self.drain():
+                        pass
+                except Exception:
+                    current_app.logger.exception("%s failed", self.drain.__name__)
+                finally:
+                    db.session.remove()
+
+
+def wake_after_commit(session, name):
+    """Wake worker `name` once the current transaction commits."""
+    session.info.setdefault(WAKE_WORKERS_KEY, set()).add(name)
+
+
+def _after_commit(session):
+    names = session.info.pop(WAKE_WORKERS_KEY, ())
+    if names and has_app_context():
+        workers = current_app.extensions.get("workers", {})
+        for name in names:
+            if name in workers:
+                workers[name].wake()
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(WAKE_WORKERS_KEY, None)
+
+
+def register_worker(app, name, drain, poll_seconds=30):
+    """
+    Set up a background thread for `drain` unless QUEUE_WORKERS is off
+    (tests; MAIL_QUEUE_WORKER is still honoured as its old name). Threads
+    only run once the serving entrypoint calls start_workers(), so the app
+    factory stays side-effect free for `flask db upgrade` and other CLI
+    commands.
+    """
+    if app.config.get("QUEUE_WORKERS", app.config.get("MAIL_QUEUE_WORKER", not app.testing)):
+        app.extensions.setdefault("workers", {})[name] = QueueWorker(app, drain, poll_seconds)
+    for event_name, fn in (("after_commit", _after_commit),
+                           ("after_soft_rollback", _after_rollback)):
+        if not event.contains(Session, event_name, fn):
+            event.listen(Session, event_name, fn)
+
+
+def start_workers(app):
+    """
+    Start every registered worker now, so work queued before this process
+    booted is picked up by polling, not only after the next wake-up.
+    """
+    for worker in app.extensions.get("workers", {}).values():
+        worker.start()
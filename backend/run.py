@@ -7,6 +7,7 @@
 #     app.run(debug=True)
 
 from app import create_app, db
+from app.utils.workers import start_workers
 from flask_migrate import upgrade
 
 app = create_app()
@@ -15,6 +16,9 @@ app = create_app()
 with app.app_context():
     upgrade()
 
+# Queue workers run in serving processes only, after the schema is current
+start_workers(app)
+
 if __name__ == "__main__":
     app.run()
 
@@ -0,0 +1,73 @@
+import pytest
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+
+class TestConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SECRET_KEY = "test"
+    JWT_SECRET_KEY = "test-jwt-secret-key-long-enough-for-hs256"
+    TESTING = True
+    MAIL_SUPPRESS_SEND = True
+    MAIL_DEFAULT_SENDER = "noreply@example.com"
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TmpConfig(TestConfig):
+        MEDIA_ROOT = str(tmp_path / "media")
+        MEDIA_DERIVATIVES_ROOT = str(tmp_path / "derivatives")
+        UPLOAD_PARTIAL_DIR = str(tmp_path / "partial")
+
+    app = create_app(TmpConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    """Factory for Authorization headers; the user is created on first use."""
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+
+    def make(role="user", user_id=1):
+        if db.session.get(User, user_id) is None:
+            db.session.add(User(id=user_id, name=f"User {user_id}", email=f"user{user_id}@example.com",
+                                phone=f"07000000{user_id:02d}", password_hash="x", role=role))
+            db.session.commit()
+        token = create_access_token(identity=str(user_id), additional_claims={"role": role})
+        return {"Authorization": f"Bearer {token}"}
+
+    return make
+
+
+@pytest.fixture
+def capture_sql(app):
+    """Context manager that collects the SQL statements executed inside it."""
+    from contextlib import contextmanager
+    from sqlalchemy import event
+
+    @contextmanager
+    def capture():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+    return capture
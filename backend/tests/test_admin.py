@@ -2,3 +2,46 @@ def test_admin_list_incidents(client):
     response = client.get("/api/v1/admin/incidents")
     # Not logged in → expect 401
     assert response.status_code in [200, 401]
+
+
+def test_admin_analytics_requires_auth(client):
+    response = client.get("/api/v1/admin/analytics")
+    assert response.status_code == 401
+
+
+def test_analytics_follow_status_changes(client, app, auth_headers):
+    from datetime import datetime, timedelta
+    from app.extensions import db
+    from app.models import Incident
+
+    headers = auth_headers(role="admin")
+    now = datetime.utcnow()
+    for i, hours in ((1, 6), (2, 3), (3, 1)):
+        db.session.add(Incident(id=i, title="Crash", description="d", latitude=0, longitude=0,
+                                created_by=1, created_at=now - timedelta(hours=hours)))
+    db.session.commit()
+    url = f"/api/v1/admin/analytics?from={(now - timedelta(days=2)).date()}&to={(now + timedelta(days=1)).date()}"
+
+    def totals():
+        periods = client.get(url, headers=headers).get_json()
+        by_status = {}
+        for p in periods:
+            for status, n in p["by_status"].items():
+                by_status[status] = by_status.get(status, 0) + n
+        resolved = [p for p in periods if p["resolved"]]
+        return by_status, resolved
+
+    assert totals() == ({"pending": 3}, [])
+
+    for i in (1, 2):
+        client.patch(f"/api/v1/admin/incidents/{i}/status", headers=headers, json={"status": "resolved"})
+    by_status, resolved = totals()
+    assert by_status == {"pending": 1, "resolved": 2}
+    assert [p["resolved"] for p in resolved] == [2]
+    assert resolved[0]["avg_resolution_hours"] == 4.5
+
+    # Reopening takes the incident back out of the resolution stats
+    client.patch("/api/v1/admin/incidents/1/status", headers=headers, json={"status": "investigating"})
+    by_status, resolved = totals()
+    assert by_status == {"pending": 1, "investigating": 1, "resolved": 1}
+    assert [(p["resolved"], p["avg_resolution_hours"]) for p in resolved] == [(1, 3.0)]
@@ -1,4 +1,117 @@
 def test_signup(client):
-    response = client.post("/api/v1/auth/signup", json={"email": "test@example.com", "password": "123"})
+    response = client.post("/api/v1/auth/signup", json={
+        "name": "Test", "email": "test@example.com", "phone": "0700000009", "password": "123"
+    })
     assert response.status_code == 201
-    assert "User registered" in response.get_json()["message"]
+    assert "User registered" in response.get_json()["msg"]
+
+
+def test_signup_requires_name_and_phone(client):
+    response = client.post("/api/v1/auth/signup", json={"email": "test@example.com", "password": "123"})
+    assert response.status_code == 400
+
+
+def test_logout_requires_token(client):
+    response = client.post("/api/v1/auth/logout")
+    assert response.status_code == 401
+
+
+def test_login_rate_limited_per_account(client):
+    client.application.config["RATELIMITS"] = {"auth_bp.login": ["account:5/minute"]}
+    for _ in range(5):
+        client.post("/api/v1/auth/login", json={"email": "nobody@example.com", "password": "x"})
+    response = client.post("/api/v1/auth/login", json={"email": "nobody@example.com", "password": "x"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_password_reset_request_is_queued(client):
+    from app.models import OutboundEmail
+    from app.utils.mail_queue import deliver_pending
+
+    client.application.config["MAIL_DEFAULT_SENDER"] = "noreply@example.com"
+    client.post("/api/v1/auth/signup", json={"name": "Reset", "email": "reset@example.com", "phone": "0700000000", "password": "123"})
+    response = client.post("/api/v1/auth/password-reset-request", json={"email": "reset@example.com"})
+    assert response.status_code == 200
+    with client.application.app_context():
+        assert OutboundEmail.query.filter_by(status="pending").count() == 1
+        assert deliver_pending() == (1, 0)
+        assert OutboundEmail.query.filter_by(status="sent").count() == 1
+
+
+def test_invalid_rate_limit_rule_fails_at_startup():
+    import pytest
+    from app import create_app
+    from tests.conftest import TestConfig
+
+    class BadConfig(TestConfig):
+        RATELIMITS = {"auth_bp.login": ["ip:5/fortnight"]}
+
+    with pytest.raises(ValueError):
+        create_app(BadConfig)
+
+
+def test_login_account_limit_is_per_client_address(client):
+    client.application.config["RATELIMITS"] = {"auth_bp.login": ["account_ip:2/minute"]}
+    body = {"email": "victim@example.com", "password": "x"}
+    for _ in range(2):
+        client.post("/api/v1/auth/login", json=body, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert client.post("/api/v1/auth/login", json=body, environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 429
+    assert client.post("/api/v1/auth/login", json=body, environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code != 429
+
+
+def test_database_buckets_are_pruned(app):
+    from app.models import RateLimitBucket
+    from app.utils.ratelimit import DatabaseStorage
+
+    storage = DatabaseStorage()
+    storage.take("old", 5, 5 / 60, now=1000.0)
+    storage.take("recent", 5, 5 / 60, now=1000.0 + 86400)
+    assert storage.prune(3600, now=1000.0 + 86400) == 1
+    assert [b.key for b in RateLimitBucket.query.all()] == ["recent"]
+
+
+def test_deleted_user_tokens_are_revoked(client, auth_headers):
+    from app.extensions import db
+    from app.models import User
+
+    headers = auth_headers(role="admin")
+    assert client.get("/api/v1/users/subscriptions", headers=headers).status_code == 200
+
+    db.session.delete(db.session.get(User, 1))
+    db.session.commit()
+    assert client.get("/api/v1/users/subscriptions", headers=headers).status_code == 401
+
+
+def test_revocation_list_loads_without_refresh_expiry(app):
+    from app.utils.security import revoke_user_tokens
+
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = False
+    revoke_user_tokens(1, "test")
+    payload = {"sub": "1", "jti": "abc", "iat": 0}
+    assert app.extensions["revocation_list"].is_revoked(payload)
+
+
+def test_revocation_list_reloads_after_commit(app):
+    from app.extensions import db
+    from app.models import TokenRevocation
+    from app.utils.security import revoke_user_tokens
+
+    revocations = app.extensions["revocation_list"]
+    payload = {"sub": "1", "jti": "abc", "iat": 0}
+    db.session.add(TokenRevocation(id=10, user_id=2, reason="test"))
+    db.session.commit()
+    assert not revocations.is_revoked(payload)
+
+    revoke_user_tokens(1, "test")
+    db.session.flush()
+    assert revocations._checked_at is not None     # not before the commit
+    db.session.commit()
+    assert revocations._checked_at is None
+    assert revocations.is_revoked(payload)
+
+    # A lower id committing after a higher one leaves max(id) unchanged
+    db.session.execute(db.insert(TokenRevocation).values(id=5, user_id=3, reason="test"))
+    db.session.commit()
+    revocations._checked_at = None                 # refresh interval elapsed
+    assert revocations.is_revoked({"sub": "3", "jti": "def", "iat": 0})
@@ -3,3 +3,483 @@ def test_list_incidents(client):
     assert response.status_code == 200
     data = response.get_json()
     assert isinstance(data, list)
+
+
+def test_list_incidents_paginated(client):
+    response = client.get("/api/v1/incidents/?limit=10")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["items"] == []
+    assert data["next_cursor"] is None
+
+
+def test_list_incidents_paginates_null_created_at(client, app):
+    from app.extensions import db
+    from app.models import Incident, User
+
+    db.session.add(User(id=1, name="Reporter", email="r@example.com", phone="0700000000", password_hash="x"))
+    for i in (1, 2, 3):
+        db.session.add(Incident(id=i, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+    # Rows from before created_at had a default
+    db.session.execute(db.update(Incident).where(Incident.id < 3).values(created_at=None))
+    db.session.commit()
+
+    seen, url = [], "/api/v1/incidents/?limit=1"
+    while url:
+        data = client.get(url).get_json()
+        seen += [item["id"] for item in data["items"]]
+        url = data["next_cursor"] and f"/api/v1/incidents/?limit=1&after={data['next_cursor']}"
+    assert seen == [1, 2, 3]
+
+
+def test_list_incidents_default_is_one_page(client, app):
+    from app.extensions import db
+    from app.models import Incident, User
+    from app.utils.pagination import DEFAULT_PAGE_SIZE
+
+    db.session.add(User(id=1, name="Reporter", email="r@example.com", phone="0700000000", password_hash="x"))
+    for i in range(1, DEFAULT_PAGE_SIZE + 2):
+        db.session.add(Incident(id=i, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+
+    response = client.get("/api/v1/incidents/")
+    assert [i["id"] for i in response.get_json()] == list(range(1, DEFAULT_PAGE_SIZE + 1))
+    next_url = response.headers["Link"].split(">")[0].lstrip("<")
+    rest = client.get(next_url).get_json()
+    assert [i["id"] for i in rest["items"]] == [DEFAULT_PAGE_SIZE + 1]
+    assert rest["next_cursor"] is None
+
+
+def test_list_incidents_invalid_cursor(client):
+    response = client.get("/api/v1/incidents/?after=not-a-cursor")
+    assert response.status_code == 400
+
+
+def test_list_incidents_streamed(client):
+    response = client.get("/api/v1/incidents/?stream=1")
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def test_list_incidents_bbox_filter(client):
+    response = client.get("/api/v1/incidents/?bbox=-1.4,36.7,-1.2,36.9")
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def test_list_incidents_invalid_bbox(client):
+    response = client.get("/api/v1/incidents/?bbox=1,2")
+    assert response.status_code == 400
+
+
+def test_clusters_requires_bbox_and_zoom(client):
+    response = client.get("/api/v1/incidents/clusters")
+    assert response.status_code == 400
+
+
+def test_clusters_empty_viewport(client):
+    response = client.get("/api/v1/incidents/clusters?bbox=-1.4,36.7,-1.2,36.9&zoom=10")
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def test_clusters_follow_status_moves_and_deletes(client, auth_headers):
+    headers = auth_headers()
+    url = "/api/v1/incidents/clusters?bbox=-1.4,36.7,-1.2,36.9&zoom=12"
+    item = {"title": "Crash", "description": "d"}
+    created = client.post("/api/v1/incidents/batch", headers=headers, json=[
+        {**item, "latitude": -1.286, "longitude": 36.817},
+        {**item, "latitude": -1.288, "longitude": 36.819},
+        {**item, "latitude": -1.265, "longitude": 36.800},
+    ]).get_json()["created"]
+    a, b, c = (row["id"] for row in created)
+
+    def cells():
+        return {tuple(cell["cell"][1:]): cell for cell in client.get(url).get_json()}
+
+    cbd, westlands = cells()[(9867, 8250)], cells()[(9866, 8249)]
+    assert (cbd["count"], cbd["statuses"]) == (2, {"pending": 2})
+    assert (round(cbd["latitude"], 3), round(cbd["longitude"], 3)) == (-1.287, 36.818)
+    assert (westlands["count"], westlands["statuses"]) == (1, {"pending": 1})
+
+    client.put(f"/api/v1/incidents/{a}", headers=headers, json={"status": "verified"})
+    assert cells()[(9867, 8250)]["statuses"] == {"pending": 1, "verified": 1}
+
+    # Moving b out of the viewport and deleting c leave only a
+    client.put(f"/api/v1/incidents/{b}", headers=headers, json={"latitude": -1.0, "longitude": 37.5})
+    client.delete(f"/api/v1/incidents/{c}", headers=headers)
+    remaining = cells()
+    assert list(remaining) == [(9867, 8250)]
+    assert (remaining[(9867, 8250)]["count"], remaining[(9867, 8250)]["statuses"]) == (1, {"verified": 1})
+    assert round(remaining[(9867, 8250)]["latitude"], 6) == -1.286
+
+
+def test_list_incidents_not_modified(client):
+    response = client.get("/api/v1/incidents/")
+    etag = response.headers["ETag"]
+    response = client.get("/api/v1/incidents/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_changes_feed_empty(client):
+    response = client.get("/api/v1/incidents/changes?since=0")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["incidents"] == []
+    assert data["next_token"] == "0"
+
+
+def test_changes_feed_after_prune(client, app):
+    from datetime import datetime, timedelta
+    from app.extensions import db
+    from app.models import ChangeLogEntry
+    from app.utils.changelog import prune_changes
+
+    old = datetime.utcnow() - timedelta(days=30)
+    for i in (1, 2, 3):
+        db.session.add(ChangeLogEntry(id=i, entity="incident", entity_id=i, op="create", changed_at=old))
+    db.session.add(ChangeLogEntry(id=4, entity="incident", entity_id=4, op="update", changed_at=datetime.utcnow()))
+    db.session.commit()
+    prune_changes(db.session, datetime.utcnow() - timedelta(days=7))
+
+    response = client.get("/api/v1/incidents/changes?since=0")
+    assert response.status_code == 410
+    token = client.get("/api/v1/incidents/changes/token").get_json()["token"]
+    assert response.get_json()["token"] == token == "4"
+    data = client.get(f"/api/v1/incidents/changes?since={token}").get_json()
+    assert (data["next_token"], data["has_more"]) == ("4", False)
+
+
+def test_current_token_stops_before_uncommitted_gap(app):
+    from datetime import datetime
+    from app.extensions import db
+    from app.models import ChangeLogEntry
+    from app.utils.changelog import current_token
+
+    now = datetime.utcnow()
+    for i in (1, 2, 4):
+        db.session.add(ChangeLogEntry(id=i, entity="incident", entity_id=i, op="create", changed_at=now))
+    db.session.commit()
+    assert current_token(now) == 2
+
+
+def test_changes_token_waits_for_earlier_commit(app):
+    from datetime import datetime, timedelta
+    from app.extensions import db
+    from app.models import ChangeLogEntry
+    from app.utils.changelog import changes_since
+
+    now = datetime.utcnow()
+    # Transaction A took id 2 but commits after B, which took id 3
+    db.session.add(ChangeLogEntry(id=1, entity="incident", entity_id=1, op="create", changed_at=now))
+    db.session.add(ChangeLogEntry(id=3, entity="incident", entity_id=3, op="create", changed_at=now))
+    db.session.commit()
+    upserts, _, token, has_more = changes_since(0, 10, now)
+    assert (upserts["incident"], token, has_more) == ({1}, 1, False)
+
+    db.session.add(ChangeLogEntry(id=2, entity="incident", entity_id=2, op="create", changed_at=now))
+    db.session.commit()
+    upserts, _, token, _ = changes_since(token, 10, now)
+    assert (upserts["incident"], token) == ({2, 3}, 3)
+
+    # A gap older than the commit lag is a rolled-back transaction
+    db.session.add(ChangeLogEntry(id=5, entity="incident", entity_id=5, op="create", changed_at=now))
+    db.session.commit()
+    assert changes_since(3, 10, now + timedelta(minutes=5))[2] == 5
+
+
+def test_search_requires_query(client):
+    response = client.get("/api/v1/incidents/search")
+    assert response.status_code == 400
+
+
+def test_search_ranks_title_matches_first(client, auth_headers):
+    headers = auth_headers()
+    reports = [
+        ("Water main burst", "A car crash flooded the crash site and the crash barrier"),
+        ("Car crash near the market after heavy rain", "Blocked lane"),
+        ("Car crash", "Blocked lane"),
+    ]
+    ids = [client.post("/api/v1/incidents/", headers=headers, json={
+        "title": title, "description": description, "latitude": -1.28, "longitude": 36.82 + i,
+    }).get_json()["id"] for i, (title, description) in enumerate(reports)]
+
+    items = client.get("/api/v1/incidents/search?q=car crash").get_json()["items"]
+    # Exact title, then the longer title, then the description-only match
+    assert [item["id"] for item in items] == ids[::-1]
+    assert items[0]["rank"] > items[1]["rank"] > items[2]["rank"]
+
+
+def test_search_finds_incidents_by_comment(client, auth_headers):
+    headers = auth_headers()
+    incident_id = client.post("/api/v1/incidents/", headers=headers, json={
+        "title": "Road blocked", "description": "Traffic at a standstill", "latitude": -1.28, "longitude": 36.82,
+    }).get_json()["id"]
+    assert client.get("/api/v1/incidents/search?q=landslide").get_json()["items"] == []
+
+    client.post(f"/api/v1/incidents/{incident_id}/comments", headers=headers, json={"text": "A landslide covered it"})
+    assert [i["id"] for i in client.get("/api/v1/incidents/search?q=landslide").get_json()["items"]] == [incident_id]
+
+
+def test_list_incidents_unknown_expand(client):
+    response = client.get("/api/v1/incidents/?expand=bogus")
+    assert response.status_code == 400
+
+
+def _seed_expandable(first, last):
+    from app.extensions import db
+    from app.models import Comment, Incident, Media, User
+
+    for i in range(first, last + 1):
+        db.session.add(User(id=i, name=f"U{i}", email=f"u{i}@example.com", phone=f"07000000{i:02d}", password_hash="x"))
+        db.session.add(Incident(id=i, title="Crash", description="d", latitude=0, longitude=0, created_by=i))
+        db.session.add_all([Comment(text=f"c{i}-{n}", incident_id=i, created_by=i) for n in range(2)])
+        db.session.add(Media(filename="a.jpg", file_url="u", incident_id=i, uploaded_by=i))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def test_list_incidents_expand_runs_constant_queries(client, app, capture_sql):
+    from app.extensions import db
+
+    def run():
+        with capture_sql() as statements:
+            items = client.get("/api/v1/incidents/?expand=comments,media,user").get_json()
+        db.session.expunge_all()
+        return items, len(statements)
+
+    _seed_expandable(1, 2)
+    items, few = run()
+    assert [(len(i["comments"]), len(i["media"]), i["user"]["name"]) for i in items] == [(2, 1, "U1"), (2, 1, "U2")]
+
+    _seed_expandable(3, 8)
+    items, many = run()
+    assert len(items) == 8
+    assert many == few
+
+
+def test_list_incidents_fields_narrows_select(client, capture_sql):
+    _seed_expandable(1, 1)
+    with capture_sql() as statements:
+        items = client.get("/api/v1/incidents/?fields=id,title").get_json()
+    assert items == [{"id": 1, "title": "Crash"}]
+    select = next(s for s in statements if s.lstrip().startswith("SELECT") and "FROM incident" in s
+                  and "count(" not in s and "max(" not in s)
+    columns = select.split("FROM")[0]
+    assert "incident.title" in columns and "incident.id" in columns
+    assert "incident.description" not in columns and "incident.latitude" not in columns
+
+
+def test_list_incidents_unknown_field(client):
+    response = client.get("/api/v1/incidents/?fields=id,bogus")
+    assert response.status_code == 400
+
+
+def test_stream_invalid_last_event_id(client):
+    response = client.get("/api/v1/incidents/stream", headers={"Last-Event-ID": "abc"})
+    assert response.status_code == 400
+
+
+def test_stream_connection_cap(client):
+    client.application.config["SSE_MAX_CONNECTIONS"] = 0
+    response = client.get("/api/v1/incidents/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+
+
+def test_replay_ignores_id_gaps():
+    from app.utils import pubsub
+    from app.utils.pubsub import InMemoryHub
+
+    hub = InMemoryHub()
+    hub.start_after(10)
+    hub.publish([{"id": 12}, {"id": 15}])   # 11, 13 and 14 had no event
+    assert hub.replay(10) == ([{"id": 12}, {"id": 15}], True)
+    assert hub.replay(9)[1] is False        # 10 and earlier predate the hub
+
+    hub.publish([{"id": i} for i in range(16, 16 + pubsub.REPLAY_BUFFER_SIZE)])
+    assert hub.replay(14)[1] is False       # 15 was evicted
+    assert hub.replay(15)[1] is True
+
+
+def test_heatmap_tile_empty(client):
+    response = client.get("/api/v1/incidents/heatmap/3/4/3")
+    assert response.status_code == 200
+    assert response.data == bytes(64 * 64 * 2)
+
+
+def test_heatmap_tile_counts_follow_new_incidents(client, app, auth_headers):
+    import numpy as np
+
+    headers = auth_headers()
+    item = {"title": "Crash", "description": "d", "latitude": -1.28, "longitude": 36.82}
+
+    def tile():
+        response = client.get("/api/v1/incidents/heatmap/0/0/0")
+        return np.frombuffer(response.data, dtype="<u2"), int(response.headers["X-Max-Count"])
+
+    client.post("/api/v1/incidents/batch", headers=headers, json=[item, item, {**item, "latitude": 50.0}])
+    grid, max_count = tile()
+    assert (grid.sum(), max_count, np.count_nonzero(grid)) == (3, 2, 2)
+
+    client.post("/api/v1/incidents/", headers=headers, json=item)
+    grid, max_count = tile()
+    assert (grid.sum(), max_count) == (4, 3)
+    # The cache listens through an internal hook, not one of the SSE slots
+    assert not app.extensions["event_hub"]._subscribers
+
+
+def test_tile_cache_expiry_and_subscriber_overflow():
+    from app.utils import pubsub
+    from app.utils.heatmap import TileCache
+    from app.utils.pubsub import InMemoryHub
+
+    cache = TileCache(ttl=0)
+    cache.put((1, 0, 0), "grid", cache.generation)
+    assert cache.get((1, 0, 0)) is None
+
+    hub = InMemoryHub()
+    subscription = hub.subscribe()
+    hub.publish([{"id": i} for i in range(pubsub.SUBSCRIBER_QUEUE_SIZE)])
+    assert not subscription.overflowed
+    hub.publish([{"id": pubsub.SUBSCRIBER_QUEUE_SIZE}])
+    assert subscription.overflowed
+
+
+def test_listener_reconnect_marks_events_lost():
+    import socket
+    import threading
+    from app.utils.pubsub import PostgresHub
+
+    class FakeConnection:
+        def __init__(self, fail):
+            self.fail, self.closed = fail, False
+            self.sock, peer = socket.socketpair()
+            peer.send(b"x")   # readable, so the listener polls straight away
+            self.peer = peer
+            self.notifies = []
+
+        def cursor(self):
+            conn = self
+
+            class Cursor:
+                def __enter__(self):
+                    return self
+
+                def __exit__(self, *exc):
+                    return False
+
+                def execute(self, sql):
+                    conn.last_sql = sql
+
+                def fetchone(self):
+                    return (42,)
+            return Cursor()
+
+        def fileno(self):
+            return self.sock.fileno()
+
+        def poll(self):
+            if self.fail:
+                raise OSError("connection lost")
+            reconnected.set()
+            threading.Event().wait()
+
+        def close(self):
+            self.closed = True
+
+    reconnected = threading.Event()
+    connections = [FakeConnection(fail=True), FakeConnection(fail=False)]
+    hub = PostgresHub("postgresql://localhost/test")
+    hub.reconnect_delay = 0
+    hub._connect = iter(connections).__next__
+    hub._deliver([{"id": 10}])
+    subscription = hub.subscribe()
+    assert reconnected.wait(5)
+
+    assert connections[0].closed
+    assert subscription.overflowed
+    assert hub.replay(10) == ([], False)    # events 11..42 may have been missed
+    assert hub.replay(42)[1]
+
+
+def test_heatmap_invalid_tile(client):
+    response = client.get("/api/v1/incidents/heatmap/2/9/0")
+    assert response.status_code == 400
+
+
+def test_upload_media_rejects_disallowed_type(client, app, auth_headers):
+    import io
+    from app.extensions import db
+    from app.models import Incident
+
+    headers = auth_headers()
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+
+    response = client.post("/api/v1/incidents/1/media", headers=headers,
+                           data={"file": (io.BytesIO(b"<script>"), "x.html")})
+    assert response.status_code == 400
+    assert client.post("/api/v1/incidents/99/media", headers=headers,
+                       data={"file": (io.BytesIO(b"x"), "x.jpg")}).status_code == 404
+
+
+def test_batch_validates_each_item(client, app, auth_headers):
+    from app.extensions import db
+    from app.models import Incident
+
+    headers = auth_headers()
+    item = {"title": "Crash", "description": "d", "latitude": "-1.28", "longitude": 36.82}
+    response = client.post("/api/v1/incidents/batch", headers=headers, json=[
+        item,
+        {**item, "title": "x" * 121},
+        {**item, "title": ["not", "text"]},
+        {**item, "latitude": True},
+    ])
+    assert response.status_code == 201
+    assert [e["index"] for e in response.get_json()["errors"]] == [1, 2, 3]
+    assert db.session.get(Incident, response.get_json()["created"][0]["id"]).latitude == -1.28
+
+
+def test_non_string_title_is_rejected_before_duplicate_check(client, app, auth_headers):
+    from app.extensions import db
+    from app.models import Incident
+
+    headers = auth_headers()
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+
+    item = {"title": 123, "description": "d", "latitude": 0, "longitude": 0}
+    assert client.post("/api/v1/incidents/", headers=headers, json=item).status_code == 400
+    assert client.put("/api/v1/incidents/1", headers=headers, json={"title": {"a": 1}}).status_code == 400
+    assert client.put("/api/v1/incidents/1", headers=headers, json={"title": "Crash on Mombasa Rd"}).status_code == 200
+    assert client.post("/api/v1/incidents/", headers=headers, json={**item, "title": "Crash"}).status_code == 201
+
+
+def test_create_reports_and_links_duplicates(client, auth_headers):
+    headers = auth_headers()
+    report = {"title": "Matatu crash on Thika Road", "description": "Two vehicles collided near the flyover",
+              "latitude": -1.2300, "longitude": 36.8800}
+
+    def create(**overrides):
+        return client.post("/api/v1/incidents/", headers=headers, json={**report, **overrides}).get_json()
+
+    first = create()
+    assert first["duplicates"] == [] and first["duplicate_of"] is None
+
+    # ~50 m away, same story: reported but left standalone
+    second = create(latitude=-1.2304, title="Matatu crash, Thika Rd")
+    assert [d["id"] for d in second["duplicates"]] == [first["id"]]
+    assert second["duplicates"][0]["distance_m"] < 100
+    assert second["duplicate_of"] is None
+
+    # Linked reports point at the root, even when the best match is itself a duplicate
+    third = create(link_duplicate=True)
+    assert third["duplicate_of"] == first["id"]
+    fourth = create(link_duplicate=True, latitude=-1.2301)
+    assert fourth["duplicate_of"] == first["id"]
+
+    # Different story, or too far away: no match
+    assert create(title="Flooded underpass", description="Water over the road")["duplicates"] == []
+    assert create(latitude=-1.30)["duplicates"] == []
@@ -0,0 +1,154 @@
+def test_create_upload_requires_auth(client):
+    response = client.post("/api/v1/media/1/uploads", json={"filename": "clip.mp4", "size": 1024})
+    assert response.status_code == 401
+
+
+def test_write_chunk_rejects_bad_checksum(tmp_path):
+    import io
+    import pytest
+    from app.utils.uploads import ChunkError, write_chunk
+
+    path = tmp_path / "partial"
+    assert write_chunk(str(path), 0, io.BytesIO(b"hello "), 100) == 6
+    with pytest.raises(ChunkError):
+        write_chunk(str(path), 6, io.BytesIO(b"world"), 100, expected_sha256="00")
+    assert path.read_bytes() == b"hello "
+
+
+def test_chunked_upload_flow(client, app, auth_headers):
+    import hashlib
+    from app.extensions import db
+    from app.models import Incident, MediaUpload
+
+    headers = auth_headers()
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+
+    upload_id = client.post("/api/v1/media/1/uploads", headers=headers,
+                            json={"filename": "clip.mp4", "size": 10}).get_json()["upload_id"]
+    url = f"/api/v1/media/uploads/{upload_id}"
+    assert client.put(f"{url}?offset=0", headers=headers, data=b"01234").get_json()["offset"] == 5
+    bad = client.put(f"{url}?offset=5", headers={**headers, "X-Chunk-SHA256": "00"}, data=b"56789")
+    assert bad.status_code == 400
+    assert client.put(f"{url}?offset=0", headers=headers, data=b"01234").status_code == 409
+    assert db.session.get(MediaUpload, upload_id).locked_until is None
+
+    assert client.put(f"{url}?offset=5", headers=headers, data=b"56789").get_json()["offset"] == 10
+    mismatch = client.post(f"{url}/complete", headers=headers, json={"sha256": "00"})
+    assert mismatch.status_code == 409
+    done = client.post(f"{url}/complete", headers=headers,
+                       json={"sha256": hashlib.sha256(b"0123456789").hexdigest()})
+    assert done.status_code == 201
+    assert done.get_json()["file_url"].endswith(".mp4")
+
+
+def test_shard_path():
+    from app.utils.storage import shard_path
+
+    assert shard_path("abcdef0123") == "ab/cd/abcdef0123"
+
+
+def test_render_image_thumbnails(tmp_path):
+    import pytest
+    Image = pytest.importorskip("PIL.Image")
+    from app.utils.derivatives import render_derivatives
+
+    source = tmp_path / "photo.jpg"
+    Image.new("RGB", (800, 600)).save(source, "JPEG")
+    status, names = render_derivatives(str(source), str(tmp_path / "out"), "image", (320,))
+    assert status == "ready"
+    assert names == ["thumb_320.webp", "thumb_320.jpg"]
+    with Image.open(tmp_path / "out" / "thumb_320.jpg") as thumb:
+        assert thumb.size == (320, 240)
+
+
+def test_serve_blob_range(client, tmp_path):
+    from app.extensions import db
+    from app.models import MediaBlob
+
+    sha256 = "ab" * 32
+    blob = tmp_path / "ab" / "ab" / sha256
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(b"0123456789")
+    client.application.config["MEDIA_ROOT"] = str(tmp_path)
+    client.application.extensions.pop("media_storage", None)   # get_storage() caches the backend
+    db.session.add(MediaBlob(sha256=sha256, size=10, ref_count=1, kind="video"))
+    db.session.commit()
+
+    response = client.get(f"/uploads/ab/ab/{sha256}.mp4", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.data == b"2345"
+    assert response.headers["Content-Range"] == "bytes 2-5/10"
+    assert response.headers["ETag"] == f'"{sha256}"'
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_serve_blob_rejects_other_extension(client, app):
+    import os
+    from app.extensions import db
+    from app.models import MediaBlob
+    from app.utils.storage import get_storage
+
+    sha256 = "cd" * 32
+    path = get_storage().local_path(sha256)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"<b>")
+    db.session.add(MediaBlob(sha256=sha256, size=3, ref_count=1, kind="image"))
+    db.session.commit()
+
+    assert client.get(f"/uploads/cd/cd/{sha256}.html").status_code == 404
+    assert client.get(f"/uploads/cd/cd/{sha256}.mp4").status_code == 404
+    response = client.get(f"/uploads/cd/cd/{sha256}.jpg")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "image/jpeg"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_reupload_under_other_extension_serves_first_blob(client, app, auth_headers, tmp_path):
+    import hashlib
+    from app.extensions import db
+    from app.models import Incident
+
+    client.application.config["MEDIA_ROOT"] = str(tmp_path)
+    client.application.extensions.pop("media_storage", None)
+    headers = auth_headers()
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.commit()
+
+    def upload(filename):
+        upload_id = client.post("/api/v1/media/1/uploads", headers=headers,
+                                json={"filename": filename, "size": 10}).get_json()["upload_id"]
+        url = f"/api/v1/media/uploads/{upload_id}"
+        client.put(f"{url}?offset=0", headers=headers, data=b"0123456789")
+        done = client.post(f"{url}/complete", headers=headers,
+                           json={"sha256": hashlib.sha256(b"0123456789").hexdigest()})
+        assert done.status_code == 201
+        return done.get_json()["file_url"]
+
+    first = upload("clip.mp4")
+    second = upload("photo.jpg")
+    assert second == first
+    response = client.get(second)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "video/mp4"
+    # The lookup is by hash, so the other extension still gets the stored type
+    assert client.get(first[:-len("mp4")] + "jpg").headers["Content-Type"] == "video/mp4"
+
+
+def test_blob_refcount_tracks_unloaded_content_hash(app):
+    from sqlalchemy.orm import load_only
+    from app.extensions import db
+    from app.models import Incident, Media, MediaBlob, User
+
+    db.session.add(User(id=1, name="Rep", email="rep@example.com", phone="0700000001", password_hash="x"))
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=0, longitude=0, created_by=1))
+    db.session.add(Media(id=1, filename="a.jpg", file_url="u", incident_id=1, uploaded_by=1, content_hash="a" * 64, size=1))
+    db.session.commit()
+    db.session.expunge_all()
+
+    # content_hash was never loaded, yet the blob must lose its reference
+    media = Media.query.options(load_only(Media.id)).filter_by(id=1).one()
+    db.session.delete(media)
+    db.session.commit()
+    assert db.session.get(MediaBlob, "a" * 64).ref_count == 0
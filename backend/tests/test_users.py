@@ -0,0 +1,164 @@
+def test_leaderboard(client):
+    response = client.get("/api/v1/users/leaderboard?top=5")
+    assert response.status_code == 200
+    assert isinstance(response.get_json(), list)
+
+
+def test_leaderboard_etag_follows_ranking(client, app):
+    from app.extensions import db
+    from app.models import User
+    from app.utils.points import adjust_points
+
+    db.session.add(User(id=1, name="A", email="a@example.com", phone="0700000001", password_hash="x", points=5))
+    db.session.add(User(id=2, name="B", email="b@example.com", phone="0700000002", password_hash="x", points=3))
+    db.session.commit()
+    first = client.get("/api/v1/users/leaderboard?top=5")
+    etag = first.headers["ETag"]
+    assert client.get("/api/v1/users/leaderboard?top=5", headers={"If-None-Match": etag}).status_code == 304
+
+    adjust_points(2, 10, "test")
+    db.session.commit()
+    response = client.get("/api/v1/users/leaderboard?top=5", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [e["id"] for e in response.get_json()] == [2, 1]
+    assert response.headers["ETag"] != etag
+
+
+def test_leaderboard_rank_requires_auth(client):
+    response = client.get("/api/v1/users/leaderboard/rank")
+    assert response.status_code == 401
+
+
+def test_subscriptions_require_auth(client):
+    response = client.post("/api/v1/users/subscriptions", json={"latitude": -1.28, "longitude": 36.82, "radius_m": 1000})
+    assert response.status_code == 401
+
+
+def test_point_in_polygon():
+    from app.utils.geo import point_in_polygon
+
+    square = [[0, 0], [0, 1], [1, 1], [1, 0]]
+    assert point_in_polygon(0.5, 0.5, square)
+    assert not point_in_polygon(1.5, 0.5, square)
+
+
+def test_failing_alert_goes_dead(app):
+    from app.extensions import db
+    from app.models import AreaSubscription, Incident, IncidentAlert, User
+    from app.utils.notifications import deliver_alerts, index_subscription
+
+    class BrokenSms:
+        def send_batch(self, phones, text):
+            raise RuntimeError("gateway down")
+
+    app.config["NOTIFY_MAX_ATTEMPTS"] = 2
+    app.config["NOTIFY_LEASE_SECONDS"] = 0
+    app.extensions["sms_backend"] = BrokenSms()
+    db.session.add(User(id=1, name="Rep", email="rep@example.com", phone="0700000001", password_hash="x"))
+    db.session.add(User(id=2, name="Sub", email="sub@example.com", phone="0700000002", password_hash="x"))
+    sub = AreaSubscription(user_id=2, channel="sms", latitude=-1.28, longitude=36.82, radius_m=1000)
+    index_subscription(sub)
+    db.session.add(sub)
+    db.session.add(Incident(id=1, title="Crash", description="d", latitude=-1.28, longitude=36.82, created_by=1))
+    db.session.commit()
+
+    assert deliver_alerts() and deliver_alerts()
+    alert = db.session.get(IncidentAlert, 1)
+    assert (alert.status, alert.attempts, alert.last_error) == ("dead", 2, "gateway down")
+    assert not deliver_alerts()
+
+
+def test_reconcile_ledger_fixes_opening_balance(app):
+    from app.extensions import db
+    from app.models import PointsLedgerEntry, User
+    from app.utils.points import adjust_points, reconcile_ledger
+
+    db.session.add(User(id=1, name="A", email="a@example.com", phone="0700000001", password_hash="x", points=10))
+    db.session.add(User(id=2, name="B", email="b@example.com", phone="0700000002", password_hash="x"))
+    db.session.commit()
+    adjust_points(2, 5, "report")
+    db.session.commit()
+
+    assert reconcile_ledger(db.session) == [(1, 10, 0)]
+    assert reconcile_ledger(db.session, fix=True) == [(1, 10, 0)]
+    assert PointsLedgerEntry.query.filter_by(user_id=1, reason="adjustment").one().delta == 10
+    assert reconcile_ledger(db.session) == []
+
+
+def test_points_ranking_compresses_values():
+    from app.utils.leaderboard import PointsRanking
+
+    ranking = PointsRanking()
+    for user_id, points in ((1, 10), (2, 10 ** 9), (3, 10), (4, 0)):
+        ranking.set(user_id, points)
+    assert len(ranking._tree) < 20      # slots per distinct value, not per point
+    assert ranking.range(1, 4) == [(1, 2, 10 ** 9), (2, 1, 10), (3, 3, 10), (4, 4, 0)]
+    assert ranking.rank(3) == 2
+
+    ranking.remove(2)
+    ranking.set(1, 5)
+    assert ranking.range(1, 3) == [(1, 3, 10), (2, 1, 5), (3, 4, 0)]
+    assert ranking.rank(2) is None
+
+
+def test_leaderboard_drops_deleted_users(client, app):
+    from app.extensions import db
+    from app.models import User
+
+    db.session.add(User(id=1, name="A", email="a@example.com", phone="0700000001", password_hash="x", points=5))
+    db.session.add(User(id=2, name="B", email="b@example.com", phone="0700000002", password_hash="x", points=3))
+    db.session.commit()
+    assert len(client.get("/api/v1/users/leaderboard?top=5").get_json()) == 2
+
+    db.session.delete(db.session.get(User, 2))
+    db.session.commit()
+    assert [e["id"] for e in client.get("/api/v1/users/leaderboard?top=5").get_json()] == [1]
+
+
+def test_leaderboard_sees_other_workers_delete_and_create(app):
+    from app.extensions import db
+    from app.models import User
+    from app.utils.leaderboard import Leaderboard
+
+    other = Leaderboard(sync_seconds=0)   # another worker: learns only through the database
+    db.session.add(User(id=1, name="A", email="a@example.com", phone="0700000001", password_hash="x", points=5))
+    db.session.add(User(id=2, name="B", email="b@example.com", phone="0700000002", password_hash="x", points=3))
+    db.session.commit()
+    assert [e[1] for e in other.top(5)] == [1, 2]
+
+    # The user count stays the same, so only the tombstone reveals the delete
+    db.session.delete(db.session.get(User, 2))
+    db.session.add(User(id=3, name="C", email="c@example.com", phone="0700000003", password_hash="x", points=9))
+    db.session.commit()
+    assert [e[1] for e in other.top(5)] == [3, 1]
+
+
+def test_workers_only_run_once_started():
+    from app import create_app
+    from app.utils.workers import start_workers
+    from tests.conftest import TestConfig
+
+    class WorkerConfig(TestConfig):
+        QUEUE_WORKERS = True
+
+    app = create_app(WorkerConfig)
+    workers = app.extensions["workers"]
+    assert workers and all(w._thread is None for w in workers.values())
+    workers["mail"].wake()      # a commit in a CLI command
+    assert workers["mail"]._thread is None
+
+    start_workers(app)
+    assert all(w._thread.is_alive() for w in workers.values())
+
+
+def test_redeem_rejects_boolean_points(client, auth_headers):
+    from app.extensions import db
+    from app.models import User
+
+    headers = auth_headers()
+    db.session.get(User, 1).points = 10
+    db.session.commit()
+
+    response = client.post("/api/v1/users/redeem", headers=headers, json={"points": True, "reward": "mug"})
+    assert response.status_code == 400
+    assert db.session.get(User, 1).points == 10